@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AnalysisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "analysis"
+
+    def ready(self):
+        # Register the handlers that keep DailyRollup up to date.
+        from . import signals  # noqa: F401
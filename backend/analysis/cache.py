@@ -0,0 +1,129 @@
+#
+# File: analysis/cache.py
+#
+# Response cache for the analysis endpoints. Every key embeds a per-user
+# "data version" that is bumped whenever the user's logged data changes, so
+# stale entries are never read again and no TTL guessing is needed.
+#
+# Works with any Django cache backend. With the default local-memory cache
+# each worker process keeps its own entries and counters; configure a shared
+# backend (see CACHES in settings.py) when running several workers.
+#
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'analysis:data-version:{user_id}'
+STATS_KEY = 'analysis:cache-stats:{endpoint}:{outcome}'
+RESPONSE_KEY = 'analysis:{endpoint}:{user_id}:v{version}:{digest}'
+
+CACHED_ENDPOINTS = ('report', 'weekly-trends', 'export', 'daily-tip')
+
+
+def _initial_version():
+    # Seed with a timestamp rather than 1 so a version key that was evicted
+    # never comes back with a number older entries were stored under.
+    return time.time_ns() // 1000
+
+
+def get_data_version(user_id):
+    """Returns the user's current data version, creating it if needed."""
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id):
+    """Invalidates every cached analysis response of the user."""
+    key = VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def _record(endpoint, outcome):
+    key = STATS_KEY.format(endpoint=endpoint, outcome=outcome)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+
+def record_hit(endpoint):
+    _record(endpoint, 'hits')
+
+
+def record_miss(endpoint):
+    _record(endpoint, 'misses')
+
+
+async def _arecord(endpoint, outcome):
+    key = STATS_KEY.format(endpoint=endpoint, outcome=outcome)
+    if not await cache.aadd(key, 1, timeout=None):
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aadd(key, 1, timeout=None)
+
+
+async def arecord_hit(endpoint):
+    """Async version of record_hit()."""
+    await _arecord(endpoint, 'hits')
+
+
+async def arecord_miss(endpoint):
+    """Async version of record_miss()."""
+    await _arecord(endpoint, 'misses')
+
+
+def cache_stats():
+    """Hit and miss counters per endpoint."""
+    stats = {}
+    for endpoint in CACHED_ENDPOINTS:
+        hits = cache.get(STATS_KEY.format(endpoint=endpoint, outcome='hits'), 0)
+        misses = cache.get(STATS_KEY.format(endpoint=endpoint, outcome='misses'), 0)
+        total = hits + misses
+        stats[endpoint] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+    return stats
+
+
+def _digest(params):
+    """A stable hash of the resolved request parameters."""
+    encoded = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+    return hashlib.md5(encoded.encode()).hexdigest()
+
+
+def response_key(user_id, endpoint, params):
+    """The cache key of an endpoint's response for the user's current data version."""
+    return RESPONSE_KEY.format(
+        endpoint=endpoint, user_id=user_id, version=get_data_version(user_id), digest=_digest(params)
+    )
+
+
+def get_or_build(user_id, endpoint, params, build):
+    """
+    Returns the cached response payload for the endpoint and parameters,
+    calling `build()` and storing its result on a miss.
+    """
+    key = response_key(user_id, endpoint, params)
+    data = cache.get(key)
+    if data is not None:
+        record_hit(endpoint)
+        return data
+
+    record_miss(endpoint)
+    data = build()
+    cache.set(key, data, timeout=settings.ANALYSIS_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,229 @@
+#
+# File: analysis/engine.py
+#
+# A small columnar analytics core. Rollup rows are scattered into
+# preallocated NumPy arrays indexed by day offset, so summary statistics and
+# chart payloads are computed with whole-array operations instead of
+# building a pandas DataFrame on every request.
+#
+
+import calendar
+from datetime import timedelta
+
+import numpy as np
+
+from .models import DailyRollup
+from .rollups import ROLLUP_FIELDS, RUNNING_SUM_FIELDS
+
+# The per-day columns of the report, in the order the charts expect them.
+REPORT_COLUMNS = [
+    'weight_kg', 'daily_steps', 'water_intake_ml', 'sleep_hours',
+    'calories_from_steps', 'calories_from_workouts', 'calories_consumed',
+    'protein_g', 'carbs_g', 'fats_g', 'total_calories_burned', 'net_calories',
+]
+
+# Moving average windows in days, and the trend columns added to daily reports.
+TREND_WINDOWS = (7, 28)
+TREND_COLUMNS = [
+    f'{column}_ma{window}' for column in ('weight_kg', 'net_calories') for window in TREND_WINDOWS
+] + ['cum_net_calories']
+
+MONTH_ABBR = np.array(calendar.month_abbr[1:])
+DAY_ABBR = np.array(calendar.day_abbr[:])
+
+# 1970-01-01 (day 0 of datetime64[D]) was a Thursday.
+EPOCH_WEEKDAY = 3
+
+
+class DailySeries:
+    """
+    One float64 array per column, with one slot per calendar day between
+    start_date and end_date inclusive. Days without data hold 0.
+    """
+
+    def __init__(self, start_date, end_date, columns):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.dates = np.arange(
+            np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1, dtype='datetime64[D]'
+        )
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, start_date, end_date, rows, fields):
+        """
+        Builds a series from (date, value, value, ...) tuples such as those
+        returned by values_list('date', *fields).
+        """
+        num_days = (end_date - start_date).days + 1
+        data = np.zeros((len(fields), num_days))
+
+        if rows:
+            dates, *values = zip(*rows)
+            offsets = (np.array(dates, dtype='datetime64[D]') - np.datetime64(start_date, 'D')).astype(np.int64)
+            # Decimal and None values both convert cleanly; None becomes NaN.
+            data[:, offsets] = np.array(values, dtype=float)
+            np.nan_to_num(data, copy=False)
+
+        columns = dict(zip(fields, data))
+        if {'calories_from_steps', 'calories_from_workouts', 'calories_consumed'} <= columns.keys():
+            columns['total_calories_burned'] = columns['calories_from_steps'] + columns['calories_from_workouts']
+            columns['net_calories'] = columns['calories_consumed'] - columns['total_calories_burned']
+        return cls(start_date, end_date, columns)
+
+    @classmethod
+    def load(cls, user, start_date, end_date, fields=ROLLUP_FIELDS):
+        """Reads the user's DailyRollup rows for the range with a single query."""
+        rows = list(
+            DailyRollup.objects.filter(user=user, date__range=[start_date, end_date]).values_list('date', *fields)
+        )
+        return cls.from_rows(start_date, end_date, rows, fields)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def date_labels(self):
+        """Formats every day like strftime('%b %d'), e.g. 'Jan 05'."""
+        months = self.dates.astype('datetime64[M]')
+        month_index = months.astype(np.int64) % 12
+        day_of_month = (self.dates - months).astype(np.int64) + 1
+        return np.char.add(np.char.add(MONTH_ABBR[month_index], ' '), np.char.zfill(day_of_month.astype(str), 2))
+
+    def weekday_labels(self):
+        """Formats every day like strftime('%a'), e.g. 'Mon'."""
+        weekday = (self.dates.astype(np.int64) + EPOCH_WEEKDAY) % 7
+        return DAY_ABBR[weekday]
+
+    def summary(self):
+        """Summary statistics shown above the report charts."""
+        weights = self['weight_kg'][self['weight_kg'] > 0]
+        weight_change = round(float(weights[-1] - weights[0]), 2) if weights.size else 0
+
+        return {
+            'weight_change_kg': weight_change,
+            'avg_daily_calories_consumed': round(float(self['calories_consumed'].mean()), 0),
+            'avg_daily_calories_burned': round(float(self['total_calories_burned'].mean()), 0),
+            'total_workouts': int(self['workout_count'].sum()),
+        }
+
+    def chart_records(self, columns=REPORT_COLUMNS):
+        """Serializes the series as one dict per day, labelled with date_labels()."""
+        keys = ['date'] + list(columns)
+        values = [self.date_labels().tolist()] + [self[column].tolist() for column in columns]
+        return [dict(zip(keys, row)) for row in zip(*values)]
+
+    def weekly_trend_records(self):
+        """The step, water (in 250ml glasses) and sleep payload used by the dashboard."""
+        glasses = np.rint(self['water_intake_ml'] / 250).astype(np.int64)
+        values = zip(
+            self.weekday_labels().tolist(),
+            self['daily_steps'].tolist(),
+            glasses.tolist(),
+            self['sleep_hours'].tolist(),
+        )
+        return [
+            {'name': name, 'steps': steps, 'water': water, 'sleep': sleep}
+            for name, steps, water, sleep in values
+        ]
+
+    def to_dataframe(self, columns=REPORT_COLUMNS):
+        """Returns the series as a pandas DataFrame indexed by day."""
+        import pandas as pd
+
+        return pd.DataFrame({column: self[column] for column in columns}, index=pd.DatetimeIndex(self.dates))
+
+
+def weight_slope(sums):
+    """
+    Least-squares weight trend in kg per day from the differences of the
+    weight running sums over a period, or None with fewer than two weigh-ins.
+    """
+    n, sum_y, sum_x, sum_xy, sum_xx = (sums[f'cum_weight_{name}'] for name in ('count', 'sum', 'xsum', 'xysum', 'xxsum'))
+    denominator = n * sum_xx - sum_x * sum_x
+    if n < 2 or denominator <= 0:
+        return None
+    return float(n * sum_xy - sum_x * sum_y) / float(denominator)
+
+
+def period_sums(user, start_date, end_date):
+    """
+    The running sum differences between the end of end_date and the day
+    before start_date, read from two rows.
+    """
+    def sums_before(day):
+        row = DailyRollup.objects.filter(user=user, date__lt=day).order_by('-date').values(*RUNNING_SUM_FIELDS).first()
+        return row or dict.fromkeys(RUNNING_SUM_FIELDS, 0)
+
+    before, after = sums_before(start_date), sums_before(end_date + timedelta(days=1))
+    return {field: after[field] - before[field] for field in RUNNING_SUM_FIELDS}
+
+
+class RunningTotals:
+    """
+    The stored running sums of a user forward-filled to every day from
+    `lookback` days before start_date through end_date, so the moving
+    averages of any report day are differences of two array slots.
+    """
+
+    def __init__(self, start_date, end_date, lookback, sums):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.lookback = lookback
+        self.sums = sums
+        # The slot holding the sums at the end of each report day.
+        self.slots = np.arange((end_date - start_date).days + 1) + lookback + 1
+
+    @classmethod
+    def load(cls, user, start_date, end_date, lookback=max(TREND_WINDOWS)):
+        """Reads the running sums with two queries, however long the windows are."""
+        first_date = start_date - timedelta(days=lookback)
+        num_days = (end_date - first_date).days + 1
+
+        # Slot 0 holds the sums before first_date, slot k those at the end of day k - 1.
+        data = np.zeros((len(RUNNING_SUM_FIELDS), num_days + 1))
+        filled = np.zeros(num_days + 1, dtype=bool)
+        filled[0] = True
+
+        base = DailyRollup.objects.filter(
+            user=user, date__lt=first_date
+        ).order_by('-date').values_list(*RUNNING_SUM_FIELDS).first()
+        if base is not None:
+            data[:, 0] = np.array(base, dtype=float)
+
+        rows = list(
+            DailyRollup.objects.filter(user=user, date__range=[first_date, end_date]).values_list('date', *RUNNING_SUM_FIELDS)
+        )
+        if rows:
+            dates, *values = zip(*rows)
+            slots = (np.array(dates, dtype='datetime64[D]') - np.datetime64(first_date, 'D')).astype(np.int64) + 1
+            data[:, slots] = np.array(values, dtype=float)
+            filled[slots] = True
+
+        # Days without a row carry the sums of the latest day before them.
+        source = np.maximum.accumulate(np.where(filled, np.arange(num_days + 1), 0))
+        return cls(start_date, end_date, lookback, dict(zip(RUNNING_SUM_FIELDS, data[:, source])))
+
+    def window_sum(self, field, window):
+        """The sum of a column over the `window` days ending on each report day."""
+        return self.sums[field][self.slots] - self.sums[field][self.slots - window]
+
+    def moving_average(self, column, window):
+        if column == 'weight_kg':
+            # Averaged over the days with a weigh-in; 0 when the window has none.
+            counts = self.window_sum('cum_weight_count', window)
+            totals = self.window_sum('cum_weight_sum', window)
+            return np.divide(totals, counts, out=np.zeros_like(totals), where=counts > 0)
+        return self.window_sum('cum_net_calories', window) / window
+
+    def trend_columns(self):
+        """The TREND_COLUMNS of every report day, rounded for the chart payload."""
+        columns = {
+            f'{column}_ma{window}': self.moving_average(column, window)
+            for column in ('weight_kg', 'net_calories') for window in TREND_WINDOWS
+        }
+        net = self.sums['cum_net_calories']
+        columns['cum_net_calories'] = net[self.slots] - net[self.lookback]
+        return {name: np.round(values, 2) for name, values in columns.items()}
@@ -0,0 +1,176 @@
+#
+# File: analysis/exports.py
+#
+# Streams the per-day analysis dataset straight from DailyRollup, one chunk
+# of rows at a time, so exports use flat memory whatever the date range.
+#
+
+import csv
+from datetime import date
+
+from .models import DailyRollup
+
+# Column order of the exported files.
+EXPORT_COLUMNS = [
+    'weight_kg', 'daily_steps', 'water_intake_ml', 'sleep_hours',
+    'calories_consumed', 'protein_g', 'carbs_g', 'fats_g',
+    'calories_from_workouts', 'calories_from_steps',
+    'total_calories_burned', 'net_calories',
+]
+
+# The stored columns the derived ones are computed from.
+SOURCE_COLUMNS = EXPORT_COLUMNS[:-2]
+
+EXPORT_CHUNK_SIZE = 2000
+
+# The longest range one export may cover, in days (about ten years).
+MAX_EXPORT_DAYS = 3653
+
+EMPTY_DAY = dict.fromkeys(SOURCE_COLUMNS)
+
+
+def _export_values(values):
+    """Converts one day's stored values to floats and adds the derived columns."""
+    row = {column: float(values[column] or 0) for column in SOURCE_COLUMNS}
+    row['total_calories_burned'] = row['calories_from_steps'] + row['calories_from_workouts']
+    row['net_calories'] = row['calories_consumed'] - row['total_calories_burned']
+    return [row[column] for column in EXPORT_COLUMNS]
+
+
+def iter_daily_rows(user, start_date, end_date, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields (date, [values in EXPORT_COLUMNS order]) for every calendar day in
+    the range, reading rollups with a server-side cursor where supported.
+    Days with nothing logged are filled with zeros.
+    """
+    rollups = DailyRollup.objects.filter(
+        user=user, date__range=[start_date, end_date]
+    ).order_by('date').values('date', *SOURCE_COLUMNS).iterator(chunk_size=chunk_size)
+    by_date = ((values['date'], values) for values in rollups)
+
+    # Walked by ordinal, so a range ending on date.max does not overflow.
+    logged_day, values = next(by_date, (None, None))
+    for ordinal in range(start_date.toordinal(), end_date.toordinal() + 1):
+        day = date.fromordinal(ordinal)
+        if day == logged_day:
+            yield day, _export_values(values)
+            logged_day, values = next(by_date, (None, None))
+        else:
+            yield day, _export_values(EMPTY_DAY)
+
+
+class Echo:
+    """A file-like object whose write() simply returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def write_csv(rows, lines_per_chunk=500):
+    """Yields (date, values) rows as CSV text in blocks of `lines_per_chunk` days."""
+    writer = csv.writer(Echo(), lineterminator='\n')
+    lines = [writer.writerow(['date'] + EXPORT_COLUMNS)]
+    for day, values in rows:
+        lines.append(writer.writerow([day.isoformat()] + values))
+        if len(lines) >= lines_per_chunk:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+class ChunkSink:
+    """
+    A write-only binary file that hands back whatever was written since the
+    last drain(), letting Arrow and Parquet writers feed a streaming response.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([('date', pa.date32())] + [(column, pa.float64()) for column in EXPORT_COLUMNS])
+
+
+def iter_record_batches(rows, batch_size=EXPORT_CHUNK_SIZE):
+    """Groups (date, values) rows into Arrow record batches of `batch_size` days."""
+    import pyarrow as pa
+
+    schema = arrow_schema()
+
+    def to_batch(days, values):
+        arrays = [pa.array(days, pa.date32())]
+        arrays += [pa.array(column, pa.float64()) for column in zip(*values)]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    days, values = [], []
+    for day, row in rows:
+        days.append(day)
+        values.append(row)
+        if len(days) >= batch_size:
+            yield to_batch(days, values)
+            days, values = [], []
+    if days:
+        yield to_batch(days, values)
+
+
+def write_arrow(rows, batch_size=EXPORT_CHUNK_SIZE):
+    """Yields (date, values) rows as an Arrow IPC stream, one record batch at a time."""
+    import pyarrow as pa
+
+    sink = ChunkSink()
+    with pa.ipc.new_stream(sink, arrow_schema()) as writer:
+        for batch in iter_record_batches(rows, batch_size):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def write_parquet(rows, batch_size=EXPORT_CHUNK_SIZE):
+    """Yields (date, values) rows as a Parquet file with one row group per record batch."""
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, arrow_schema(), compression='snappy') as writer:
+        for batch in iter_record_batches(rows, batch_size):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+# Writer, content type and file extension for each export format.
+EXPORT_FORMATS = {
+    'csv': (write_csv, 'text/csv', 'csv'),
+    'arrow': (write_arrow, 'application/vnd.apache.arrow.stream', 'arrow'),
+    'parquet': (write_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def stream_export(user, start_date, end_date, export_format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the user's per-day dataset for the range in the requested format."""
+    writer = EXPORT_FORMATS[export_format][0]
+    return writer(iter_daily_rows(user, start_date, end_date, chunk_size))
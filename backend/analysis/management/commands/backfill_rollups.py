@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from analysis.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the DailyRollup table from the raw meal, workout and daily data logs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', default=[],
+                            help="Only backfill this username (may be repeated).")
+        parser.add_argument('--start', help="First date to rebuild (YYYY-MM-DD). Defaults to the full history.")
+        parser.add_argument('--end', help="Last date to rebuild (YYYY-MM-DD). Defaults to the full history.")
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else None
+            end_date = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError("Invalid date format. Use YYYY-MM-DD.")
+
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        total_rows = 0
+        for user_id, username in users.values_list('id', 'username').iterator():
+            written = rebuild_rollups(user_id, start_date, end_date)
+            total_rows += written
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{username}: {written} rollup rows")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total_rows} rollup rows."))
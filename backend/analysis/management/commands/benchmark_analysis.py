@@ -0,0 +1,107 @@
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from analysis.engine import DailySeries
+from analysis.rollups import ROLLUP_FIELDS
+
+
+def _synthetic_days(num_days, seed=0):
+    """Generates one fully logged day per date, shaped like the ORM results."""
+    rng = random.Random(seed)
+    end_date = date(2025, 12, 31)
+    start_date = end_date - timedelta(days=num_days - 1)
+    days = []
+    for offset in range(num_days):
+        days.append(SimpleNamespace(
+            date=start_date + timedelta(days=offset),
+            weight_kg=Decimal(f"{rng.uniform(60, 90):.2f}"),
+            step_count=rng.randint(2000, 15000),
+            steps_calories=Decimal(f"{rng.uniform(80, 600):.2f}"),
+            milliliters=rng.randint(500, 3500),
+            duration_hours=Decimal(f"{rng.uniform(5, 9):.2f}"),
+            workout_calories=Decimal(f"{rng.uniform(0, 700):.2f}"),
+            calories=Decimal(f"{rng.uniform(1500, 3000):.2f}"),
+            protein=Decimal(f"{rng.uniform(50, 180):.2f}"),
+            carbs=Decimal(f"{rng.uniform(100, 350):.2f}"),
+            fats=Decimal(f"{rng.uniform(30, 120):.2f}"),
+        ))
+    return start_date, end_date, days
+
+
+def pandas_report(start_date, end_date, days):
+    """The per-request DataFrame assembly the report views used before the NumPy engine."""
+    import pandas as pd
+
+    df = pd.DataFrame(index=pd.date_range(start=start_date, end=end_date, freq='D'))
+    df['weight_kg'] = pd.Series({pd.to_datetime(d.date): float(d.weight_kg) for d in days})
+    df['daily_steps'] = pd.Series({pd.to_datetime(d.date): d.step_count for d in days})
+    df['water_intake_ml'] = pd.Series({pd.to_datetime(d.date): d.milliliters for d in days})
+    df['sleep_hours'] = pd.Series({pd.to_datetime(d.date): float(d.duration_hours) for d in days})
+    df['calories_from_steps'] = pd.Series({pd.to_datetime(d.date): float(d.steps_calories) for d in days})
+    df['calories_from_workouts'] = pd.Series({pd.to_datetime(d.date): float(d.workout_calories) for d in days})
+    df['calories_consumed'] = pd.Series({pd.to_datetime(d.date): float(d.calories) for d in days})
+    df['protein_g'] = pd.Series({pd.to_datetime(d.date): float(d.protein) for d in days})
+    df['carbs_g'] = pd.Series({pd.to_datetime(d.date): float(d.carbs) for d in days})
+    df['fats_g'] = pd.Series({pd.to_datetime(d.date): float(d.fats) for d in days})
+    df.fillna(0, inplace=True)
+    df['total_calories_burned'] = df['calories_from_steps'] + df['calories_from_workouts']
+    df['net_calories'] = df['calories_consumed'] - df['total_calories_burned']
+
+    weights = df['weight_kg'].loc[df['weight_kg'] > 0]
+    summary = {
+        'weight_change_kg': round(weights.iloc[-1] - weights.iloc[0], 2) if not weights.empty else 0,
+        'avg_daily_calories_consumed': round(df['calories_consumed'].mean(), 0),
+        'avg_daily_calories_burned': round(df['total_calories_burned'].mean(), 0),
+    }
+    df.index.name = 'date'
+    chart_data = df.reset_index().to_dict(orient='records')
+    for item in chart_data:
+        item['date'] = item['date'].strftime('%b %d')
+    return summary, chart_data
+
+
+def numpy_report(start_date, end_date, days):
+    """The same report built by analysis.engine.DailySeries from rollup tuples."""
+    rows = [
+        (d.date, d.weight_kg, d.step_count, d.milliliters, d.duration_hours, d.steps_calories,
+         d.workout_calories, d.calories, d.protein, d.carbs, d.fats, 1)
+        for d in days
+    ]
+    series = DailySeries.from_rows(start_date, end_date, rows, ROLLUP_FIELDS)
+    return series.summary(), series.chart_records()
+
+
+class Command(BaseCommand):
+    help = "Compares per-request CPU time and peak memory of the pandas and NumPy report paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ranges', default='7,31,365', help="Comma separated day counts to benchmark.")
+        parser.add_argument('--repeat', type=int, default=50, help="Requests simulated per range.")
+
+    def handle(self, *args, **options):
+        ranges = [int(value) for value in options['ranges'].split(',')]
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'days':>6} {'path':>7} {'cpu ms/req':>11} {'peak KiB':>10}")
+        for num_days in ranges:
+            start_date, end_date, days = _synthetic_days(num_days)
+            for name, build in (('pandas', pandas_report), ('numpy', numpy_report)):
+                build(start_date, end_date, days)  # warm up imports and caches
+
+                started = time.process_time()
+                for _ in range(repeat):
+                    build(start_date, end_date, days)
+                cpu_ms = (time.process_time() - started) * 1000 / repeat
+
+                tracemalloc.start()
+                build(start_date, end_date, days)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(f"{num_days:>6} {name:>7} {cpu_ms:>11.3f} {peak / 1024:>10.1f}")
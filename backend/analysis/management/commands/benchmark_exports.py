@@ -0,0 +1,67 @@
+import io
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from analysis.exports import EXPORT_COLUMNS, EXPORT_FORMATS
+
+
+def _synthetic_rows(num_days, seed=0):
+    """Generates (date, values) rows shaped like analysis.exports.iter_daily_rows()."""
+    rng = random.Random(seed)
+    start_date = date(2020, 1, 1)
+    return [
+        (start_date + timedelta(days=offset), [round(rng.uniform(0, 3000), 2) for _ in EXPORT_COLUMNS])
+        for offset in range(num_days)
+    ]
+
+
+def _read_csv(data):
+    import pandas as pd
+
+    return len(pd.read_csv(io.BytesIO(data), parse_dates=['date']))
+
+
+def _read_arrow(data):
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(data).read_all().num_rows
+
+
+def _read_parquet(data):
+    import pyarrow.parquet as pq
+
+    return pq.read_table(io.BytesIO(data)).num_rows
+
+
+READERS = {'csv': _read_csv, 'arrow': _read_arrow, 'parquet': _read_parquet}
+
+
+class Command(BaseCommand):
+    help = "Compares file size, write time and load time of the CSV, Arrow IPC and Parquet exports."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=3650, help="Days of data per simulated export.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs averaged per format.")
+
+    def handle(self, *args, **options):
+        rows = _synthetic_rows(options['days'])
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'format':>8} {'size KiB':>10} {'write ms':>10} {'load ms':>10}")
+        for name, (writer, _, _) in EXPORT_FORMATS.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                chunks = [chunk.encode() if isinstance(chunk, str) else chunk for chunk in writer(iter(rows))]
+            write_ms = (time.perf_counter() - started) * 1000 / repeat
+            data = b''.join(chunks)
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                loaded = READERS[name](data)
+            load_ms = (time.perf_counter() - started) * 1000 / repeat
+            assert loaded == len(rows)
+
+            self.stdout.write(f"{name:>8} {len(data) / 1024:>10.1f} {write_ms:>10.2f} {load_ms:>10.2f}")
@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from analysis.reports import month_range, store_reports
+
+
+def _init_worker():
+    """
+    Prepares a worker process. Each worker opens its own database
+    connection on first use; nothing is shared with the parent.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+    django.setup()
+    connections.close_all()
+
+
+def _generate_chunk(user_ids, year, month):
+    try:
+        return store_reports(user_ids, year, month)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Precomputes the monthly analysis report of every user (or a cohort) in parallel."
+
+    def add_arguments(self, parser):
+        today = date.today()
+        parser.add_argument('--year', type=int, default=today.year)
+        parser.add_argument('--month', type=int, default=today.month)
+        parser.add_argument('--user', action='append', dest='usernames', default=[],
+                            help="Only generate the report of this username (may be repeated).")
+        parser.add_argument('--active-only', action='store_true',
+                            help="Only include users who logged something during the month.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 1 generates everything in this process.")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Users per worker task.")
+
+    def handle(self, *args, **options):
+        year, month = options['year'], options['month']
+        if not 1 <= month <= 12:
+            raise CommandError("--month must be between 1 and 12.")
+
+        users = User.objects.filter(is_active=True)
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        if options['active_only']:
+            start_date, end_date = month_range(year, month)
+            users = users.filter(daily_rollups__date__range=[start_date, end_date]).distinct()
+        user_ids = list(users.order_by('id').values_list('id', flat=True))
+
+        chunk_size = options['chunk_size']
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+        total = 0
+        if options['workers'] <= 1:
+            for chunk in chunks:
+                total += store_reports(chunk, year, month)
+        else:
+            # Forked workers must not inherit this process's open connections.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+                futures = [executor.submit(_generate_chunk, chunk, year, month) for chunk in chunks]
+                for future in as_completed(futures):
+                    total += future.result()
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"{total}/{len(user_ids)} reports written")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated {total} reports for {year}-{month:02d}."))
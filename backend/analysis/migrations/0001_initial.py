@@ -0,0 +1,140 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:55
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_rollups(apps, schema_editor):
+    """
+    Builds the rollup rows of every user with logs, as backfill_rollups
+    does, so reports read the existing history from the first deploy on.
+    """
+    DailyRollup = apps.get_model("analysis", "DailyRollup")
+    WeightLog = apps.get_model("daily_data", "WeightLog")
+    DailySteps = apps.get_model("daily_data", "DailySteps")
+    WaterIntake = apps.get_model("daily_data", "WaterIntake")
+    Sleep = apps.get_model("daily_data", "Sleep")
+    Workout = apps.get_model("workouts", "Workout")
+    MealItem = apps.get_model("meals", "MealItem")
+
+    user_ids = set()
+    for model in (WeightLog, DailySteps, WaterIntake, Sleep, Workout):
+        user_ids.update(model.objects.values_list("user_id", flat=True).distinct())
+    user_ids.update(MealItem.objects.values_list("meal__user_id", flat=True).distinct())
+
+    for user_id in sorted(user_ids):
+        rows = defaultdict(dict)
+        for day, weight in WeightLog.objects.filter(user_id=user_id).values_list("date", "weight_kg"):
+            rows[day]["weight_kg"] = weight
+        for day, step_count, calories in DailySteps.objects.filter(user_id=user_id).values_list(
+            "date", "step_count", "calories_burned"
+        ):
+            rows[day].update(daily_steps=step_count, calories_from_steps=calories)
+        for day, milliliters in WaterIntake.objects.filter(user_id=user_id).values_list("date", "milliliters"):
+            rows[day]["water_intake_ml"] = milliliters
+        for day, hours in Sleep.objects.filter(user_id=user_id).values_list("date", "duration_hours"):
+            rows[day]["sleep_hours"] = hours
+        for day, calories in Workout.objects.filter(user_id=user_id).values_list("date", "calories_burned"):
+            row = rows[day]
+            row["calories_from_workouts"] = row.get("calories_from_workouts", Decimal("0.0")) + calories
+            row["workout_count"] = row.get("workout_count", 0) + 1
+
+        meals = defaultdict(lambda: dict.fromkeys(("calories_consumed", "protein_g", "carbs_g", "fats_g"), Decimal("0.0")))
+        for day, quantity_g, *values in MealItem.objects.filter(meal__user_id=user_id).values_list(
+            "meal__date", "quantity_g", "food_item__calories", "food_item__protein",
+            "food_item__carbs", "food_item__fats",
+        ):
+            for field, value in zip(meals[day], values):
+                meals[day][field] += value * quantity_g * Decimal("0.01")
+        for day, totals in meals.items():
+            rows[day].update({field: round(total, 2) for field, total in totals.items()})
+
+        DailyRollup.objects.bulk_create(
+            [DailyRollup(user_id=user_id, date=day, **values) for day, values in sorted(rows.items())],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("daily_data", "0002_usergoals_weightlog"),
+        ("meals", "0002_meal_total_calories_alter_fooditem_calories_and_more"),
+        ("workouts", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "weight_kg",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=5, null=True
+                    ),
+                ),
+                ("daily_steps", models.PositiveIntegerField(default=0)),
+                ("water_intake_ml", models.PositiveIntegerField(default=0)),
+                (
+                    "sleep_hours",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=4),
+                ),
+                (
+                    "calories_from_steps",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=8),
+                ),
+                (
+                    "calories_from_workouts",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=8),
+                ),
+                ("workout_count", models.PositiveIntegerField(default=0)),
+                (
+                    "calories_consumed",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                (
+                    "protein_g",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                (
+                    "carbs_g",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                (
+                    "fats_g",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "unique_together": {("user", "date")},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:05
+
+from datetime import date
+
+from django.db import migrations, models
+
+STATS_EPOCH = date(2000, 1, 1)
+
+
+def fill_running_sums(apps, schema_editor):
+    """Computes the running sums of the existing rollup rows, user by user."""
+    DailyRollup = apps.get_model("analysis", "DailyRollup")
+    fields = [
+        "cum_net_calories", "cum_weight_count", "cum_weight_sum",
+        "cum_weight_xsum", "cum_weight_xysum", "cum_weight_xxsum",
+    ]
+    user_ids = DailyRollup.objects.values_list("user_id", flat=True).distinct()
+    for user_id in list(user_ids):
+        totals = dict.fromkeys(fields, 0)
+        rollups = list(DailyRollup.objects.filter(user_id=user_id).order_by("date"))
+        for rollup in rollups:
+            totals["cum_net_calories"] += (
+                rollup.calories_consumed - rollup.calories_from_steps - rollup.calories_from_workouts
+            )
+            if rollup.weight_kg is not None:
+                x = (rollup.date - STATS_EPOCH).days
+                totals["cum_weight_count"] += 1
+                totals["cum_weight_sum"] += rollup.weight_kg
+                totals["cum_weight_xsum"] += x
+                totals["cum_weight_xysum"] += x * rollup.weight_kg
+                totals["cum_weight_xxsum"] += x * x
+            for field in fields:
+                setattr(rollup, field, totals[field])
+        DailyRollup.objects.bulk_update(rollups, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analysis", "0002_monthlyreport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailyrollup",
+            name="cum_net_calories",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name="dailyrollup",
+            name="cum_weight_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dailyrollup",
+            name="cum_weight_sum",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name="dailyrollup",
+            name="cum_weight_xsum",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dailyrollup",
+            name="cum_weight_xxsum",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dailyrollup",
+            name="cum_weight_xysum",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20),
+        ),
+        migrations.RunPython(fill_running_sums, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:20
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import migrations
+from django.utils import timezone
+
+STATS_EPOCH = date(2000, 1, 1)
+
+NUTRITION_FIELDS = {
+    "calories_consumed": "food_item__calories",
+    "protein_g": "food_item__protein",
+    "carbs_g": "food_item__carbs",
+    "fats_g": "food_item__fats",
+}
+RUNNING_SUM_FIELDS = [
+    "cum_net_calories", "cum_weight_count", "cum_weight_sum",
+    "cum_weight_xsum", "cum_weight_xysum", "cum_weight_xxsum",
+]
+
+
+def recompute_meal_rollups(apps, schema_editor):
+    """
+    Recomputes the meal columns of the existing rollup rows, which SQLite
+    summed with integer division before the rollup switched to
+    multiplying by 0.01, then the running sums of every user with a
+    changed row. Rows that change get a new updated_at, so stored monthly
+    reports covering them are regenerated.
+    """
+    DailyRollup = apps.get_model("analysis", "DailyRollup")
+    MealItem = apps.get_model("meals", "MealItem")
+
+    now = timezone.now()
+    user_ids = DailyRollup.objects.values_list("user_id", flat=True).distinct()
+    for user_id in list(user_ids):
+        days = defaultdict(lambda: dict.fromkeys(NUTRITION_FIELDS, Decimal("0.0")))
+        items = MealItem.objects.filter(meal__user_id=user_id).values_list(
+            "meal__date", "quantity_g", *NUTRITION_FIELDS.values()
+        )
+        for day, quantity_g, *values in items.iterator(chunk_size=2000):
+            for field, value in zip(NUTRITION_FIELDS, values):
+                days[day][field] += value * quantity_g * Decimal("0.01")
+
+        totals = dict.fromkeys(RUNNING_SUM_FIELDS, 0)
+        changed = []
+        for rollup in DailyRollup.objects.filter(user_id=user_id).order_by("date"):
+            fresh = {field: round(value, 2) for field, value in days[rollup.date].items()}
+            totals["cum_net_calories"] += (
+                fresh["calories_consumed"] - rollup.calories_from_steps - rollup.calories_from_workouts
+            )
+            if rollup.weight_kg is not None:
+                x = (rollup.date - STATS_EPOCH).days
+                totals["cum_weight_count"] += 1
+                totals["cum_weight_sum"] += rollup.weight_kg
+                totals["cum_weight_xsum"] += x
+                totals["cum_weight_xysum"] += x * rollup.weight_kg
+                totals["cum_weight_xxsum"] += x * x
+            fresh.update(totals)
+            if any(getattr(rollup, field) != value for field, value in fresh.items()):
+                for field, value in fresh.items():
+                    setattr(rollup, field, value)
+                rollup.updated_at = now
+                changed.append(rollup)
+        DailyRollup.objects.bulk_update(
+            changed, [*NUTRITION_FIELDS, *RUNNING_SUM_FIELDS, "updated_at"], batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analysis", "0003_dailyrollup_running_sums"),
+        # Merging duplicate foods repoints meal items, which changes the sums.
+        ("meals", "0007_meal_macro_totals"),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_meal_rollups, migrations.RunPython.noop),
+    ]
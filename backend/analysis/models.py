@@ -1,3 +1,67 @@
 from django.db import models
+from django.contrib.auth.models import User
 
-# Create your models here.
+
+class DailyRollup(models.Model):
+    """
+    One row per user per day holding every column the analysis report needs.
+    Kept current by the signal handlers in analysis/signals.py and rebuilt
+    in bulk by the `backfill_rollups` management command.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+
+    weight_kg = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    daily_steps = models.PositiveIntegerField(default=0)
+    water_intake_ml = models.PositiveIntegerField(default=0)
+    sleep_hours = models.DecimalField(max_digits=4, decimal_places=2, default=0)
+
+    calories_from_steps = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    calories_from_workouts = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    workout_count = models.PositiveIntegerField(default=0)
+
+    calories_consumed = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    protein_g = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    carbs_g = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    fats_g = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    # Running sums over this and every earlier day of the user, so any
+    # window statistic is the difference of two rows. Weight sums only cover
+    # days with a logged weight; x is the day number since
+    # rollups.STATS_EPOCH, for the weight trend regression.
+    cum_net_calories = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cum_weight_count = models.PositiveIntegerField(default=0)
+    cum_weight_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cum_weight_xsum = models.BigIntegerField(default=0)
+    cum_weight_xysum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    cum_weight_xxsum = models.BigIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # The unique constraint doubles as the (user, date) index used for range scans.
+        unique_together = ('user', 'date')
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.user.username}'s rollup for {self.date}"
+
+
+class MonthlyReport(models.Model):
+    """
+    A precomputed monthly analysis report, written by the `generate_reports`
+    management command so the report endpoint can serve it without
+    recomputing. A report is stale once any DailyRollup row of its month has
+    been updated after generated_at.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_reports')
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    data = models.JSONField()
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'year', 'month')
+
+    def __str__(self):
+        return f"{self.user.username}'s report for {self.year}-{self.month:02d}"
@@ -0,0 +1,215 @@
+#
+# File: analysis/reports.py
+#
+# Builds the analysis report payload and manages the precomputed monthly
+# reports written by the `generate_reports` management command.
+#
+# Short ranges are reported day by day. Longer ranges are downsampled to
+# weekly, monthly or yearly buckets aggregated in SQL, so the chart payload
+# never exceeds MAX_CHART_POINTS however long the range is.
+#
+
+from datetime import date, timedelta
+
+from django.db.models import Avg, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from .engine import (
+    REPORT_COLUMNS, TREND_COLUMNS, TREND_WINDOWS, DailySeries, RunningTotals, period_sums, weight_slope,
+)
+from .models import DailyRollup, MonthlyReport
+
+MAX_CHART_POINTS = 62
+
+# The longest range one report covers, in days (about ten years).
+MAX_REPORT_DAYS = 3653
+
+# Reports read the moving average window before the range and the running
+# sums of the day after it, which must both be valid dates.
+FIRST_REPORT_DATE = date.min + timedelta(days=max(TREND_WINDOWS))
+LAST_REPORT_DATE = date.max - timedelta(days=1)
+
+# Bucket sizes from finest to coarsest: (name, SQL truncation, rough days per bucket).
+GRANULARITIES = [
+    ('day', None, 1),
+    ('week', TruncWeek, 7),
+    ('month', TruncMonth, 31),
+    ('year', TruncYear, 366),
+]
+
+# Rollup columns summed per bucket; weight is averaged over the logged days instead.
+SUMMED_FIELDS = [
+    'daily_steps', 'water_intake_ml', 'sleep_hours', 'calories_from_steps',
+    'calories_from_workouts', 'calories_consumed', 'protein_g', 'carbs_g', 'fats_g',
+]
+
+
+def month_range(year, month):
+    """Returns the first and last day of a calendar month."""
+    start_date = date(year, month, 1)
+    end_date = (start_date + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    return start_date, end_date
+
+
+def quarter_range(year, quarter):
+    """Returns the first and last day of a calendar quarter (1-4)."""
+    start_date, _ = month_range(year, 3 * quarter - 2)
+    _, end_date = month_range(year, 3 * quarter)
+    return start_date, end_date
+
+
+def check_report_range(start_date, end_date):
+    """Raises ValueError for a range that build_report() cannot cover."""
+    if start_date > end_date:
+        raise ValueError("'start' must not be after 'end'.")
+    if (end_date - start_date).days >= MAX_REPORT_DAYS:
+        raise ValueError(f"A report covers at most {MAX_REPORT_DAYS} days.")
+    if start_date < FIRST_REPORT_DATE or end_date > LAST_REPORT_DATE:
+        raise ValueError(f"Reports cover dates from {FIRST_REPORT_DATE} to {LAST_REPORT_DATE}.")
+
+
+def choose_granularity(start_date, end_date):
+    """Picks the finest bucket size that keeps the chart within MAX_CHART_POINTS."""
+    num_days = (end_date - start_date).days + 1
+    for name, trunc, bucket_days in GRANULARITIES:
+        if num_days <= MAX_CHART_POINTS * bucket_days:
+            return name, trunc
+    return GRANULARITIES[-1][:2]
+
+
+def _bucket_label(granularity, bucket_start):
+    if granularity == 'year':
+        return bucket_start.strftime('%Y')
+    if granularity == 'month':
+        return bucket_start.strftime('%b %Y')
+    return bucket_start.strftime('%b %d')
+
+
+def _bucket_end(granularity, bucket_start):
+    if granularity == 'week':
+        return bucket_start + timedelta(days=6)
+    if granularity == 'month':
+        return month_range(bucket_start.year, bucket_start.month)[1]
+    return date(bucket_start.year, 12, 31)
+
+
+def build_bucketed_report(user, start_date, end_date, granularity, trunc):
+    """
+    Aggregates the rollup rows of the range into one point per bucket with a
+    single GROUP BY query. Every value is a per-day average over the days of
+    the bucket that fall inside the range, so buckets stay comparable with
+    daily points; weight is averaged over the days it was logged.
+    """
+    buckets = (
+        DailyRollup.objects.filter(user=user, date__range=[start_date, end_date])
+        .annotate(bucket=trunc('date'))
+        .values('bucket')
+        .annotate(
+            weight_kg=Avg('weight_kg'),
+            workout_count=Sum('workout_count'),
+            **{field: Sum(field) for field in SUMMED_FIELDS},
+        )
+        .order_by('bucket')
+    )
+
+    chart_data = []
+    totals = dict.fromkeys(SUMMED_FIELDS + ['workout_count'], 0.0)
+    for bucket in buckets:
+        first_day = max(bucket['bucket'], start_date)
+        last_day = min(_bucket_end(granularity, bucket['bucket']), end_date)
+        num_days = (last_day - first_day).days + 1
+
+        point = {'date': _bucket_label(granularity, first_day)}
+        point['weight_kg'] = round(float(bucket['weight_kg'] or 0), 2)
+        for field in SUMMED_FIELDS + ['workout_count']:
+            total = float(bucket[field] or 0)
+            totals[field] += total
+            point[field] = round(total / num_days, 2)
+        point['total_calories_burned'] = round(point['calories_from_steps'] + point['calories_from_workouts'], 2)
+        point['net_calories'] = round(point['calories_consumed'] - point['total_calories_burned'], 2)
+        chart_data.append({'date': point['date'], **{column: point[column] for column in REPORT_COLUMNS}})
+
+    weights = DailyRollup.objects.filter(
+        user=user, date__range=[start_date, end_date], weight_kg__isnull=False
+    ).order_by('date').values_list('weight_kg', flat=True)
+    first_weight, last_weight = weights.first(), weights.last()
+    weight_change = round(float(last_weight - first_weight), 2) if first_weight is not None else 0
+
+    num_days = (end_date - start_date).days + 1
+    slope = weight_slope(period_sums(user, start_date, end_date))
+    summary_stats = {
+        'weight_change_kg': weight_change,
+        'avg_daily_calories_consumed': round(totals['calories_consumed'] / num_days, 0),
+        'avg_daily_calories_burned': round(
+            (totals['calories_from_steps'] + totals['calories_from_workouts']) / num_days, 0
+        ),
+        'total_workouts': int(totals['workout_count']),
+        'weight_trend_kg_per_week': round(slope * 7, 2) if slope is not None else 0,
+    }
+    return {'summary_stats': summary_stats, 'chart_data': chart_data, 'granularity': granularity}
+
+
+def build_report(user, start_date, end_date):
+    """The summary stats and chart data served by the report endpoint."""
+    granularity, trunc = choose_granularity(start_date, end_date)
+    if trunc is not None:
+        return build_bucketed_report(user, start_date, end_date, granularity, trunc)
+
+    # Moving averages and the cumulative net calories come from the stored
+    # running sums, so their cost does not depend on the window length.
+    series = DailySeries.load(user, start_date, end_date)
+    trends = RunningTotals.load(user, start_date, end_date)
+    series.columns.update(trends.trend_columns())
+
+    summary_stats = series.summary()
+    slope = weight_slope(period_sums(user, start_date, end_date))
+    summary_stats['weight_trend_kg_per_week'] = round(slope * 7, 2) if slope is not None else 0
+    return {
+        'summary_stats': summary_stats,
+        'chart_data': series.chart_records(REPORT_COLUMNS + TREND_COLUMNS),
+        'granularity': granularity,
+    }
+
+
+def get_stored_report(user, year, month):
+    """
+    Returns the stored monthly report payload, or None when there is none or
+    any day of the month has changed since it was generated.
+    """
+    report = MonthlyReport.objects.filter(user=user, year=year, month=month).first()
+    if report is None:
+        return None
+
+    # Moving averages also look back over the days before the month.
+    start_date, end_date = month_range(year, month)
+    changed = DailyRollup.objects.filter(
+        user=user, date__range=[start_date - timedelta(days=max(TREND_WINDOWS)), end_date],
+        updated_at__gt=report.generated_at,
+    ).exists()
+    return None if changed else report.data
+
+
+def store_reports(user_ids, year, month):
+    """
+    Computes and upserts the monthly report of every given user.
+    Returns the number of reports written.
+    """
+    start_date, end_date = month_range(year, month)
+    reports = []
+    for user_id in user_ids:
+        # The timestamp is taken before reading, so a write that lands while
+        # the report is built still marks it as stale.
+        generated_at = timezone.now()
+        reports.append(MonthlyReport(
+            user_id=user_id, year=year, month=month, generated_at=generated_at,
+            data=build_report(user_id, start_date, end_date),
+        ))
+
+    MonthlyReport.objects.bulk_create(
+        reports,
+        update_conflicts=True,
+        unique_fields=['user', 'year', 'month'],
+        update_fields=['data', 'generated_at'],
+    )
+    return len(reports)
@@ -0,0 +1,229 @@
+#
+# File: analysis/rollups.py
+#
+# Builds the DailyRollup fact table from the raw logging tables.
+#
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Sum, Count, F, DecimalField
+
+from daily_data.models import WeightLog, DailySteps, WaterIntake, Sleep
+from meals.models import MealItem
+from workouts.models import Workout
+from .models import DailyRollup
+
+# The value columns of DailyRollup, in the order the report presents them.
+ROLLUP_FIELDS = [
+    'weight_kg', 'daily_steps', 'water_intake_ml', 'sleep_hours',
+    'calories_from_steps', 'calories_from_workouts', 'calories_consumed',
+    'protein_g', 'carbs_g', 'fats_g', 'workout_count',
+]
+
+# The running sum columns of DailyRollup, see running_sum_terms().
+RUNNING_SUM_FIELDS = [
+    'cum_net_calories', 'cum_weight_count', 'cum_weight_sum',
+    'cum_weight_xsum', 'cum_weight_xysum', 'cum_weight_xxsum',
+]
+
+# The rollup columns the running sums are derived from.
+TERM_SOURCE_FIELDS = ['weight_kg', 'calories_consumed', 'calories_from_steps', 'calories_from_workouts']
+
+# Day 0 of the x axis used by the weight trend regression.
+STATS_EPOCH = date(2000, 1, 1)
+
+BATCH_SIZE = 500
+
+
+def _date_filter(prefix, start_date, end_date):
+    """Builds the date range lookup; either bound may be None for open-ended ranges."""
+    lookups = {}
+    if start_date is not None:
+        lookups[f'{prefix}__gte'] = start_date
+    if end_date is not None:
+        lookups[f'{prefix}__lte'] = end_date
+    return lookups
+
+
+def compute_rollups(user_id, start_date=None, end_date=None):
+    """
+    Aggregates every source table for one user and returns a dictionary
+    mapping each date that has any data to a dict of DailyRollup field values.
+    """
+    date_range = _date_filter('date', start_date, end_date)
+    rows = defaultdict(dict)
+
+    for day, weight in WeightLog.objects.filter(user_id=user_id, **date_range).values_list('date', 'weight_kg'):
+        rows[day]['weight_kg'] = weight
+
+    for day, step_count, calories in DailySteps.objects.filter(user_id=user_id, **date_range).values_list(
+        'date', 'step_count', 'calories_burned'
+    ):
+        rows[day]['daily_steps'] = step_count
+        rows[day]['calories_from_steps'] = calories
+
+    for day, milliliters in WaterIntake.objects.filter(user_id=user_id, **date_range).values_list('date', 'milliliters'):
+        rows[day]['water_intake_ml'] = milliliters
+
+    for day, hours in Sleep.objects.filter(user_id=user_id, **date_range).values_list('date', 'duration_hours'):
+        rows[day]['sleep_hours'] = hours
+
+    workouts = Workout.objects.filter(user_id=user_id, **date_range).values('date').annotate(
+        total=Sum('calories_burned'), count=Count('id')
+    )
+    for w in workouts:
+        rows[w['date']]['calories_from_workouts'] = w['total'] or Decimal('0.0')
+        rows[w['date']]['workout_count'] = w['count']
+
+    # Multiplied by 0.01 rather than divided by 100, which SQLite does in
+    # integers when the stored values are whole numbers.
+    meals = MealItem.objects.filter(
+        meal__user_id=user_id, **_date_filter('meal__date', start_date, end_date)
+    ).values('meal__date').annotate(
+        daily_calories=Sum(F('food_item__calories') * F('quantity_g') * Decimal('0.01'), output_field=DecimalField()),
+        daily_protein=Sum(F('food_item__protein') * F('quantity_g') * Decimal('0.01'), output_field=DecimalField()),
+        daily_carbs=Sum(F('food_item__carbs') * F('quantity_g') * Decimal('0.01'), output_field=DecimalField()),
+        daily_fats=Sum(F('food_item__fats') * F('quantity_g') * Decimal('0.01'), output_field=DecimalField()),
+    )
+    for m in meals:
+        row = rows[m['meal__date']]
+        row['calories_consumed'] = round(m['daily_calories'] or Decimal('0.0'), 2)
+        row['protein_g'] = round(m['daily_protein'] or Decimal('0.0'), 2)
+        row['carbs_g'] = round(m['daily_carbs'] or Decimal('0.0'), 2)
+        row['fats_g'] = round(m['daily_fats'] or Decimal('0.0'), 2)
+
+    return rows
+
+
+def _build_rollup(user_id, day, values):
+    """Creates an unsaved DailyRollup with zero defaults for missing columns."""
+    rollup = DailyRollup(user_id=user_id, date=day)
+    for field, value in values.items():
+        setattr(rollup, field, value)
+    return rollup
+
+
+def running_sum_terms(day, weight_kg, calories_consumed, calories_from_steps, calories_from_workouts):
+    """The amounts a single day adds to each running sum column."""
+    terms = dict.fromkeys(RUNNING_SUM_FIELDS, 0)
+    terms['cum_net_calories'] = calories_consumed - calories_from_steps - calories_from_workouts
+    if weight_kg is not None:
+        x = (day - STATS_EPOCH).days
+        terms.update(
+            cum_weight_count=1, cum_weight_sum=weight_kg, cum_weight_xsum=x,
+            cum_weight_xysum=x * weight_kg, cum_weight_xxsum=x * x,
+        )
+    return terms
+
+
+def _rollup_terms(rollup):
+    return running_sum_terms(rollup.date, *(getattr(rollup, field) for field in TERM_SOURCE_FIELDS))
+
+
+def refresh_rollup(user_id, day):
+    """
+    Recomputes the rollup row for a single user and day. A day whose data was
+    all deleted keeps a zeroed row, so its updated_at still tells stored
+    monthly reports that the day changed.
+
+    The running sums are maintained incrementally: the change in the day's
+    own terms is added to this row and, with one UPDATE, to every later row.
+    Refreshes of one user are serialized by locking the user's row, so two
+    of them can neither both create the day's row nor apply their deltas
+    over each other's stale reads.
+    """
+    with transaction.atomic():
+        list(User.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+        values = compute_rollups(user_id, day, day).get(day)
+
+        rollup = DailyRollup.objects.filter(user_id=user_id, date=day).first()
+        if rollup is None:
+            if values is None:
+                return None
+            # A new row starts from the running sums of the previous day with data.
+            rollup = _build_rollup(user_id, day, {})
+            previous = DailyRollup.objects.filter(
+                user_id=user_id, date__lt=day
+            ).order_by('-date').values(*RUNNING_SUM_FIELDS).first()
+            for field, total in (previous or {}).items():
+                setattr(rollup, field, total)
+
+        old_terms = _rollup_terms(rollup)
+        fresh = _build_rollup(user_id, day, values or {})
+        for field in ROLLUP_FIELDS:
+            setattr(rollup, field, getattr(fresh, field))
+
+        deltas = {}
+        for field, term in _rollup_terms(rollup).items():
+            if term != old_terms[field]:
+                deltas[field] = term - old_terms[field]
+                setattr(rollup, field, getattr(rollup, field) + deltas[field])
+        rollup.save()
+
+        if deltas:
+            # update() skips auto_now, and the later rows did change.
+            DailyRollup.objects.filter(user_id=user_id, date__gt=day).update(
+                updated_at=timezone.now(), **{field: F(field) + delta for field, delta in deltas.items()}
+            )
+    return rollup
+
+
+def rebuild_running_sums(user_id, start_date=None):
+    """
+    Recomputes the running sums of every rollup row of a user from start_date
+    onwards, continuing from the last row before it. Returns the number of
+    rows written.
+    """
+    totals = dict.fromkeys(RUNNING_SUM_FIELDS, 0)
+    if start_date is not None:
+        previous = DailyRollup.objects.filter(
+            user_id=user_id, date__lt=start_date
+        ).order_by('-date').values(*RUNNING_SUM_FIELDS).first()
+        totals.update(previous or {})
+
+    rows = DailyRollup.objects.filter(
+        user_id=user_id, **_date_filter('date', start_date, None)
+    ).order_by('date').only('date', *TERM_SOURCE_FIELDS, *RUNNING_SUM_FIELDS)
+
+    rollups = []
+    for rollup in rows.iterator(chunk_size=BATCH_SIZE):
+        for field, term in _rollup_terms(rollup).items():
+            totals[field] += term
+            setattr(rollup, field, totals[field])
+        rollups.append(rollup)
+
+    DailyRollup.objects.bulk_update(rollups, RUNNING_SUM_FIELDS, batch_size=BATCH_SIZE)
+    return len(rollups)
+
+
+def rebuild_rollups(user_id, start_date=None, end_date=None):
+    """
+    Rebuilds every rollup row of a user within an optional date range using
+    batched upserts, then the running sums from the start of the range
+    onwards. Returns the number of rows written.
+    """
+    rows = compute_rollups(user_id, start_date, end_date)
+    rollups = [_build_rollup(user_id, day, values) for day, values in sorted(rows.items())]
+
+    # Like refresh_rollup(), days without data are zeroed rather than deleted.
+    empty_day = {field: getattr(_build_rollup(user_id, None, {}), field) for field in ROLLUP_FIELDS}
+
+    with transaction.atomic():
+        DailyRollup.objects.filter(
+            user_id=user_id, **_date_filter('date', start_date, end_date)
+        ).exclude(date__in=list(rows)).exclude(**empty_day).update(updated_at=timezone.now(), **empty_day)
+
+        DailyRollup.objects.bulk_create(
+            rollups,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=ROLLUP_FIELDS + ['updated_at'],
+        )
+        rebuild_running_sums(user_id, start_date)
+    return len(rollups)
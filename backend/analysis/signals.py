@@ -0,0 +1,81 @@
+#
+# File: analysis/signals.py
+#
+# Keeps DailyRollup in sync with the tables it summarizes. Every write to a
+# source row schedules a refresh of the affected (user, day) once the
+# surrounding transaction commits, and bumps the user's analysis cache version.
+#
+
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from api.transactions import on_commit_once
+from daily_data.models import WeightLog, DailySteps, WaterIntake, Sleep
+from meals.models import Meal, MealItem, meal_items_changed
+from workouts.models import Workout
+from .cache import bump_data_version
+from .rollups import refresh_rollup
+
+# Models that carry their own `user` and `date` columns.
+DATED_MODELS = (WeightLog, DailySteps, WaterIntake, Sleep, Workout, Meal)
+
+
+def _rollup_key(instance):
+    """Returns the (user_id, date) a dated row contributes to."""
+    day = instance._meta.get_field('date').to_python(instance.date)
+    return instance.user_id, day
+
+
+def schedule_rollup_refresh(user_id, day):
+    """
+    Refreshes the rollup row for a user and day after the current transaction
+    commits, then invalidates the user's cached analysis responses.
+    """
+    if user_id is None or day is None:
+        return
+
+    def refresh():
+        refresh_rollup(user_id, day)
+        # Bump only once the rollup is current, so a response cached under
+        # the new version can never be built from stale rows.
+        bump_data_version(user_id)
+
+    on_commit_once(('rollup', user_id, day), refresh)
+
+
+def remember_rollup_key(sender, instance, **kwargs):
+    # Remember where the row was loaded from so a moved date refreshes both days.
+    if instance.pk is not None and {'user_id', 'date'} <= instance.__dict__.keys():
+        instance._rollup_key = _rollup_key(instance)
+
+
+def dated_row_saved(sender, instance, **kwargs):
+    key = _rollup_key(instance)
+    schedule_rollup_refresh(*key)
+
+    previous = getattr(instance, '_rollup_key', None)
+    if previous is not None and previous != key:
+        schedule_rollup_refresh(*previous)
+    instance._rollup_key = key
+
+
+def dated_row_deleted(sender, instance, **kwargs):
+    schedule_rollup_refresh(*getattr(instance, '_rollup_key', _rollup_key(instance)))
+
+
+for model in DATED_MODELS:
+    post_init.connect(remember_rollup_key, sender=model, dispatch_uid=f'rollup_init_{model.__name__}')
+    post_save.connect(dated_row_saved, sender=model, dispatch_uid=f'rollup_save_{model.__name__}')
+    post_delete.connect(dated_row_deleted, sender=model, dispatch_uid=f'rollup_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=MealItem)
+@receiver(post_delete, sender=MealItem)
+def meal_item_changed(sender, instance, **kwargs):
+    meal = instance.meal
+    schedule_rollup_refresh(meal.user_id, meal.date)
+
+
+@receiver(meal_items_changed)
+def meal_items_written(sender, meal, **kwargs):
+    schedule_rollup_refresh(*_rollup_key(meal))
@@ -1,3 +1,949 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import warnings
+from concurrent.futures import Future
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as global_apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F, Sum
+from django.test import AsyncRequestFactory, TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from daily_data.models import DailySteps, Sleep, WaterIntake, WeightLog
+from meals.models import FoodItem, Meal, MealItem
+from users.models import Profile
+from workouts.models import Workout
+from . import cache as analysis_cache
+from . import tips
+from .engine import REPORT_COLUMNS, TREND_COLUMNS, TREND_WINDOWS
+from .exports import EXPORT_COLUMNS, MAX_EXPORT_DAYS, arrow_schema
+from .models import DailyRollup, MonthlyReport
+from .reports import build_report, choose_granularity, get_stored_report
+from .views import AsyncDailyTipView, etag_matches
+from .rollups import ROLLUP_FIELDS, RUNNING_SUM_FIELDS, compute_rollups, rebuild_rollups, refresh_rollup
+
+DAY = date(2025, 3, 10)
+
+
+class RollupSignalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup')
+        # Whole-number calories with fractional macros: the values SQLite
+        # used to divide in integers.
+        self.oats = FoodItem.objects.create(name='Oats', calories=381, protein=Decimal('12.5'), carbs=67, fats=7)
+        self.milk = FoodItem.objects.create(name='Milk', calories=64, protein=Decimal('3.3'), carbs=5, fats=Decimal('3.6'))
+
+    def commit(self):
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def rollup(self, day=DAY):
+        return DailyRollup.objects.filter(user=self.user, date=day).first()
+
+    def assertRollup(self, day=DAY, **expected):
+        rollup = self.rollup(day)
+        self.assertIsNotNone(rollup)
+        self.assertEqual({field: getattr(rollup, field) for field in expected}, expected)
+        # The incrementally refreshed row matches a fresh aggregation.
+        fresh = compute_rollups(self.user.pk, day, day).get(day, {})
+        for field in ROLLUP_FIELDS:
+            if field in fresh:
+                self.assertEqual(getattr(rollup, field), fresh[field], field)
+
+    def test_meal_items_create_update_and_delete(self):
+        with self.commit():
+            meal = Meal.objects.create(user=self.user, meal_type='breakfast', date=DAY)
+            oats = MealItem.objects.create(meal=meal, food_item=self.oats, quantity_g=Decimal('50'))
+            MealItem.objects.create(meal=meal, food_item=self.milk, quantity_g=Decimal('125'))
+        self.assertRollup(
+            calories_consumed=Decimal('270.50'), protein_g=Decimal('10.38'),
+            carbs_g=Decimal('39.75'), fats_g=Decimal('8.00'),
+        )
+
+        with self.commit():
+            oats.quantity_g = Decimal('75')
+            oats.save()
+        self.assertRollup(calories_consumed=Decimal('365.75'), protein_g=Decimal('13.50'))
+
+        with self.commit():
+            oats.delete()
+        self.assertRollup(calories_consumed=Decimal('80.00'), fats_g=Decimal('4.50'))
+
+        # Deleting the meal keeps a zeroed row for the day.
+        with self.commit():
+            meal.delete()
+        self.assertRollup(calories_consumed=Decimal('0.00'), protein_g=Decimal('0.00'))
+
+    def test_moving_a_meal_refreshes_both_days(self):
+        with self.commit():
+            meal = Meal.objects.create(user=self.user, meal_type='lunch', date=DAY)
+            MealItem.objects.create(meal=meal, food_item=self.oats, quantity_g=Decimal('100'))
+        with self.commit():
+            meal.date = DAY + timedelta(days=1)
+            meal.save()
+        self.assertRollup(calories_consumed=Decimal('0.00'))
+        self.assertRollup(DAY + timedelta(days=1), calories_consumed=Decimal('381.00'))
+
+    def test_workouts_are_summed_per_day(self):
+        with self.commit():
+            run = Workout.objects.create(user=self.user, date=DAY, description='run', calories_burned=Decimal('300.5'))
+            Workout.objects.create(user=self.user, date=DAY, description='swim', calories_burned=Decimal('200'))
+        self.assertRollup(calories_from_workouts=Decimal('500.50'), workout_count=2)
+
+        with self.commit():
+            run.calories_burned = Decimal('350')
+            run.save()
+        self.assertRollup(calories_from_workouts=Decimal('550.00'), workout_count=2)
+
+        with self.commit():
+            run.date = DAY - timedelta(days=1)
+            run.save()
+        self.assertRollup(calories_from_workouts=Decimal('200.00'), workout_count=1)
+        self.assertRollup(DAY - timedelta(days=1), calories_from_workouts=Decimal('350.00'), workout_count=1)
+
+        with self.commit():
+            run.delete()
+        self.assertRollup(DAY - timedelta(days=1), calories_from_workouts=Decimal('0.00'), workout_count=0)
+
+    def test_weight_logs(self):
+        with self.commit():
+            log = WeightLog.objects.create(user=self.user, date=DAY, weight_kg=Decimal('71.40'))
+        self.assertRollup(weight_kg=Decimal('71.40'), cum_weight_count=1, cum_weight_sum=Decimal('71.40'))
+
+        with self.commit():
+            log.weight_kg = Decimal('70.90')
+            log.save()
+        self.assertRollup(weight_kg=Decimal('70.90'), cum_weight_count=1, cum_weight_sum=Decimal('70.90'))
+
+        with self.commit():
+            log.delete()
+        self.assertRollup(weight_kg=None, cum_weight_count=0, cum_weight_sum=Decimal('0.00'))
+
+    def test_one_refresh_per_user_and_day_per_transaction(self):
+        with mock.patch('analysis.signals.refresh_rollup', wraps=refresh_rollup) as refresh, self.commit():
+            meal = Meal.objects.create(user=self.user, meal_type='dinner', date=DAY)
+            for _ in range(5):
+                MealItem.objects.create(meal=meal, food_item=self.milk, quantity_g=Decimal('10'))
+            Workout.objects.create(user=self.user, date=DAY, description='walk', calories_burned=Decimal('80'))
+            WeightLog.objects.create(user=self.user, date=DAY + timedelta(days=1), weight_kg=Decimal('70'))
+        self.assertEqual(sorted(call.args for call in refresh.call_args_list),
+                         [(self.user.pk, DAY), (self.user.pk, DAY + timedelta(days=1))])
+        self.assertRollup(calories_consumed=Decimal('32.00'), calories_from_workouts=Decimal('80.00'))
+
+    def test_migration_fills_rollups_from_existing_logs(self):
+        other = User.objects.create_user(username='other')
+        # Logged before the rollup table existed: no refresh runs.
+        meal = Meal.objects.create(user=self.user, meal_type='breakfast', date=DAY)
+        MealItem.objects.create(meal=meal, food_item=self.oats, quantity_g=Decimal('50'))
+        MealItem.objects.create(meal=meal, food_item=self.milk, quantity_g=Decimal('125'))
+        Workout.objects.create(user=self.user, date=DAY, description='run', calories_burned=Decimal('300.5'))
+        Workout.objects.create(user=self.user, date=DAY, description='swim', calories_burned=Decimal('200'))
+        WeightLog.objects.create(user=self.user, date=DAY + timedelta(days=2), weight_kg=Decimal('71.40'))
+        WaterIntake.objects.create(user=other, date=DAY, milliliters=1500)
+        Sleep.objects.create(user=other, date=DAY, duration_hours=Decimal('7.5'))
+        self.assertFalse(DailyRollup.objects.exists())
+
+        migration = import_module('analysis.migrations.0001_initial')
+        migration.fill_rollups(global_apps, None)
+
+        for user, days in [(self.user, [DAY, DAY + timedelta(days=2)]), (other, [DAY])]:
+            rows = DailyRollup.objects.filter(user=user).order_by('date')
+            self.assertEqual([rollup.date for rollup in rows], days)
+            fresh = compute_rollups(user.pk)
+            for rollup in rows:
+                expected = {field: getattr(DailyRollup(**fresh[rollup.date]), field) for field in ROLLUP_FIELDS}
+                self.assertEqual({field: getattr(rollup, field) for field in ROLLUP_FIELDS}, expected)
+        self.assertRollup(calories_consumed=Decimal('270.50'), workout_count=2)
+
+
+class RunningSumTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sums')
+        self.food = FoodItem.objects.create(name='Rice', calories=130, protein=Decimal('2.7'), carbs=28, fats=0)
+
+    def log_day(self, day, weight=None, grams=None, burned=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            if weight is not None:
+                WeightLog.objects.update_or_create(user=self.user, date=day, defaults={'weight_kg': weight})
+            if grams is not None:
+                meal, _ = Meal.objects.get_or_create(user=self.user, meal_type='lunch', date=day)
+                MealItem.objects.create(meal=meal, food_item=self.food, quantity_g=Decimal(grams))
+            if burned is not None:
+                Workout.objects.create(user=self.user, date=day, description='bike', calories_burned=Decimal(burned))
+
+    def sums(self):
+        return list(DailyRollup.objects.filter(user=self.user).order_by('date').values_list('date', *RUNNING_SUM_FIELDS))
+
+    def assertSumsMatchRebuild(self):
+        incremental = self.sums()
+        rebuild_rollups(self.user.pk)
+        self.assertEqual(incremental, self.sums())
+
+    def test_days_logged_out_of_order(self):
+        for offset, weight, grams, burned in [
+            (5, '70.5', '200', None), (1, '71.2', None, '300'), (9, None, '150', '120.5'), (3, '70.9', '80', None),
+        ]:
+            self.log_day(DAY + timedelta(days=offset), weight, grams, burned)
+        self.assertSumsMatchRebuild()
+
+        last = DailyRollup.objects.filter(user=self.user).order_by('date').last()
+        self.assertEqual(last.cum_weight_count, 3)
+        self.assertEqual(last.cum_net_calories, Decimal('260.00') + Decimal('104.00') + Decimal('195.00')
+                         - Decimal('300.00') - Decimal('120.50'))
+
+    def test_editing_a_past_day_updates_later_rows(self):
+        for offset in range(4):
+            self.log_day(DAY + timedelta(days=offset), weight='70', grams='100')
+        later = DailyRollup.objects.get(user=self.user, date=DAY + timedelta(days=3))
+
+        self.log_day(DAY, weight='72', burned='50')
+        self.assertSumsMatchRebuild()
+
+        # The shifted rows are marked as changed for the stored monthly reports.
+        self.assertGreater(DailyRollup.objects.get(pk=later.pk).updated_at, later.updated_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.filter(user=self.user, date=DAY + timedelta(days=1)).delete()
+        self.assertSumsMatchRebuild()
+
+    def test_migration_recomputes_meal_columns(self):
+        for offset in range(3):
+            self.log_day(DAY + timedelta(days=offset), weight='70', grams='33')
+        expected = list(DailyRollup.objects.filter(user=self.user).order_by('date').values())
+        # What the integer division of the old aggregates left on SQLite.
+        DailyRollup.objects.filter(user=self.user, date=DAY).update(calories_consumed=42, protein_g=0, carbs_g=9)
+        DailyRollup.objects.filter(user=self.user).update(cum_net_calories=F('cum_net_calories') - 0.9)
+
+        migration = import_module('analysis.migrations.0004_recompute_meal_rollups')
+        migration.recompute_meal_rollups(global_apps, None)
+        migrated = list(DailyRollup.objects.filter(user=self.user).order_by('date').values())
+        self.assertEqual([{**row, 'updated_at': None} for row in migrated],
+                         [{**row, 'updated_at': None} for row in expected])
+        self.assertTrue(all(new['updated_at'] > old['updated_at'] for new, old in zip(migrated, expected)))
+
+
+class TrendColumnTests(TestCase):
+    """The trend columns of daily reports against a direct computation from the logs."""
+    # The report rounds to two decimals.
+    ROUNDED = 0.005 + 1e-9
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='trends')
+        food = FoodItem.objects.create(name='Bread', calories=250, protein=9, carbs=49, fats=3)
+        self.weights, self.net = {}, {}
+        with self.captureOnCommitCallbacks(execute=True):
+            # Six weeks of logs before DAY and two after, with gaps.
+            for offset in range(-42, 15):
+                day = DAY + timedelta(days=offset)
+                if offset % 3 == 0:
+                    self.weights[day] = Decimal('80') - Decimal(offset + 42) / 20
+                    WeightLog.objects.create(user=self.user, date=day, weight_kg=self.weights[day])
+                if offset % 4 == 1:
+                    continue
+                grams = Decimal(600 + 37 * (offset % 5))
+                meal = Meal.objects.create(user=self.user, meal_type='lunch', date=day)
+                MealItem.objects.create(meal=meal, food_item=food, quantity_g=grams)
+                burned = Decimal(150 + 10 * (offset % 7)) if offset % 2 else Decimal('0')
+                if burned:
+                    Workout.objects.create(user=self.user, date=day, description='ride', calories_burned=burned)
+                self.net[day] = float(grams * Decimal('2.5') - burned)
+
+    def expected_trends(self, start_date, end_date):
+        rows = []
+        day = start_date
+        while day <= end_date:
+            row = {}
+            for window in TREND_WINDOWS:
+                days = [day - timedelta(days=i) for i in range(window)]
+                weights = [float(self.weights[d]) for d in days if d in self.weights]
+                row[f'weight_kg_ma{window}'] = sum(weights) / len(weights) if weights else 0
+                row[f'net_calories_ma{window}'] = sum(self.net.get(d, 0) for d in days) / window
+            row['cum_net_calories'] = sum(net for d, net in self.net.items() if start_date <= d <= day)
+            rows.append(row)
+            day += timedelta(days=1)
+        return rows
+
+    def expected_slope(self, start_date, end_date):
+        points = [((d - start_date).days, float(w)) for d, w in self.weights.items() if start_date <= d <= end_date]
+        if len(points) < 2:
+            return 0
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / sum((x - mean_x) ** 2 for x, _ in points)
+        return slope * 7
+
+    def assertTrendsMatch(self, start_date, end_date):
+        report = build_report(self.user, start_date, end_date)
+        trends = [{column: point[column] for column in TREND_COLUMNS} for point in report['chart_data']]
+        expected = self.expected_trends(start_date, end_date)
+        self.assertEqual(len(trends), len(expected))
+        for actual, wanted in zip(trends, expected):
+            for column in TREND_COLUMNS:
+                self.assertAlmostEqual(actual[column], wanted[column], delta=self.ROUNDED, msg=column)
+        self.assertAlmostEqual(report['summary_stats']['weight_trend_kg_per_week'],
+                               self.expected_slope(start_date, end_date), delta=self.ROUNDED)
+
+    def test_month_with_gaps(self):
+        self.assertTrendsMatch(DAY - timedelta(days=20), DAY + timedelta(days=20))
+
+    def test_windows_reaching_before_the_first_log(self):
+        self.assertTrendsMatch(DAY - timedelta(days=50), DAY - timedelta(days=30))
+
+    def test_single_days(self):
+        # A weigh-in without a meal, a meal without a weigh-in, and a day after the last log.
+        for day in (DAY - timedelta(days=3), DAY - timedelta(days=2), DAY + timedelta(days=30)):
+            with self.subTest(day=day):
+                self.assertTrendsMatch(day, day)
+                self.assertEqual(build_report(self.user, day, day)['summary_stats']['weight_trend_kg_per_week'], 0)
+
+
+def legacy_dataframe(user, start_date, end_date):
+    """The pandas DataFrame the report views were built from before the rollups."""
+    import pandas as pd
+
+    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+    df = pd.DataFrame(index=date_range)
+
+    weight_data = WeightLog.objects.filter(user=user, date__range=[start_date, end_date])
+    steps_data = DailySteps.objects.filter(user=user, date__range=[start_date, end_date])
+    workout_data = Workout.objects.filter(user=user, date__range=[start_date, end_date])
+    water_data = WaterIntake.objects.filter(user=user, date__range=[start_date, end_date])
+    sleep_data = Sleep.objects.filter(user=user, date__range=[start_date, end_date])
+    meal_data = MealItem.objects.filter(
+        meal__user=user, meal__date__range=[start_date, end_date]
+    ).values('meal__date').annotate(
+        daily_calories=Sum(F('food_item__calories') * F('quantity_g') / Decimal('100.0')),
+        daily_protein=Sum(F('food_item__protein') * F('quantity_g') / Decimal('100.0')),
+        daily_carbs=Sum(F('food_item__carbs') * F('quantity_g') / Decimal('100.0')),
+        daily_fats=Sum(F('food_item__fats') * F('quantity_g') / Decimal('100.0'))
+    )
+
+    df['weight_kg'] = pd.Series({pd.to_datetime(w.date): float(w.weight_kg) for w in weight_data})
+    df['daily_steps'] = pd.Series({pd.to_datetime(s.date): s.step_count for s in steps_data})
+    df['water_intake_ml'] = pd.Series({pd.to_datetime(w.date): w.milliliters for w in water_data})
+    df['sleep_hours'] = pd.Series({pd.to_datetime(s.date): float(s.duration_hours) for s in sleep_data})
+    df['calories_from_steps'] = pd.Series({pd.to_datetime(s.date): float(s.calories_burned) for s in steps_data})
+    df['calories_from_workouts'] = pd.Series({pd.to_datetime(w.date): float(w.calories_burned) for w in workout_data})
+    df['calories_consumed'] = pd.Series({pd.to_datetime(m['meal__date']): float(m['daily_calories']) for m in meal_data})
+    df['protein_g'] = pd.Series({pd.to_datetime(m['meal__date']): float(m['daily_protein']) for m in meal_data})
+    df['carbs_g'] = pd.Series({pd.to_datetime(m['meal__date']): float(m['daily_carbs']) for m in meal_data})
+    df['fats_g'] = pd.Series({pd.to_datetime(m['meal__date']): float(m['daily_fats']) for m in meal_data})
+
+    with warnings.catch_warnings():
+        # pandas warns about downcasting the all-NaN columns of empty ranges.
+        warnings.simplefilter('ignore', FutureWarning)
+        df.fillna(0, inplace=True)
+    df['total_calories_burned'] = df['calories_from_steps'] + df['calories_from_workouts']
+    df['net_calories'] = df['calories_consumed'] - df['total_calories_burned']
+    return df
+
+
+def legacy_report(user, start_date, end_date):
+    """The report payload of the pandas implementation."""
+    df = legacy_dataframe(user, start_date, end_date)
+    weights = df['weight_kg'].loc[df['weight_kg'] > 0]
+    start_weight = weights.iloc[0] if not weights.empty else 0
+    end_weight = weights.iloc[-1] if not weights.empty else 0
+    summary = {
+        'weight_change_kg': round(end_weight - start_weight, 2),
+        'avg_daily_calories_consumed': round(df['calories_consumed'].mean(), 0),
+        'avg_daily_calories_burned': round(df['total_calories_burned'].mean(), 0),
+        'total_workouts': Workout.objects.filter(user=user, date__range=[start_date, end_date]).count(),
+    }
+
+    df.index.name = 'date'
+    chart_data = df.reset_index().to_dict(orient='records')
+    for item in chart_data:
+        item['date'] = item['date'].strftime('%b %d')
+    return {'summary_stats': summary, 'chart_data': chart_data}
+
+
+def legacy_weekly_trends(user, start_date, end_date):
+    """The weekly trends payload of the pandas implementation."""
+    df = legacy_dataframe(user, start_date, end_date)
+    return [
+        {
+            'name': index.strftime('%a'),
+            'steps': row['daily_steps'],
+            'water': round(row['water_intake_ml'] / 250),
+            'sleep': row['sleep_hours'],
+        }
+        for index, row in df.iterrows()
+    ]
+
+
+class ReportParityTests(TestCase):
+    """The NumPy engine serves the same numbers as the pandas code it replaced."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='parity')
+        Profile.objects.create(user=self.user, weight=70)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Whole 100g portions: the legacy query divided in integers on SQLite.
+        self.oats = FoodItem.objects.create(name='Oats', calories=381, protein=Decimal('12.5'), carbs=67, fats=7)
+        self.egg = FoodItem.objects.create(name='Egg', calories=143, protein=Decimal('12.6'), carbs=Decimal('0.7'), fats=Decimal('9.5'))
+
+    def log(self, day, weight=None, steps=None, water=None, sleep=None, burned=None, meals=()):
+        with self.captureOnCommitCallbacks(execute=True):
+            if weight is not None:
+                WeightLog.objects.create(user=self.user, date=day, weight_kg=Decimal(weight))
+            if steps is not None:
+                DailySteps.objects.create(user=self.user, date=day, step_count=steps)
+            if water is not None:
+                WaterIntake.objects.create(user=self.user, date=day, milliliters=water)
+            if sleep is not None:
+                Sleep.objects.create(user=self.user, date=day, duration_hours=Decimal(sleep))
+            if burned is not None:
+                Workout.objects.create(user=self.user, date=day, description='ride', calories_burned=Decimal(burned))
+            for meal_type, food, grams in meals:
+                meal, _ = Meal.objects.get_or_create(user=self.user, meal_type=meal_type, date=day)
+                MealItem.objects.create(meal=meal, food_item=food, quantity_g=Decimal(grams))
+
+    def log_fixture(self, first_day):
+        """Days with gaps between them, zero days and days without a weigh-in."""
+        day = lambda offset: first_day + timedelta(days=offset)
+        self.log(day(-1), weight='81.0', steps=9000, meals=[('lunch', self.oats, 300)])
+        self.log(day(0), weight='80.4', steps=6000, water=1500, sleep='7.50', burned='250.5',
+                 meals=[('breakfast', self.oats, 100), ('dinner', self.egg, 200)])
+        self.log(day(3), steps=0, water=0, sleep='0', burned='0')
+        self.log(day(4), water=625, meals=[('lunch', self.egg, 100)])
+        self.log(day(5), weight='79.9', sleep='6.25', burned='410')
+        self.log(day(6), weight='79.6', steps=12000, water=2375)
+
+    def test_monthly_report(self):
+        self.log_fixture(date(2025, 2, 1))
+        self.log(date(2025, 2, 20), weight='78.8', meals=[('snack', self.egg, 100)])
+
+        response = self.client.get('/api/analysis/report/', {'period': 'monthly', 'year': 2025, 'month': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        expected = legacy_report(self.user, date(2025, 2, 1), date(2025, 2, 28))
+
+        summary = data['summary_stats']
+        self.assertEqual({key: summary[key] for key in expected['summary_stats']}, expected['summary_stats'])
+        self.assertEqual(
+            [{key: point[key] for key in ['date'] + REPORT_COLUMNS} for point in data['chart_data']],
+            expected['chart_data'],
+        )
+
+    def test_workouts_of_one_day_are_summed(self):
+        # The one intended difference: the DataFrame was filled from a dict
+        # keyed by date, so only the last workout of a day was counted.
+        self.log(date(2025, 2, 3), burned='410')
+        self.log(date(2025, 2, 3), burned='35.25')
+
+        data = self.client.get('/api/analysis/report/', {'period': 'monthly', 'year': 2025, 'month': 2}).json()
+        legacy = legacy_report(self.user, date(2025, 2, 1), date(2025, 2, 28))
+        self.assertEqual(data['chart_data'][2]['calories_from_workouts'], 445.25)
+        self.assertIn(legacy['chart_data'][2]['calories_from_workouts'], (410, 35.25))
+        self.assertEqual(data['summary_stats']['total_workouts'], legacy['summary_stats']['total_workouts'])
+
+    def test_report_without_any_data(self):
+        response = self.client.get('/api/analysis/report/', {'period': 'monthly', 'year': 2024, 'month': 2})
+        data = response.json()
+        expected = legacy_report(self.user, date(2024, 2, 1), date(2024, 2, 29))
+
+        self.assertEqual({key: data['summary_stats'][key] for key in expected['summary_stats']}, expected['summary_stats'])
+        self.assertEqual([point['date'] for point in data['chart_data']], [point['date'] for point in expected['chart_data']])
+        self.assertEqual(data['chart_data'][0]['net_calories'], 0)
+
+    def test_weekly_trends(self):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=6)
+        self.log_fixture(start_date)
+
+        response = self.client.get('/api/analysis/weekly-trends/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), legacy_weekly_trends(self.user, start_date, end_date))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        food = FoodItem.objects.create(name='Rice', calories=130, protein=Decimal('2.7'), carbs=28, fats=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.create(user=self.user, date=DAY, weight_kg=Decimal('70.5'))
+            WaterIntake.objects.create(user=self.user, date=DAY, milliliters=1500)
+            meal = Meal.objects.create(user=self.user, meal_type='lunch', date=DAY + timedelta(days=2))
+            MealItem.objects.create(meal=meal, food_item=food, quantity_g=Decimal('200'))
+            Workout.objects.create(user=self.user, date=DAY + timedelta(days=2), description='run',
+                                   calories_burned=Decimal('300.5'))
+
+    def export(self, **params):
+        return self.client.get('/api/analysis/export/', params)
+
+    def read_csv(self, response):
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_csv_has_a_row_per_day(self):
+        response = self.export(start='2025-03-09', end='2025-03-13')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('fittrack_report_2025-03-13.csv', response['Content-Disposition'])
+        header, *rows = self.read_csv(response)
+        self.assertEqual(header, ['date'] + EXPORT_COLUMNS)
+        self.assertEqual([row[0] for row in rows],
+                         ['2025-03-09', '2025-03-10', '2025-03-11', '2025-03-12', '2025-03-13'])
+
+        values = [dict(zip(header[1:], map(float, row[1:]))) for row in rows]
+        # Days with nothing logged are zeros.
+        self.assertEqual(set(values[0].values()), {0.0})
+        self.assertEqual((values[1]['weight_kg'], values[1]['water_intake_ml']), (70.5, 1500.0))
+        self.assertEqual(values[3], {
+            **dict.fromkeys(EXPORT_COLUMNS, 0.0),
+            'calories_consumed': 260.0, 'protein_g': 5.4, 'carbs_g': 56.0,
+            'calories_from_workouts': 300.5, 'total_calories_burned': 300.5, 'net_calories': -40.5,
+        })
+
+    def test_default_range_is_the_last_30_days(self):
+        header, *rows = self.read_csv(self.export())
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(rows[-1][0], date.today().isoformat())
+
+        header, *rows = self.read_csv(self.export(end='2025-03-12'))
+        self.assertEqual((rows[0][0], rows[-1][0]), ('2025-02-11', '2025-03-12'))
+
+    def test_range_ending_on_the_last_date(self):
+        header, *rows = self.read_csv(self.export(start='9999-12-01', end='9999-12-31'))
+        self.assertEqual((len(rows), rows[-1][0]), (31, '9999-12-31'))
+
+    def test_invalid_ranges(self):
+        for params in [
+            {'start': '2025-03-10', 'end': '2025-03-09'},
+            {'start': 'yesterday'},
+            {'end': '2025-02-30'},
+            {'end': '0001-01-05'},
+            {'start': '0001-01-01', 'end': '9998-12-31'},
+            {'start': '2015-01-01', 'end': '2025-12-31'},
+        ]:
+            with self.subTest(params=params):
+                response = self.export(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_longest_range(self):
+        start = DAY - timedelta(days=MAX_EXPORT_DAYS - 1)
+        header, *rows = self.read_csv(self.export(start=start.isoformat(), end=DAY.isoformat()))
+        self.assertEqual(len(rows), MAX_EXPORT_DAYS)
+        self.assertEqual(float(rows[-1][1]), 70.5)
+
+    def read_table(self, response, content_type):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        return b''.join(response.streaming_content)
+
+    def assertExportedTable(self, table, days):
+        self.assertEqual(table.schema, arrow_schema())
+        self.assertEqual(table.num_rows, days)
+        columns = table.to_pydict()
+        self.assertEqual(columns['date'][:4], [DAY - timedelta(days=1) + timedelta(days=i) for i in range(4)])
+        self.assertEqual(columns['weight_kg'][:4], [0.0, 70.5, 0.0, 0.0])
+        self.assertEqual(columns['calories_consumed'][3], 260.0)
+        self.assertEqual(columns['net_calories'][3], -40.5)
+
+    def test_arrow_stream(self):
+        import pyarrow as pa
+
+        # More days than one record batch holds.
+        params = {'start': '2025-03-09', 'end': '2032-03-08', 'file_format': 'arrow'}
+        data = self.read_table(self.export(**params), 'application/vnd.apache.arrow.stream')
+        reader = pa.ipc.open_stream(data)
+        self.assertEqual(reader.schema, arrow_schema())
+        table = reader.read_all()
+        self.assertGreater(len(table.to_batches()), 1)
+        self.assertExportedTable(table, 2557)
+
+    def test_parquet_file(self):
+        import pyarrow.parquet as pq
+
+        params = {'start': '2025-03-09', 'end': '2032-03-08', 'file_format': 'parquet'}
+        data = self.read_table(self.export(**params), 'application/vnd.apache.parquet')
+        self.assertGreater(pq.ParquetFile(io.BytesIO(data)).num_row_groups, 1)
+        self.assertExportedTable(pq.read_table(io.BytesIO(data)), 2557)
+
+    def test_unknown_file_format(self):
+        response = self.export(file_format='xlsx')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('csv, arrow, parquet', response.json()['error'])
+        # The CSV-only endpoint only offers CSV.
+        response = self.client.get('/api/analysis/export-csv/', {'file_format': 'parquet'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalysisCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def report(self):
+        return self.client.get('/api/analysis/report/', {'period': 'monthly', 'year': 2025, 'month': 3})
+
+    def test_writes_bump_the_data_version(self):
+        version = analysis_cache.get_data_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            WeightLog.objects.create(user=self.user, date=DAY, weight_kg=Decimal('70'))
+            # Not before the rollup is refreshed at commit.
+            self.assertEqual(analysis_cache.get_data_version(self.user.pk), version)
+        self.assertEqual(len(callbacks), 1)
+        self.assertGreater(analysis_cache.get_data_version(self.user.pk), version)
+
+    def test_write_invalidates_cached_report(self):
+        self.assertEqual(self.report().json()['chart_data'][9]['weight_kg'], 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.report().json()['chart_data'][9]['weight_kg'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.create(user=self.user, date=DAY, weight_kg=Decimal('70.25'))
+        self.assertEqual(self.report().json()['chart_data'][9]['weight_kg'], 70.25)
+
+    def test_versions_are_per_user(self):
+        other = User.objects.create_user(username='other')
+        version = analysis_cache.get_data_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.create(user=other, date=DAY, weight_kg=Decimal('80'))
+        self.assertEqual(analysis_cache.get_data_version(self.user.pk), version)
+
+    def test_hit_and_miss_counters(self):
+        self.report()
+        self.report()
+        self.client.get('/api/analysis/weekly-trends/')
+
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_authenticate(staff)
+        stats = self.client.get('/api/analysis/cache-stats/').json()
+        self.assertEqual(stats['report'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertEqual(stats['weekly-trends'], {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+        self.assertEqual(stats['export'], {'hits': 0, 'misses': 0, 'hit_rate': None})
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/analysis/cache-stats/').status_code, 403)
+
+    def test_export_is_revalidated_with_its_etag(self):
+        params = {'start': '2025-03-01', 'end': '2025-03-31'}
+        response = self.client.get('/api/analysis/export/', params)
+        etag = response['ETag']
+        b''.join(response.streaming_content)
+
+        response = self.client.get('/api/analysis/export/', params, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Another range, or new data, changes the tag.
+        response = self.client.get('/api/analysis/export/', {'start': '2025-03-02', 'end': '2025-03-31'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.create(user=self.user, date=DAY, weight_kg=Decimal('70'))
+        response = self.client.get('/api/analysis/export/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(analysis_cache.cache_stats()['export'], {'hits': 1, 'misses': 3, 'hit_rate': 0.25})
+
+    def test_etag_matching(self):
+        etag = '"0cc175b9c0f1b6a831c399e269772661"'
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(etag, f'"a", W/{etag}'))
+        self.assertTrue(etag_matches(etag, '*'))
+        self.assertFalse(etag_matches(etag, ''))
+        # Whole tags only: a tag containing the ETag, or a fragment of it, is no match.
+        self.assertFalse(etag_matches(etag, f'"x{etag[1:]}'))
+        self.assertFalse(etag_matches(etag, f'{etag[:-1]}x"'))
+        self.assertFalse(etag_matches(etag, etag[1:-1]))
+        self.assertFalse(etag_matches(etag, f'"{etag}"'))
+
+
+class InlineExecutor:
+    """
+    Stands in for the command's ProcessPoolExecutor: worker processes cannot
+    see the in-memory test database, so tasks run here as they are submitted.
+    """
+
+    def __init__(self, max_workers, initializer):
+        self.max_workers = max_workers
+        initializer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
+class ReportGenerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'reporter{i}') for i in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, user in enumerate(self.users[:3]):
+                WeightLog.objects.create(user=user, date=DAY, weight_kg=Decimal('70') + i)
+
+    def generate(self, *args):
+        output = io.StringIO()
+        call_command('generate_reports', '--year', '2025', '--month', '3', *args, stdout=output)
+        return output.getvalue()
+
+    def report(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get('/api/analysis/report/', {'period': 'monthly', 'year': 2025, 'month': 3}).json()
+
+    def test_reports_match_the_live_report(self):
+        self.assertIn('Generated 5 reports for 2025-03.', self.generate('--workers', '1', '--chunk-size', '2'))
+        self.assertEqual(MonthlyReport.objects.count(), 5)
+        for user in self.users:
+            stored = get_stored_report(user, 2025, 3)
+            self.assertEqual(stored, json.loads(json.dumps(build_report(user, date(2025, 3, 1), date(2025, 3, 31)))))
+
+    def test_worker_processes(self):
+        with mock.patch('analysis.management.commands.generate_reports.ProcessPoolExecutor', InlineExecutor):
+            output = self.generate('--workers', '3', '--chunk-size', '2', '--verbosity', '2')
+        self.assertIn('5/5 reports written', output)
+        self.assertIn('Generated 5 reports', output)
+        self.assertEqual(MonthlyReport.objects.count(), 5)
+
+    def test_selecting_users(self):
+        self.generate('--workers', '1', '--active-only')
+        self.assertEqual(set(MonthlyReport.objects.values_list('user__username', flat=True)),
+                         {'reporter0', 'reporter1', 'reporter2'})
+        self.generate('--workers', '1', '--user', 'reporter4')
+        self.assertEqual(MonthlyReport.objects.count(), 4)
+        with self.assertRaises(CommandError):
+            self.generate('--month', '13')
+
+    def test_stored_report_is_served_until_a_day_changes(self):
+        user = self.users[0]
+        self.generate('--workers', '1', '--user', user.username)
+        report = MonthlyReport.objects.get(user=user)
+        report.data['summary_stats']['total_workouts'] = 99
+        report.save()
+        self.assertEqual(self.report(user)['summary_stats']['total_workouts'], 99)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Workout.objects.create(user=user, date=DAY, description='run', calories_burned=Decimal('300'))
+        self.assertIsNone(get_stored_report(user, 2025, 3))
+        self.assertEqual(self.report(user)['summary_stats']['total_workouts'], 1)
+
+        # Regenerating makes it current again.
+        self.generate('--workers', '1', '--user', user.username)
+        self.assertEqual(get_stored_report(user, 2025, 3)['summary_stats']['total_workouts'], 1)
+
+    def test_days_before_the_month_count_for_the_moving_averages(self):
+        user = self.users[0]
+        self.generate('--workers', '1', '--user', user.username)
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.create(user=user, date=date(2025, 2, 20), weight_kg=Decimal('72'))
+        self.assertIsNone(get_stored_report(user, 2025, 3))
+
+        # Days after the month do not.
+        self.generate('--workers', '1', '--user', user.username)
+        with self.captureOnCommitCallbacks(execute=True):
+            WeightLog.objects.create(user=user, date=date(2025, 4, 5), weight_kg=Decimal('75'))
+        self.assertIsNotNone(get_stored_report(user, 2025, 3))
+
+
+class ReportPeriodTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='periods')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for day in (date(2025, 1, 1), date(2025, 1, 2)):
+                WaterIntake.objects.create(user=self.user, date=day, milliliters=700)
+            WaterIntake.objects.create(user=self.user, date=date(2025, 2, 10), milliliters=2800)
+            for offset in range(31):
+                WaterIntake.objects.create(user=self.user, date=date(2025, 3, 1) + timedelta(days=offset), milliliters=1000)
+            WeightLog.objects.create(user=self.user, date=date(2025, 3, 1), weight_kg=Decimal('70'))
+            WeightLog.objects.create(user=self.user, date=date(2025, 3, 20), weight_kg=Decimal('72'))
+
+    def report(self, **params):
+        response = self.client.get('/api/analysis/report/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def points(self, data, column):
+        return [(point['date'], point[column]) for point in data['chart_data']]
+
+    def test_granularity_follows_the_length_of_the_range(self):
+        start = date(2025, 1, 1)
+        for days, granularity in [
+            (1, 'day'), (62, 'day'), (63, 'week'), (62 * 7, 'week'),
+            (62 * 7 + 1, 'month'), (62 * 31, 'month'), (62 * 31 + 1, 'year'),
+        ]:
+            with self.subTest(days=days):
+                self.assertEqual(choose_granularity(start, start + timedelta(days=days - 1))[0], granularity)
+
+    def test_quarterly_report_is_averaged_per_week(self):
+        data = self.report(period='quarterly', year=2025, quarter=1)
+        self.assertEqual(data['granularity'], 'week')
+        # Each week is averaged over its days inside the quarter; the first
+        # has five, the last one.
+        self.assertEqual(self.points(data, 'water_intake_ml'), [
+            ('Jan 01', 280.0), ('Feb 10', 400.0), ('Feb 24', 285.71), ('Mar 03', 1000.0),
+            ('Mar 10', 1000.0), ('Mar 17', 1000.0), ('Mar 24', 1000.0), ('Mar 31', 1000.0),
+        ])
+        self.assertEqual(self.points(data, 'weight_kg')[2:6], [('Feb 24', 70.0), ('Mar 03', 0.0), ('Mar 10', 0.0), ('Mar 17', 72.0)])
+        self.assertEqual(data['summary_stats']['weight_change_kg'], 2.0)
+
+    def test_yearly_report(self):
+        data = self.report(period='yearly', year=2025)
+        self.assertEqual(data['granularity'], 'week')
+        quarter = self.report(period='quarterly', year=2025, quarter=1)
+        self.assertEqual(self.points(data, 'water_intake_ml')[:7], self.points(quarter, 'water_intake_ml')[:7])
+        # Within the year, the week of March 31 also has six empty days of April.
+        self.assertEqual(self.points(data, 'water_intake_ml')[7:], [('Mar 31', 142.86)])
+
+    def test_long_ranges_are_averaged_per_month(self):
+        data = self.report(period='custom', start='2024-01-01', end='2025-12-31')
+        self.assertEqual(data['granularity'], 'month')
+        self.assertEqual(self.points(data, 'water_intake_ml'),
+                         [('Jan 2025', 45.16), ('Feb 2025', 100.0), ('Mar 2025', 1000.0)])
+        # Weight is averaged over the days it was logged.
+        self.assertEqual(self.points(data, 'weight_kg')[2], ('Mar 2025', 71.0))
+
+    def test_custom_ranges(self):
+        data = self.report(period='custom', start='2025-03-18', end='2025-03-21')
+        self.assertEqual(data['granularity'], 'day')
+        self.assertEqual([point['weight_kg'] for point in data['chart_data']], [0, 0, 72.0, 0])
+
+        data = self.report(period='custom', start='2020-03-01', end='2025-12-31')
+        self.assertEqual(data['granularity'], 'year')
+        self.assertEqual(self.points(data, 'water_intake_ml'), [('2025', 96.44)])
+
+    def test_invalid_periods(self):
+        for params in [
+            {'period': 'decade'},
+            {'period': 'quarterly', 'quarter': 5},
+            {'period': 'monthly', 'month': 13},
+            {'period': 'monthly', 'year': 9999, 'month': 12},
+            {'period': 'monthly', 'year': 1, 'month': 1},
+            {'period': 'yearly', 'year': 9999},
+            {'period': 'custom', 'start': '2025-03-10'},
+            {'period': 'custom', 'start': '2025-03-10', 'end': '2025-03-09'},
+            {'period': 'custom', 'start': '2020-01-01', 'end': '9999-12-31'},
+            {'period': 'custom', 'start': '9999-12-01', 'end': '9999-12-31'},
+            {'period': 'custom', 'start': '2010-01-01', 'end': '2025-12-31'},
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/analysis/report/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class DailyTipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tipped')
+        Profile.objects.create(user=self.user, weight=70, daily_calorie_intake=Decimal('2000'))
+        self.threads = []
+        generate = mock.patch('analysis.tips.generate_tip', side_effect=['First tip.', 'Second tip.'])
+        self.generate = generate.start()
+        self.addCleanup(generate.stop)
+
+    def log_workout(self, burned):
+        with self.captureOnCommitCallbacks(execute=True):
+            Workout.objects.create(user=self.user, date=DAY, description='row', calories_burned=Decimal(burned))
+
+    def get_tip(self, stale_while_revalidate=False):
+        start = tips._refresh_in_background
+
+        def start_and_remember(*args):
+            thread = start(*args)
+            if thread is not None:
+                self.threads.append(thread)
+            return thread
+
+        with mock.patch('analysis.tips._refresh_in_background', side_effect=start_and_remember):
+            return tips.get_daily_tip(self.user, DAY, stale_while_revalidate)
+
+    def finish_refreshes(self):
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def test_no_data_needs_no_llm_call(self):
+        self.assertEqual(self.get_tip(), tips.NO_DATA_TIP)
+        self.generate.assert_not_called()
+
+    def test_cached_until_the_facts_change(self):
+        self.log_workout('300')
+        self.assertEqual(self.get_tip(), 'First tip.')
+        self.assertEqual(self.get_tip(), 'First tip.')
+        self.assertEqual(self.generate.call_count, 1)
+
+        # Another workout changes the fingerprint of the facts.
+        self.log_workout('120')
+        self.assertEqual(self.get_tip(), 'Second tip.')
+        self.assertIn('420 kcal', self.generate.call_args.args[0])
+        self.assertEqual(analysis_cache.cache_stats()['daily-tip'], {'hits': 1, 'misses': 2, 'hit_rate': 0.333})
+
+    def test_goal_change_changes_the_fingerprint(self):
+        self.log_workout('300')
+        self.get_tip()
+        Profile.objects.filter(user=self.user).update(daily_calorie_intake=Decimal('1800'))
+        self.assertEqual(self.get_tip(), 'Second tip.')
+
+    def test_stale_tip_is_served_while_revalidating(self):
+        self.log_workout('300')
+        self.get_tip(stale_while_revalidate=True)
+        self.log_workout('120')
+
+        # The previous tip at once, the new one for the next request.
+        self.assertEqual(self.get_tip(stale_while_revalidate=True), 'First tip.')
+        self.finish_refreshes()
+        self.assertEqual(len(self.threads), 1)
+        self.assertEqual(self.get_tip(stale_while_revalidate=True), 'Second tip.')
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_failed_refresh_is_logged_and_retried(self):
+        self.log_workout('300')
+        self.get_tip(stale_while_revalidate=True)
+        self.log_workout('120')
+        self.generate.side_effect = [RuntimeError('LLM down'), 'Second tip.']
+
+        with self.assertLogs('analysis.tips', 'ERROR') as logs, \
+                mock.patch('analysis.tips.connection') as connection:
+            self.assertEqual(self.get_tip(stale_while_revalidate=True), 'First tip.')
+            self.finish_refreshes()
+        self.assertIn('LLM down', logs.output[0])
+        connection.close.assert_called_once_with()
+
+        # The lock was released, so the next request starts another refresh.
+        self.assertEqual(self.get_tip(stale_while_revalidate=True), 'First tip.')
+        self.finish_refreshes()
+        self.assertEqual(self.get_tip(stale_while_revalidate=True), 'Second tip.')
+
+    async def test_async_view(self):
+        await Workout.objects.acreate(user=self.user, date=date.today(), description='row', calories_burned=Decimal('300'))
+        request = AsyncRequestFactory().get('/', headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'})
+        view = AsyncDailyTipView.as_view()
+
+        with mock.patch('analysis.tips.agenerate_tip', side_effect=['First tip.']) as agenerate:
+            for _ in range(2):
+                response = await view(request)
+                self.assertEqual(json.loads(response.content), {'tip': 'First tip.'})
+        agenerate.assert_awaited_once()
+        self.assertIn('300 kcal', agenerate.await_args.args[0])
+        self.generate.assert_not_called()
+        self.assertEqual(analysis_cache.cache_stats()['daily-tip'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        await cache.aclear()
+        with mock.patch('analysis.tips.agenerate_tip', side_effect=RuntimeError('LLM down')):
+            response = await view(request)
+        self.assertEqual(response.status_code, 500)
@@ -0,0 +1,259 @@
+#
+# File: analysis/tips.py
+#
+# Builds and caches the dashboard's daily tip. A tip is cached per user and
+# per day under a fingerprint of the facts and goal it was generated from,
+# so the LLM is only called again once the user's data actually changes.
+#
+# In stale-while-revalidate mode (DAILY_TIP_STALE_WHILE_REVALIDATE) a
+# request whose facts changed gets the previous tip of the day at once,
+# while a background thread (or, in the async views, an event loop task)
+# generates the new one for the next request.
+#
+
+import asyncio
+import contextvars
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+
+from chatbot.llm import get_gateway
+from daily_data.models import DailySteps, Sleep
+from meals.models import Meal
+from users.models import Profile
+from workouts.models import Workout
+from . import cache as analysis_cache
+
+TIP_KEY = 'analysis:daily-tip:{user_id}:{day}:{fingerprint}'
+LATEST_TIP_KEY = 'analysis:daily-tip:{user_id}:{day}:latest'
+REFRESH_LOCK_KEY = 'analysis:daily-tip:{user_id}:{day}:{fingerprint}:refreshing'
+
+# How long a background refresh may run before another request may start one.
+REFRESH_LOCK_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+NO_DATA_TIP = "Log your first activity of the day to unlock a personalized tip!"
+
+PROMPT_INSTRUCTIONS = (
+    "\nHere are your instructions:\n"
+    "1. Analyze the user's data above.\n"
+    "2. Pick the single most relevant fact to comment on.\n"
+    "3. Write one short, motivational, and actionable tip based ONLY on that fact and the user's main goal.\n"
+    "4. The tip must be under 30 words, encouraging, and feel personal.\n"
+    "5. Do NOT invent any data or percentages.\n\n"
+    "Example of a good tip: 'Great job on your steps! Lets get u some nutrition dense meal to recover .IMPORTANT: Do not write anything before the tip. Your entire response must only be the tip itself.'"
+)
+
+
+def format_tip_facts(profile, calories_consumed, calories_burned, steps, sleep):
+    """
+    Returns (goal, facts, data_found): the user's goal description, the fact
+    lines of the prompt, and whether anything was logged on the day.
+    """
+    goal = profile.get_calorie_goal_option_display() or "their fitness goals"
+
+    facts = []
+    data_found = False
+    if profile.daily_calorie_intake:
+        facts.append(f"- Calorie Goal: {profile.daily_calorie_intake} kcal")
+    if calories_consumed is not None and calories_consumed > 0:
+        facts.append(f"- Calories Consumed: {calories_consumed:.0f} kcal")
+        data_found = True
+    if calories_burned is not None and calories_burned > 0:
+        facts.append(f"- Calories Burned from Workouts: {calories_burned:.0f} kcal")
+        data_found = True
+    if steps is not None and steps > 0:
+        facts.append(f"- Steps Taken: {steps}")
+        data_found = True
+    if sleep is not None and sleep > 0:
+        facts.append(f"- Last Night's Sleep: {sleep} hours")
+        data_found = True
+    return goal, facts, data_found
+
+
+def _tip_querysets(user, day):
+    return (
+        Meal.objects.filter(user=user, date=day),
+        Workout.objects.filter(user=user, date=day),
+        DailySteps.objects.filter(user=user, date=day).values_list('step_count', flat=True),
+        Sleep.objects.filter(user=user, date=day).values_list('duration_hours', flat=True),
+    )
+
+
+def collect_tip_facts(user, day):
+    """Reads the day's data and formats it with format_tip_facts()."""
+    meals, workouts, steps, sleep = _tip_querysets(user, day)
+    return format_tip_facts(
+        Profile.objects.get(user=user),
+        meals.aggregate(total=Sum('total_calories'))['total'],
+        workouts.aggregate(total=Sum('calories_burned'))['total'],
+        steps.first(),
+        sleep.first(),
+    )
+
+
+async def acollect_tip_facts(user, day):
+    """Async version of collect_tip_facts()."""
+    meals, workouts, steps, sleep = _tip_querysets(user, day)
+    return format_tip_facts(
+        await Profile.objects.aget(user=user),
+        (await meals.aaggregate(total=Sum('total_calories')))['total'],
+        (await workouts.aaggregate(total=Sum('calories_burned')))['total'],
+        await steps.afirst(),
+        await sleep.afirst(),
+    )
+
+
+def build_tip_prompt(goal, facts):
+    persona = f"You are 'FitCoach', a friendly and insightful AI assistant. Your user's main goal is to {goal}."
+    return f"{persona}\n\nHere is the user's data for today:\n" + "\n".join(facts) + PROMPT_INSTRUCTIONS
+
+
+def tip_fingerprint(goal, facts):
+    """A stable hash of everything the prompt is built from."""
+    return hashlib.sha256("\n".join([goal, *facts]).encode()).hexdigest()
+
+
+def _tip_messages(prompt):
+    return [
+        {"role": "user", "content": prompt},
+    ]
+
+
+def generate_tip(prompt):
+    """Asks the LLM for a tip. Raises on any client or API error."""
+    return get_gateway().complete(_tip_messages(prompt))
+
+
+async def agenerate_tip(prompt):
+    """Async version of generate_tip()."""
+    return await get_gateway().acomplete(_tip_messages(prompt))
+
+
+def _tip_entries(user_id, day, fingerprint, tip):
+    """The cache entries written for a freshly generated tip."""
+    return {
+        TIP_KEY.format(user_id=user_id, day=day, fingerprint=fingerprint): tip,
+        LATEST_TIP_KEY.format(user_id=user_id, day=day): tip,
+    }
+
+
+def _store_tip(user_id, day, fingerprint, tip):
+    cache.set_many(_tip_entries(user_id, day, fingerprint, tip), timeout=settings.ANALYSIS_CACHE_TIMEOUT)
+
+
+async def _astore_tip(user_id, day, fingerprint, tip):
+    await cache.aset_many(_tip_entries(user_id, day, fingerprint, tip), timeout=settings.ANALYSIS_CACHE_TIMEOUT)
+
+
+def _refresh_in_background(user_id, day, fingerprint, prompt):
+    """Generates the tip for a new fingerprint in a daemon thread, once at a time."""
+    lock_key = REFRESH_LOCK_KEY.format(user_id=user_id, day=day, fingerprint=fingerprint)
+    if not cache.add(lock_key, True, timeout=REFRESH_LOCK_TIMEOUT):
+        return None
+
+    def refresh():
+        try:
+            _store_tip(user_id, day, fingerprint, generate_tip(prompt))
+        except Exception:
+            # The previous tip keeps being served and the next request retries.
+            logger.exception("Refreshing the daily tip of user %s failed.", user_id)
+        finally:
+            cache.delete(lock_key)
+            # The thread's own database connection (the cache may use one).
+            connection.close()
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def get_daily_tip(user, day, stale_while_revalidate=None):
+    """
+    Returns the user's tip for the day, calling the LLM only when no tip was
+    generated yet for the current facts. Raises if the LLM call fails.
+    """
+    if stale_while_revalidate is None:
+        stale_while_revalidate = settings.DAILY_TIP_STALE_WHILE_REVALIDATE
+
+    goal, facts, data_found = collect_tip_facts(user, day)
+    if not data_found:
+        return NO_DATA_TIP
+
+    fingerprint = tip_fingerprint(goal, facts)
+    tip = cache.get(TIP_KEY.format(user_id=user.id, day=day, fingerprint=fingerprint))
+    if tip is not None:
+        analysis_cache.record_hit('daily-tip')
+        return tip
+
+    prompt = build_tip_prompt(goal, facts)
+    if stale_while_revalidate:
+        previous = cache.get(LATEST_TIP_KEY.format(user_id=user.id, day=day))
+        if previous is not None:
+            analysis_cache.record_hit('daily-tip')
+            _refresh_in_background(user.id, day, fingerprint, prompt)
+            return previous
+
+    analysis_cache.record_miss('daily-tip')
+    tip = generate_tip(prompt)
+    _store_tip(user.id, day, fingerprint, tip)
+    return tip
+
+
+# Background refreshes started by aget_daily_tip(); the event loop only keeps
+# weak references to tasks.
+_refresh_tasks = set()
+
+
+async def _arefresh(user_id, day, fingerprint, prompt):
+    lock_key = REFRESH_LOCK_KEY.format(user_id=user_id, day=day, fingerprint=fingerprint)
+    try:
+        await _astore_tip(user_id, day, fingerprint, await agenerate_tip(prompt))
+    except Exception:
+        logger.exception("Refreshing the daily tip of user %s failed.", user_id)
+    finally:
+        await cache.adelete(lock_key)
+
+
+async def aget_daily_tip(user, day, stale_while_revalidate=None):
+    """
+    Async version of get_daily_tip(). Background refreshes run as tasks on
+    the event loop instead of threads.
+    """
+    if stale_while_revalidate is None:
+        stale_while_revalidate = settings.DAILY_TIP_STALE_WHILE_REVALIDATE
+
+    goal, facts, data_found = await acollect_tip_facts(user, day)
+    if not data_found:
+        return NO_DATA_TIP
+
+    fingerprint = tip_fingerprint(goal, facts)
+    tip = await cache.aget(TIP_KEY.format(user_id=user.id, day=day, fingerprint=fingerprint))
+    if tip is not None:
+        await analysis_cache.arecord_hit('daily-tip')
+        return tip
+
+    prompt = build_tip_prompt(goal, facts)
+    if stale_while_revalidate:
+        previous = await cache.aget(LATEST_TIP_KEY.format(user_id=user.id, day=day))
+        if previous is not None:
+            await analysis_cache.arecord_hit('daily-tip')
+            lock_key = REFRESH_LOCK_KEY.format(user_id=user.id, day=day, fingerprint=fingerprint)
+            if await cache.aadd(lock_key, True, timeout=REFRESH_LOCK_TIMEOUT):
+                # A fresh context, so the task does not hold on to the request's
+                # thread-sensitive executor once the response has been sent.
+                task = asyncio.create_task(_arefresh(user.id, day, fingerprint, prompt), context=contextvars.Context())
+                _refresh_tasks.add(task)
+                task.add_done_callback(_refresh_tasks.discard)
+            return previous
+
+    await analysis_cache.arecord_miss('daily-tip')
+    tip = await agenerate_tip(prompt)
+    await _astore_tip(user.id, day, fingerprint, tip)
+    return tip
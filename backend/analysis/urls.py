@@ -1,11 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from .views import AnalysisView, ExportCsvView,WeeklyTrendsView,DailyTipView
+from .views import AnalysisView, ExportView, ExportCsvView,WeeklyTrendsView,DailyTipView,AsyncDailyTipView,CacheStatsView
 
 urlpatterns = [
         path('weekly-trends/', WeeklyTrendsView.as_view(), name='weekly-trends'),
 
     path('report/', AnalysisView.as_view(), name='analysis-report'),
+    path('export/', ExportView.as_view(), name='export'),
     path('export-csv/', ExportCsvView.as_view(), name='export-csv'),
-    path('daily-tip/', DailyTipView.as_view(), name='daily-tip'),
+    path('daily-tip/', (AsyncDailyTipView if settings.ASYNC_LLM_VIEWS else DailyTipView).as_view(), name='daily-tip'),
+    path('cache-stats/', CacheStatsView.as_view(), name='analysis-cache-stats'),
 
 ]
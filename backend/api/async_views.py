@@ -0,0 +1,56 @@
+#
+# File: api/async_views.py
+#
+# A minimal async counterpart of DRF's APIView for endpoints that spend most
+# of their time waiting on an LLM. DRF cannot dispatch to coroutines, so
+# these are plain Django async views that authenticate with the same JWT
+# authentication as the rest of the API and return JsonResponse objects.
+# Under ASGI a worker keeps serving other requests while they await.
+#
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+class AsyncAPIView(View):
+    """
+    Base class for async API views. Every handler must be `async def`;
+    request.user is set to the authenticated user before it runs.
+    """
+    authentication_class = JWTAuthentication
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Like DRF, rely on token authentication instead of CSRF cookies.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            # Loading the user touches the database, so it runs in a thread.
+            result = await sync_to_async(self.authentication_class().authenticate)(request)
+        except AuthenticationFailed as exc:
+            return JsonResponse({'detail': exc.detail}, status=status.HTTP_401_UNAUTHORIZED)
+        if result is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        request.user, request.auth = result
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_json(self, request):
+        """Returns the decoded JSON body, or None if it is not a JSON object."""
+        try:
+            data = json.loads(request.body or b'{}')
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return data if isinstance(data, dict) else None
@@ -0,0 +1,84 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chatbot.llm import get_gateway
+from chatbot.testing import FakeLLMServer
+from chatbot.views import AsyncChatAPIView, ChatAPIView
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the sync and async chat views against a local fake LLM with injected latency, "
+        "modelling one gunicorn sync worker against one ASGI worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Chat requests sent to each view.")
+        parser.add_argument('--latency-ms', type=float, default=300, help="Delay of every fake completion.")
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(latency=options['latency_ms'] / 1000).start()
+        user = User.objects.create_user(username=f'llm-benchmark-{uuid.uuid4().hex[:8]}')
+        auth = f'Bearer {AccessToken.for_user(user)}'
+
+        try:
+            # Lift the gateway's concurrency limit so that it does not cap the async run.
+            with override_settings(GROQ_BASE_URL=server.base_url, GROQ_API_KEY='stub',
+                                   LLM_MAX_CONCURRENCY=options['requests']):
+                get_gateway.cache_clear()
+                self.report('sync view, 1 sync worker', server, self.run_sync(auth, options['requests']))
+                self.report('async view, 1 ASGI worker', server, async_to_sync(self.run_async)(auth, options['requests']))
+        finally:
+            get_gateway.cache_clear()
+            server.shutdown()
+            server.server_close()
+            user.delete()
+
+    def chat_request(self, factory, auth, number):
+        return factory.post(
+            '/api/chatbot/chat/', {'message': f'Question {number}'},
+            content_type='application/json', headers={'Authorization': auth},
+        )
+
+    def run_sync(self, auth, count):
+        # A sync worker serves one request at a time, so they queue up. Latencies
+        # are measured from the start, as if every request arrived at once.
+        view, factory = ChatAPIView.as_view(), RequestFactory()
+        latencies = []
+        started = time.perf_counter()
+        for number in range(count):
+            response = view(self.chat_request(factory, auth, number))
+            assert response.status_code == 200, response.data
+            latencies.append(time.perf_counter() - started)
+        return time.perf_counter() - started, latencies
+
+    async def run_async(self, auth, count):
+        view, factory = AsyncChatAPIView.as_view(), AsyncRequestFactory()
+        started = time.perf_counter()
+
+        async def one(number):
+            response = await view(self.chat_request(factory, auth, number))
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - started
+
+        latencies = await asyncio.gather(*(one(number) for number in range(count)))
+        return time.perf_counter() - started, latencies
+
+    def report(self, label, server, result):
+        elapsed, latencies = result
+        self.stdout.write(
+            f"{label:28} {len(latencies) / elapsed:8.1f} req/s   "
+            f"p50 {statistics.median(latencies) * 1000:8.0f} ms   "
+            f"max {max(latencies) * 1000:8.0f} ms   "
+            f"peak concurrent LLM calls {server.peak_in_flight}   "
+            f"connections opened {server.connections}"
+        )
+        server.reset_counters()
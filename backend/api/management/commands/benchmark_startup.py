@@ -0,0 +1,71 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Libraries that should only be imported when a request actually needs them.
+HEAVY_MODULES = ['pandas', 'matplotlib', 'seaborn', 'groq', 'pyarrow']
+
+# Run in a fresh interpreter, since this process has already been set up.
+PROBE = """
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+importlib.import_module({urlconf!r})
+urls_done = time.perf_counter()
+print(json.dumps({{
+    'setup_ms': (setup_done - started) * 1000,
+    'urlconf_ms': (urls_done - setup_done) * 1000,
+    'rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy_modules': [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measures django.setup() and URLconf import time and peak RSS in a fresh interpreter."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Cold starts to measure; the median is reported.")
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help="Fail if the median total startup time exceeds this many milliseconds.")
+        parser.add_argument('--allow-heavy', action='store_true',
+                            help="Do not fail when a heavy library is imported at startup.")
+
+    def handle(self, *args, **options):
+        probe = PROBE.format(urlconf=settings.ROOT_URLCONF, heavy=HEAVY_MODULES)
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')}
+
+        samples = []
+        for _ in range(options['runs']):
+            result = subprocess.run(
+                [sys.executable, '-c', probe], cwd=settings.BASE_DIR, env=env,
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                raise CommandError(f"Startup probe failed:\n{result.stderr}")
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+        setup_ms = statistics.median(s['setup_ms'] for s in samples)
+        urlconf_ms = statistics.median(s['urlconf_ms'] for s in samples)
+        rss_kib = statistics.median(s['rss_kib'] for s in samples)
+        heavy = sorted({name for s in samples for name in s['heavy_modules']})
+
+        self.stdout.write(f"django.setup():   {setup_ms:8.1f} ms")
+        self.stdout.write(f"URLconf import:   {urlconf_ms:8.1f} ms")
+        self.stdout.write(f"total:            {setup_ms + urlconf_ms:8.1f} ms")
+        self.stdout.write(f"peak RSS:         {rss_kib / 1024:8.1f} MiB")
+        self.stdout.write(f"heavy modules:    {', '.join(heavy) or 'none'}")
+
+        if heavy and not options['allow_heavy']:
+            raise CommandError(f"Heavy modules imported at startup: {', '.join(heavy)}")
+        if options['budget_ms'] is not None and setup_ms + urlconf_ms > options['budget_ms']:
+            raise CommandError(
+                f"Startup took {setup_ms + urlconf_ms:.1f} ms, over the {options['budget_ms']:.1f} ms budget."
+            )
@@ -0,0 +1,239 @@
+#
+# File: api/outbound.py
+#
+# The shared client for outbound HTTP calls to third-party APIs (the food
+# providers in meals/providers.py, the Nutritionix exercise endpoint in
+# workouts/api_services.py). Per host it keeps:
+#
+#   a requests.Session   pooled keep-alive connections (OUTBOUND_POOL_SIZE),
+#                        and bounded retries of connection errors and of
+#                        502/503/504 answers (OUTBOUND_MAX_RETRIES)
+#   a CircuitBreaker     after OUTBOUND_BREAKER_THRESHOLD failed calls in a
+#                        row, calls fail fast with CircuitOpen for
+#                        OUTBOUND_BREAKER_RESET seconds; then a single
+#                        trial call decides whether the host is back
+#
+# Every call gets a (connect, read) timeout unless the caller passes one,
+# and its latency and outcome are recorded per endpoint (host and path) in
+# outbound_stats. Read timeouts are not retried: the caller's deadline
+# already covers one slow answer, and the breaker handles a slow host.
+#
+# The calls made through this client are lookups, so POSTs are retried like
+# GETs. All state is per process.
+#
+
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Call latencies kept per name for the percentiles in LatencyStats.snapshot().
+LATENCY_SAMPLES = 500
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """The host failed too often lately; the call was not attempted."""
+
+
+class LatencyStats:
+    """Thread-safe outcome counters and latency samples per name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = defaultdict(Counter)
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def record(self, name, outcome, latency=None):
+        with self.lock:
+            self.outcomes[name][outcome] += 1
+            if latency is not None:
+                self.latencies[name].append(latency)
+
+    def snapshot(self):
+        with self.lock:
+            names = {name: (dict(outcomes), sorted(self.latencies[name]))
+                     for name, outcomes in self.outcomes.items()}
+
+        snapshot = {}
+        for name, (outcomes, latencies) in names.items():
+            snapshot[name] = {
+                'calls': len(latencies),
+                'outcomes': outcomes,
+                'latency_ms': {
+                    'p50': round(statistics.median(latencies) * 1000, 1),
+                    'p95': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 1),
+                    'max': round(latencies[-1] * 1000, 1),
+                } if latencies else None,
+            }
+        return snapshot
+
+    def reset(self):
+        with self.lock:
+            self.outcomes.clear()
+            self.latencies.clear()
+
+
+outbound_stats = LatencyStats()
+
+
+class CircuitBreaker:
+    """
+    Closed while calls succeed. Opens after `threshold` failures in a row and
+    rejects calls for `reset_timeout` seconds, then lets one trial call
+    through (half-open): it closes the circuit if it succeeds and reopens it
+    otherwise.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def end_trial(self):
+        with self.lock:
+            self.trial_running = False
+
+    def snapshot(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class OutboundClient:
+    """Pooled sessions and circuit breakers per host; see the top of this file."""
+
+    def __init__(self, stats=outbound_stats):
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.breakers = {}
+
+    def _new_session(self):
+        retries = Retry(
+            total=settings.OUTBOUND_MAX_RETRIES,
+            connect=settings.OUTBOUND_MAX_RETRIES,
+            read=False,
+            status=settings.OUTBOUND_MAX_RETRIES,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'HEAD', 'POST'}),
+            backoff_factor=settings.OUTBOUND_RETRY_BACKOFF,
+            raise_on_status=False,
+            # A long Retry-After would hold the caller past its deadline.
+            respect_retry_after_header=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.OUTBOUND_POOL_SIZE, max_retries=retries)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _host_state(self, host):
+        with self.lock:
+            if host not in self.sessions:
+                self.sessions[host] = self._new_session()
+                self.breakers[host] = CircuitBreaker(
+                    settings.OUTBOUND_BREAKER_THRESHOLD, settings.OUTBOUND_BREAKER_RESET
+                )
+            return self.sessions[host], self.breakers[host]
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        Sends the request through the host's session and returns the
+        response, whatever its status. Raises CircuitOpen while the host's
+        circuit is open, and requests' exceptions for failed calls.
+        """
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+        endpoint = f'{parts.netloc}{parts.path}'
+        session, breaker = self._host_state(host)
+
+        if not breaker.allow():
+            self.stats.record(endpoint, 'circuit_open')
+            raise CircuitOpen(f"{parts.netloc} is failing; not calling it for now.")
+
+        if timeout is None:
+            timeout = (settings.OUTBOUND_CONNECT_TIMEOUT, settings.OUTBOUND_READ_TIMEOUT)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure()
+            outcome = 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection_error'
+            self.stats.record(endpoint, outcome, time.perf_counter() - started)
+            raise
+        else:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                # 4xx answers are the caller's problem, not the host's.
+                breaker.record_success()
+        finally:
+            # Whatever the call raised, a half-open circuit must not keep
+            # waiting for a trial call that will never report back.
+            breaker.end_trial()
+        self.stats.record(endpoint, f'{response.status_code // 100}xx', time.perf_counter() - started)
+        return response
+
+    def circuits(self):
+        with self.lock:
+            breakers = dict(self.breakers)
+        return {host: breaker.snapshot() for host, breaker in breakers.items()}
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            self.breakers.clear()
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """The process-wide OutboundClient."""
+    return OutboundClient()
+
+
+def get(url, **kwargs):
+    return get_client().request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_client().request('POST', url, **kwargs)
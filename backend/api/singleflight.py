@@ -0,0 +1,141 @@
+#
+# File: api/singleflight.py
+#
+# Collapses concurrent identical calls into one. While a call for a key is
+# running, other callers asking for the same key wait for it and share its
+# result (or its exception) instead of making their own upstream request,
+# which is what happens to a popular food search during a traffic spike.
+#
+# Within a process the callers wait on the running call directly. With
+# SINGLE_FLIGHT_CACHE set to a cache alias shared by all processes (Redis,
+# Memcached, the database cache; not the default local-memory cache), the
+# leader of each process also takes a lock in that cache: processes that
+# find the key locked poll for the result the lock holder leaves there.
+# Results must be picklable for that. The result is stored under the lock
+# holder's token, which only the callers that saw the lock know, and
+# expires after SINGLE_FLIGHT_RESULT_TTL seconds: it is handed over to the
+# callers that waited, never served to later ones like a cache.
+#
+# Nobody waits longer than SINGLE_FLIGHT_TIMEOUT seconds: a caller whose
+# leader takes longer makes the call itself.
+#
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Seconds between two looks at the shared cache while another process holds the lock.
+POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """One running call per key; see the top of this file."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = Counter()
+
+    def do(self, key, func):
+        """
+        Returns (func(), shared): shared is True when the value came from
+        a call made for another caller.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(settings.SINGLE_FLIGHT_TIMEOUT):
+                self._count('shared')
+                if call.error is not None:
+                    raise call.error
+                return call.value, True
+            self._count('timed_out')
+            return func(), False
+
+        try:
+            call.value, shared = self._across_processes(key, func)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        self._count('shared' if shared else 'called')
+        return call.value, shared
+
+    def _across_processes(self, key, func):
+        if not settings.SINGLE_FLIGHT_CACHE:
+            return func(), False
+
+        cache = caches[settings.SINGLE_FLIGHT_CACHE]
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        lock_key = f'single-flight:lock:{digest}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.SINGLE_FLIGHT_TIMEOUT
+        waiting_on = None
+        while True:
+            holder = cache.get(lock_key)
+            if holder is None:
+                # The call waited for may have finished since the last look;
+                # its result is stored before its lock is released.
+                value = self._result(cache, digest, waiting_on)
+                if value is not _MISSING:
+                    return value, True
+                # The lock expires on its own if its holder dies.
+                if cache.add(lock_key, token, timeout=settings.SINGLE_FLIGHT_TIMEOUT):
+                    break
+                continue
+
+            waiting_on = holder
+            value = self._result(cache, digest, holder)
+            if value is not _MISSING:
+                return value, True
+            if time.monotonic() >= deadline:
+                self._count('timed_out')
+                return func(), False
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            value = func()
+            cache.set(f'single-flight:result:{digest}:{token}', value, timeout=settings.SINGLE_FLIGHT_RESULT_TTL)
+            return value, False
+        finally:
+            # Unless the lock expired and another process holds it by now.
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _result(self, cache, digest, token):
+        if token is None:
+            return _MISSING
+        return cache.get(f'single-flight:result:{digest}:{token}', _MISSING)
+
+    def _count(self, outcome):
+        with self.lock:
+            self.counters[outcome] += 1
+
+    def stats(self):
+        """Calls made, results shared with waiting callers, and waits given up."""
+        with self.lock:
+            return {outcome: self.counters[outcome] for outcome in ('called', 'shared', 'timed_out')}
+
+
+single_flight = SingleFlight()
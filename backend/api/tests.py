@@ -1,3 +1,378 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import JsonResponse
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.async_views import AsyncAPIView
+from api.management.commands.benchmark_startup import HEAVY_MODULES, PROBE
+from api.outbound import CircuitOpen, LatencyStats, OutboundClient
+from api.singleflight import SingleFlight
+from api.transactions import on_commit_once
+from daily_data.models import DailySteps, UserGoals, WaterIntake, WeightLog
+from meals.models import FoodItem, Meal, MealItem
+from meals.testing import StubFoodAPIServer
+from users.models import Profile
+from workouts.api_services import get_workout_calories
+from workouts.models import Workout
+
+
+class DashboardViewTests(TestCase):
+    # The token's user, their goals with the profile, the rollup range scan
+    # and the latest weight.
+    QUERY_BUDGET = 4
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='dashboard', password='secret-pass-123')
+        Profile.objects.create(user=self.user, weight=70, daily_calorie_intake=Decimal('2000'))
+        UserGoals.objects.create(user=self.user)
+        self.today = date(2025, 3, 10)
+
+        food = FoodItem.objects.create(name='Oats', calories=380, protein=13, carbs=67, fats=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            DailySteps.objects.create(user=self.user, date=self.today, step_count=5000)
+            WaterIntake.objects.create(user=self.user, date=self.today - timedelta(days=1), milliliters=1000)
+            WeightLog.objects.create(user=self.user, date=self.today - timedelta(days=20), weight_kg=Decimal('71.50'))
+            Workout.objects.create(user=self.user, date=self.today, description='run', calories_burned=Decimal('300'))
+            meal = Meal.objects.create(user=self.user, meal_type='breakfast', date=self.today)
+            MealItem.objects.create(meal=meal, food_item=food, quantity_g=Decimal('50'))
+
+        self.client = APIClient()
+        # A real access token, so the budget includes loading the user.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_snapshot_payload(self):
+        response = self.client.get('/api/dashboard/', {'date': self.today.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(data['meals']['total_calories'], '190.00')
+        self.assertEqual(data['meals']['remaining_calories'], '1810.00')
+        self.assertEqual(data['workouts']['total_calories_burned'], '300.00')
+        self.assertEqual(data['steps']['step_count'], 5000)
+        self.assertEqual(data['water']['milliliters'], 0)
+        self.assertEqual(data['weight']['weight_kg'], '71.50')
+        self.assertEqual(data['goals']['step_goal'], 8000)
+        self.assertEqual(len(data['weekly_trends']), 7)
+        self.assertEqual(data['weekly_trends'][-2]['water'], 4)
+        self.assertEqual(data['weekly_trends'][-1]['steps'], 5000)
+
+    def test_query_budget(self):
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get('/api/dashboard/', {'date': self.today.isoformat()})
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_budget_without_data(self):
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get('/api/dashboard/', {'date': '2020-01-01'})
+        self.assertEqual(response.json()['steps']['step_count'], 0)
+        self.assertIsNone(response.json()['weight'])
+
+    def test_missing_goals_are_created(self):
+        UserGoals.objects.filter(user=self.user).delete()
+        response = self.client.get('/api/dashboard/', {'date': self.today.isoformat()})
+        self.assertEqual(response.json()['goals']['step_goal'], 8000)
+        self.assertEqual(response.json()['meals']['total_calories'], '190.00')
+        self.assertTrue(UserGoals.objects.filter(user=self.user).exists())
+
+    def test_invalid_date(self):
+        response = self.client.get('/api/dashboard/', {'date': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_urlconf_does_not_import_heavy_libraries(self):
+        self.assertTrue({'groq', 'pandas', 'pyarrow'} <= set(HEAVY_MODULES))
+        # A fresh interpreter, since this one has imported them for other tests.
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(urlconf=settings.ROOT_URLCONF, heavy=HEAVY_MODULES)],
+            cwd=settings.BASE_DIR, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'fitness_project.settings'},
+            capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1])['heavy_modules'], [])
+
+
+class WhoAmIView(AsyncAPIView):
+    async def get(self, request):
+        return JsonResponse({'username': request.user.username})
+
+    async def post(self, request):
+        return JsonResponse({'data': self.get_json(request)})
+
+
+class AsyncAPIViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='async', password='secret-pass-123')
+        self.factory = AsyncRequestFactory()
+        self.view = WhoAmIView.as_view()
+
+    def credentials(self, token=None):
+        return {'headers': {'Authorization': f'Bearer {token or AccessToken.for_user(self.user)}'}}
+
+    async def test_missing_credentials(self):
+        response = await self.view(self.factory.get('/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(json.loads(response.content), {'detail': 'Authentication credentials were not provided.'})
+
+    async def test_invalid_token(self):
+        for token in ('not-a-token', str(AccessToken.for_user(self.user))[:-2] + 'xx'):
+            with self.subTest(token=token):
+                response = await self.view(self.factory.get('/', **self.credentials(token)))
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(json.loads(response.content)['detail']['code'], 'token_not_valid')
+
+    async def test_inactive_user(self):
+        token = AccessToken.for_user(self.user)
+        await User.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        response = await self.view(self.factory.get('/', **self.credentials(token)))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_authenticated_request(self):
+        response = await self.view(self.factory.get('/', **self.credentials()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'username': 'async'})
+
+        # Only JSON objects are accepted as bodies.
+        for body, data in [('{"a": 1}', {'a': 1}), ('[1]', None), ('{', None), ('', {})]:
+            request = self.factory.post('/', body, content_type='application/json', **self.credentials())
+            response = await self.view(request)
+            self.assertEqual(json.loads(response.content), {'data': data})
+
+
+class OnCommitOnceTests(TestCase):
+    def test_runs_once_per_key_at_commit(self):
+        calls = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for key in ('a', 'b', 'a', 'a'):
+                on_commit_once(key, lambda key=key: calls.append(key))
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ['a', 'b'])
+
+        # A new transaction schedules the key again.
+        with self.captureOnCommitCallbacks(execute=True):
+            on_commit_once('a', lambda: calls.append('a'))
+        self.assertEqual(calls, ['a', 'b', 'a'])
+
+    def test_rolled_back_savepoint_keeps_later_registrations(self):
+        calls = []
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    on_commit_once('a', lambda: calls.append('rolled back'))
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            on_commit_once('a', lambda: calls.append('kept'))
+            on_commit_once('a', lambda: calls.append('duplicate'))
+        self.assertEqual(calls, ['kept'])
+
+
+@override_settings(
+    OUTBOUND_MAX_RETRIES=2, OUTBOUND_RETRY_BACKOFF=0, OUTBOUND_BREAKER_THRESHOLD=3, OUTBOUND_BREAKER_RESET=0.2,
+    OUTBOUND_CONNECT_TIMEOUT=1, OUTBOUND_READ_TIMEOUT=1,
+)
+class OutboundClientTests(TestCase):
+    def setUp(self):
+        self.server = StubFoodAPIServer({'ok': True}).__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.client = OutboundClient(stats=LatencyStats())
+        self.addCleanup(self.client.close)
+
+    def endpoint(self):
+        return self.server.url.removeprefix('http://').rstrip('/') + '/'
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.assertEqual(self.client.request('GET', self.server.url).json(), {'ok': True})
+        self.client.request('POST', self.server.url, json={'query': 'salmon'})
+        self.assertEqual((self.server.requests, self.server.connections), (6, 1))
+
+        stats = self.client.stats.snapshot()[self.endpoint()]
+        self.assertEqual((stats['calls'], stats['outcomes']), (6, {'2xx': 6}))
+
+    def test_unavailable_answers_are_retried_a_bounded_number_of_times(self):
+        self.server.status = 503
+        response = self.client.request('POST', self.server.url, json={})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.requests, 3)
+
+        # Other errors are returned at once.
+        self.server.requests, self.server.status = 0, 500
+        self.assertEqual(self.client.request('GET', self.server.url).status_code, 500)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_read_timeouts_are_not_retried(self):
+        self.server.latency = 0.3
+        with self.assertRaises(requests.Timeout):
+            self.client.request('GET', self.server.url, timeout=(1, 0.1))
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(self.client.stats.snapshot()[self.endpoint()]['outcomes'], {'timeout': 1})
+
+    def test_circuit_opens_and_recovers(self):
+        self.server.status = 500
+        for _ in range(3):
+            self.client.request('GET', self.server.url)
+        with self.assertRaises(CircuitOpen):
+            self.client.request('GET', self.server.url)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.client.circuits()[self.server.url.rstrip('/')]['state'], 'open')
+
+        # After the reset timeout one trial call goes through; a failure reopens the circuit.
+        time.sleep(0.25)
+        self.client.request('GET', self.server.url)
+        with self.assertRaises(CircuitOpen):
+            self.client.request('GET', self.server.url)
+
+        time.sleep(0.25)
+        self.server.status = 200
+        self.client.request('GET', self.server.url)
+        self.client.request('GET', self.server.url)
+        self.assertEqual(self.server.requests, 6)
+        self.assertEqual(self.client.circuits()[self.server.url.rstrip('/')]['state'], 'closed')
+
+    def test_unexpected_error_in_the_trial_call_frees_the_trial(self):
+        self.server.status = 500
+        for _ in range(3):
+            self.client.request('GET', self.server.url)
+        time.sleep(0.25)
+
+        # Not a RequestException, so neither a success nor a failure is recorded.
+        with self.assertRaises(TypeError):
+            self.client.request('GET', self.server.url, files=object())
+        breaker = self.client.breakers[self.server.url.rstrip('/')]
+        self.assertFalse(breaker.trial_running)
+
+        self.server.status = 200
+        self.assertEqual(self.client.request('GET', self.server.url).status_code, 200)
+        self.assertEqual(self.client.circuits()[self.server.url.rstrip('/')]['state'], 'closed')
+
+    def test_client_errors_do_not_open_the_circuit(self):
+        self.server.status = 404
+        for _ in range(5):
+            self.assertEqual(self.client.request('GET', self.server.url).status_code, 404)
+
+    def test_workout_calories_through_the_client(self):
+        self.server.payload = {'exercises': [{'nf_calories': 200}, {'nf_calories': 50.5}]}
+        with override_settings(NUTRITIONIX_EXERCISE_URL=self.server.url), \
+                mock.patch('api.outbound.get_client', return_value=self.client):
+            self.assertEqual(get_workout_calories('ran 30 min and swam', 70, 175, 30, 'male'), 250.5)
+
+            self.server.status = 500
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    get_workout_calories('ran', 70, 175, 30, 'male')
+            with self.assertRaisesMessage(Exception, 'unavailable right now'):
+                get_workout_calories('ran', 70, 175, 30, 'male')
+
+    def test_metrics_endpoint_is_for_staff(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='member'))
+        self.assertEqual(client.get('/api/outbound-metrics/').status_code, 403)
+
+        client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+        data = client.get('/api/outbound-metrics/').json()
+        self.assertEqual(set(data), {'endpoints', 'circuits', 'single_flight'})
+
+
+@override_settings(SINGLE_FLIGHT_CACHE='', SINGLE_FLIGHT_TIMEOUT=5, SINGLE_FLIGHT_RESULT_TTL=5)
+class SingleFlightTests(TestCase):
+    def slow_call(self, release, value='answer'):
+        calls = []
+
+        def func():
+            calls.append(1)
+            release.wait(5)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return func, calls
+
+    def test_concurrent_callers_share_one_call(self):
+        flight, release = SingleFlight(), threading.Event()
+        func, calls = self.slow_call(release)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(flight.do, 'salmon', func) for _ in range(5)]
+            time.sleep(0.1)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([value for value, _ in results], ['answer'] * 5)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertEqual(flight.stats(), {'called': 1, 'shared': 4, 'timed_out': 0})
+
+        # The key is free again once the call is done.
+        self.assertEqual(flight.do('salmon', lambda: 'again'), ('again', False))
+
+    def test_errors_are_shared(self):
+        flight, release = SingleFlight(), threading.Event()
+        func, calls = self.slow_call(release, ValueError('upstream down'))
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(flight.do, 'salmon', func) for _ in range(3)]
+            time.sleep(0.1)
+            release.set()
+            for future in futures:
+                with self.assertRaisesMessage(ValueError, 'upstream down'):
+                    future.result()
+        self.assertEqual(len(calls), 1)
+
+    def test_waiters_give_up_after_the_timeout(self):
+        flight, release = SingleFlight(), threading.Event()
+        func, _ = self.slow_call(release)
+        with override_settings(SINGLE_FLIGHT_TIMEOUT=0.1), ThreadPoolExecutor(max_workers=1) as pool:
+            leader = pool.submit(flight.do, 'salmon', func)
+            time.sleep(0.05)
+            self.assertEqual(flight.do('salmon', lambda: 'own'), ('own', False))
+            release.set()
+            leader.result()
+        self.assertEqual(flight.stats()['timed_out'], 1)
+
+    @override_settings(SINGLE_FLIGHT_CACHE='default')
+    def test_processes_share_through_the_cache(self):
+        # Two instances stand in for two processes sharing one cache.
+        first, second, release = SingleFlight(), SingleFlight(), threading.Event()
+        func, calls = self.slow_call(release)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(first.do, 'cross-process salmon', func)
+            time.sleep(0.05)
+            follower = pool.submit(second.do, 'cross-process salmon', func)
+            time.sleep(0.1)
+            release.set()
+            self.assertEqual(leader.result(), ('answer', False))
+            self.assertEqual(follower.result(), ('answer', True))
+        self.assertEqual(len(calls), 1)
+
+        # The result was handed to the waiting process, not cached for later callers.
+        self.assertEqual(second.do('cross-process salmon', lambda: 'fresh'), ('fresh', False))
+        self.assertEqual(first.do('cross-process salmon', lambda: 'fresher'), ('fresher', False))
+
+    @override_settings(SINGLE_FLIGHT_CACHE='default')
+    def test_failed_call_lets_a_waiting_process_call_itself(self):
+        first, second, release = SingleFlight(), SingleFlight(), threading.Event()
+        func, _ = self.slow_call(release, ValueError('upstream down'))
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(first.do, 'failing salmon', func)
+            time.sleep(0.05)
+            follower = pool.submit(second.do, 'failing salmon', lambda: 'own')
+            time.sleep(0.1)
+            release.set()
+            with self.assertRaises(ValueError):
+                leader.result()
+            # Without waiting for SINGLE_FLIGHT_TIMEOUT.
+            self.assertEqual(follower.result(timeout=1), ('own', False))
@@ -0,0 +1,38 @@
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+class _Pending:
+    """Shared by every callback registered for one key in one transaction."""
+    ran = False
+
+
+def on_commit_once(key, func, using=None):
+    """
+    Works like transaction.on_commit(), but runs `func` at most once per
+    `key` for the current transaction, so saving many related rows only
+    schedules one follow-up job. Outside of an atomic block it runs at once.
+
+    Every call registers its own callback, and the callbacks of one key
+    share a flag: the first one to run calls `func`, the others do nothing.
+    A rolled back savepoint therefore only drops its own callbacks, never
+    the job of the rows saved after it.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if not connection.in_atomic_block:
+        func()
+        return
+
+    pending = connection.__dict__.setdefault('_on_commit_once', {})
+    state = pending.get(key)
+    if state is None or state.ran:
+        state = pending[key] = _Pending()
+
+    def callback():
+        if state.ran:
+            return
+        state.ran = True
+        if pending.get(key) is state:
+            del pending[key]
+        func()
+
+    transaction.on_commit(callback, using=using)
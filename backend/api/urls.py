@@ -26,6 +26,7 @@ path('profile/', UserProfileView.as_view(), name='user-profile'),
 # In api/urls.py
 
 from django.urls import path, include
+from .views import DashboardView, OutboundMetricsView
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -43,5 +44,7 @@ urlpatterns = [
     path('daily-data/', include('daily_data.urls')),
     path('chatbot/', include('chatbot.urls')),
     path('analysis/', include('analysis.urls')),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('outbound-metrics/', OutboundMetricsView.as_view(), name='outbound-metrics'),
 
 ]
\ No newline at end of file
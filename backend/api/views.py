@@ -1,3 +1,119 @@
-from django.shortcuts import render
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your views here.
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from analysis.engine import DailySeries
+from analysis.models import DailyRollup
+from analysis.rollups import ROLLUP_FIELDS
+from api.outbound import get_client, outbound_stats
+from api.singleflight import single_flight
+from daily_data.models import UserGoals, WeightLog
+from daily_data.serializers import UserGoalsSerializer, WeightLogSerializer
+from meals.serializers import DailyCalorieSerializer
+from meals.utils import daily_calorie_summary
+from users.models import Profile
+from users.serializers import ProfileSerializer
+from workouts.serializers import DailyWorkoutSummarySerializer
+
+
+def _decimal_str(value):
+    """Formats a stored decimal the way the DRF serializers render it, e.g. '40.00'."""
+    return f"{value or Decimal('0.00'):.2f}"
+
+
+class DashboardView(APIView):
+    """
+    Everything the dashboard shows for one day in a single response: the
+    profile, goals, calorie tracker, workout summary, steps, water, sleep,
+    latest weight and the 7-day trend ending on that day.
+    Accepts an optional `date` query parameter (YYYY-MM-DD), default today.
+
+    The daily tip is not included, since it calls the LLM and is only
+    generated when the user asks for it.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        request_date_str = request.query_params.get('date', None)
+        try:
+            request_date = date.fromisoformat(request_date_str) if request_date_str else date.today()
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The authentication already loaded the user; one more query brings
+        # their goals and profile.
+        user = request.user
+        goals = UserGoals.objects.select_related('user__profile').filter(user=user).first()
+        if goals is None:
+            goals = UserGoals.objects.create(user=user)
+        try:
+            profile = goals.user.profile
+        except Profile.DoesNotExist:
+            profile = None
+
+        # One range scan of the daily rollups covers the trend and today's totals.
+        start_date = request_date - timedelta(days=6)
+        rollups = list(
+            DailyRollup.objects.filter(
+                user=user, date__range=[start_date, request_date]
+            ).values_list('date', *ROLLUP_FIELDS)
+        )
+        series = DailySeries.from_rows(start_date, request_date, rollups, ROLLUP_FIELDS)
+        today = dict(zip(ROLLUP_FIELDS, rollups[-1][1:])) if rollups and rollups[-1][0] == request_date else {}
+
+        latest_weight = WeightLog.objects.filter(user=user, date__lte=request_date).order_by('-date').first()
+
+        meals = None
+        if profile is not None and profile.daily_calorie_intake is not None:
+            totals = {
+                'total_calories': today.get('calories_consumed'),
+                'total_protein': today.get('protein_g'),
+                'total_carbs': today.get('carbs_g'),
+                'total_fats': today.get('fats_g'),
+            }
+            meals = DailyCalorieSerializer(
+                daily_calorie_summary(request_date, totals, profile.daily_calorie_intake)
+            ).data
+
+        workouts = DailyWorkoutSummarySerializer({
+            'date': request_date,
+            'total_calories_burned': today.get('calories_from_workouts') or Decimal('0.00'),
+        }).data
+
+        water_ml = today.get('water_intake_ml', 0)
+        response_data = {
+            'date': request_date,
+            'profile': ProfileSerializer(profile, context={'request': request}).data if profile else None,
+            'goals': UserGoalsSerializer(goals).data,
+            'meals': meals,
+            'workouts': workouts,
+            'steps': {
+                'step_count': today.get('daily_steps', 0),
+                'calories_burned': _decimal_str(today.get('calories_from_steps')),
+            },
+            'water': {'milliliters': water_ml, 'glasses': round(water_ml / 250, 1)},
+            'sleep': {'duration_hours': _decimal_str(today.get('sleep_hours'))},
+            'weight': WeightLogSerializer(latest_weight).data if latest_weight else None,
+            'weekly_trends': series.weekly_trend_records(),
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+class OutboundMetricsView(APIView):
+    """
+    Latency and outcome counters per third-party endpoint, the state of each
+    host's circuit breaker and the single-flight counters, in this process,
+    for staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'endpoints': outbound_stats.snapshot(),
+            'circuits': get_client().circuits(),
+            'single_flight': single_flight.stats(),
+        })
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import Conversation
+from .models import Conversation, ConversationSummary
 # Register your models here.
-admin.site.register(Conversation)
\ No newline at end of file
+admin.site.register(Conversation)
+admin.site.register(ConversationSummary)
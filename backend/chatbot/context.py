@@ -0,0 +1,161 @@
+#
+# File: chatbot/context.py
+#
+# Builds the chat prompt with a bounded size: the system message, the
+# user's rolling ConversationSummary, and as many of the last
+# CHAT_HISTORY_TURNS exchanges as fit in CHAT_CONTEXT_TOKEN_BUDGET.
+#
+# Exchanges older than the recent turns are folded into the summary by a
+# background thread after each reply, so the prompt stays the same size
+# however long the conversation grows.
+#
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+from users.models import Profile
+from .llm import get_gateway
+from .models import Conversation, ConversationSummary
+
+# Exchanges folded into the summary per LLM call.
+SUMMARY_BATCH_TURNS = 20
+
+SUMMARY_LOCK_KEY = 'chatbot:summary-lock:{user_id}'
+SUMMARY_LOCK_TIMEOUT = 120
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the memory of a conversation between a user and their AI nutritionist. "
+    "Merge the new exchanges into the existing summary. Keep the user's goals, preferences, "
+    "constraints, reported progress and the advice already given. Drop small talk. "
+    "Reply with the updated summary only, in at most 150 words."
+)
+
+
+def estimate_tokens(text):
+    """A rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def build_system_message(profile):
+    """The system prompt, personalised when the user has a profile."""
+    if profile is None:
+        return "You are a helpful AI nutritionist. Answer health and nutrition questions concisely and accurately."
+    return (
+        f"You are a helpful AI nutritionist for a user who wants to "
+        f"achieve a fitness goal of: {profile.weight_goal}. "
+        f"Their body stats are: Height - {profile.height} cm, "
+        f"Weight - {profile.weight} kg. Based on this, provide helpful "
+        f"and concise nutrition advice. Refer to their goals in your responses."
+    )
+
+
+def build_messages(profile, summary, conversation_history, user_message, token_budget=None):
+    """
+    Assembles the completion messages. conversation_history holds the most
+    recent turns, newest first; the oldest of them are dropped once the
+    token budget is used up. The system message, summary and new message
+    are always kept.
+    """
+    if token_budget is None:
+        token_budget = settings.CHAT_CONTEXT_TOKEN_BUDGET
+
+    head = [{"role": "system", "content": build_system_message(profile)}]
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    tail = [{"role": "user", "content": user_message}]
+    remaining = token_budget - sum(estimate_tokens(m["content"]) for m in head + tail)
+
+    turns = []
+    for convo in conversation_history:
+        cost = estimate_tokens(convo.user_message) + estimate_tokens(convo.ai_response)
+        if cost > remaining:
+            break
+        remaining -= cost
+        turns[:0] = [
+            {"role": "user", "content": convo.user_message},
+            {"role": "assistant", "content": convo.ai_response},
+        ]
+    return head + turns + tail
+
+
+def _recent_turns(user):
+    return Conversation.objects.filter(user=user).order_by('-timestamp', '-id')[:settings.CHAT_HISTORY_TURNS]
+
+
+def load_chat_messages(user, user_message):
+    """Builds the completion messages from the user's profile, summary and recent turns."""
+    profile = Profile.objects.filter(user=user).first()
+    summary = ConversationSummary.objects.filter(user=user).values_list('summary', flat=True).first()
+    return build_messages(profile, summary, list(_recent_turns(user)), user_message)
+
+
+async def aload_chat_messages(user, user_message):
+    """Async version of load_chat_messages()."""
+    profile = await Profile.objects.filter(user=user).afirst()
+    summary = await ConversationSummary.objects.filter(user=user).values_list('summary', flat=True).afirst()
+    return build_messages(profile, summary, [convo async for convo in _recent_turns(user)], user_message)
+
+
+def _unsummarized_turns(user_id, summary):
+    """The oldest turns not yet in the summary that have left the recent window."""
+    recent_ids = Conversation.objects.filter(user_id=user_id).order_by(
+        '-timestamp', '-id'
+    ).values_list('id', flat=True)[:settings.CHAT_HISTORY_TURNS]
+
+    turns = Conversation.objects.filter(user_id=user_id).exclude(id__in=list(recent_ids))
+    if summary.summarized_until is not None:
+        turns = turns.filter(
+            Q(timestamp__gt=summary.summarized_until)
+            | Q(timestamp=summary.summarized_until, id__gt=summary.summarized_through_id)
+        )
+    return list(turns.order_by('timestamp', 'id')[:SUMMARY_BATCH_TURNS])
+
+
+def update_summary(user_id):
+    """
+    Folds the turns that have left the recent window into the user's
+    summary, one batch per LLM call. Returns the number of turns folded.
+    """
+    summary, _ = ConversationSummary.objects.get_or_create(user_id=user_id)
+    folded = 0
+    while turns := _unsummarized_turns(user_id, summary):
+        exchanges = "\n".join(f"User: {t.user_message}\nAssistant: {t.ai_response}" for t in turns)
+        summary.summary = get_gateway().complete([
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": f"Existing summary:\n{summary.summary or '(none)'}\n\nNew exchanges:\n{exchanges}"},
+        ]).strip()
+        summary.summarized_until, summary.summarized_through_id = turns[-1].timestamp, turns[-1].id
+        summary.save()
+        folded += len(turns)
+    return folded
+
+
+def schedule_summary_update(user_id):
+    """
+    Runs update_summary() in a daemon thread, at most one per user at a
+    time. Safe to call from async views, as it never blocks on the LLM.
+    """
+    lock_key = SUMMARY_LOCK_KEY.format(user_id=user_id)
+    if not cache.add(lock_key, True, timeout=SUMMARY_LOCK_TIMEOUT):
+        return None
+
+    def run():
+        try:
+            update_summary(user_id)
+        except Exception:
+            # The summary lags behind until the next exchange retries.
+            logger.exception("Updating the conversation summary of user %s failed.", user_id)
+        finally:
+            cache.delete(lock_key)
+            connection.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,392 @@
+#
+# File: chatbot/llm.py
+#
+# The LLM gateway shared by the chatbot, the conversation summaries and the
+# daily tip. One gateway per process owns a keep-alive connection pool and
+# enforces:
+#
+#   - at most LLM_MAX_CONCURRENCY completions in flight, sync and async
+#     calls together; further callers queue for up to LLM_QUEUE_TIMEOUT
+#     seconds and then get LLMBusy,
+#   - connect and read timeouts,
+#   - up to LLM_MAX_RETRIES retries of connection errors, timeouts, rate
+#     limits and 5xx responses, with full-jitter exponential backoff,
+#
+# and records latency, queue depth and error counts (see LLMMetrics).
+#
+# Any OpenAI-compatible server works; point GROQ_BASE_URL at it. Tests use
+# the fake server in chatbot/testing.py.
+#
+
+import asyncio
+import itertools
+import random
+import statistics
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+
+MODEL = 'llama-3.1-8b-instant'
+
+# Completion latencies kept for the percentiles in LLMMetrics.snapshot().
+LATENCY_SAMPLES = 1000
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMBusy(LLMError):
+    """No concurrency slot became free within the queue timeout."""
+
+
+def is_retryable(exc):
+    """Connection errors and timeouts, rate limits and server errors are worth retrying."""
+    from groq import APIConnectionError, InternalServerError, RateLimitError
+
+    return isinstance(exc, (APIConnectionError, RateLimitError, InternalServerError))
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+        return True
+
+
+class _LoopWaiter:
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def grant(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The waiter's event loop is closed; nobody is left to take the slot.
+            return False
+        self.granted = True
+        return True
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """
+    A counting semaphore shared by threads and event loops, so the sync and
+    async calls of a gateway draw from one pool of slots. Waiters are served
+    in arrival order; a released slot is handed to the oldest one directly.
+    """
+
+    def __init__(self, slots):
+        self.lock = threading.Lock()
+        self.free = slots
+        self.waiters = deque()
+
+    def _take_or_wait(self, waiter):
+        with self.lock:
+            if self.free and not self.waiters:
+                self.free -= 1
+                return True
+            self.waiters.append(waiter)
+            return False
+
+    def _give_up(self, waiter):
+        """Leaves the queue. Returns True if the slot was granted meanwhile."""
+        with self.lock:
+            if waiter.granted:
+                return True
+            self.waiters.remove(waiter)
+            return False
+
+    def acquire(self, timeout):
+        """Waits up to `timeout` seconds for a slot. Returns whether one was taken."""
+        waiter = _ThreadWaiter()
+        if self._take_or_wait(waiter) or waiter.event.wait(timeout):
+            return True
+        return self._give_up(waiter)
+
+    async def aacquire(self, timeout):
+        """Async version of acquire(); does not block the event loop."""
+        waiter = _LoopWaiter(asyncio.get_running_loop())
+        if self._take_or_wait(waiter):
+            return True
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        with self.lock:
+            while self.waiters:
+                if self.waiters.popleft().grant():
+                    return
+            self.free += 1
+
+
+class LLMMetrics:
+    """Thread-safe counters and latency samples of one gateway."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = Counter()
+        self.retries = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def enqueued(self):
+        with self.lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def dequeued(self, admitted):
+        with self.lock:
+            self.queue_depth -= 1
+            if not admitted:
+                self.rejected += 1
+
+    def retried(self):
+        with self.lock:
+            self.retries += 1
+
+    @contextmanager
+    def timed(self):
+        """Counts the wrapped call as in flight and records its latency and any error."""
+        with self.lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.requests += 1
+                self.latencies.append(time.perf_counter() - started)
+                if error is not None:
+                    self.errors[error] += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            errors = dict(self.errors)
+            snapshot = {
+                'requests': self.requests,
+                'errors': sum(errors.values()),
+                'errors_by_type': errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'in_flight': self.in_flight,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+            }
+
+        def percentile(fraction):
+            return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000, 1)
+
+        snapshot['latency_ms'] = {
+            'p50': round(statistics.median(latencies) * 1000, 1),
+            'p95': percentile(0.95),
+            'max': round(latencies[-1] * 1000, 1),
+        } if latencies else None
+        return snapshot
+
+
+class LLMGateway:
+    """
+    Chat completions with pooling, a concurrency limit, timeouts, retries
+    and metrics. Every argument defaults to the matching LLM_* or GROQ_*
+    setting.
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_concurrency=None, queue_timeout=None,
+                 connect_timeout=None, read_timeout=None, max_retries=None, retry_backoff=None):
+        self.api_key = api_key or settings.GROQ_API_KEY
+        self.base_url = base_url or settings.GROQ_BASE_URL
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.queue_timeout = settings.LLM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.connect_timeout = connect_timeout or settings.LLM_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or settings.LLM_READ_TIMEOUT
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = settings.LLM_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+
+        self.metrics = LLMMetrics()
+        # One limit for the threads and event loops of the process.
+        self._slots = ConcurrencyLimiter(self.max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+        # httpx async clients are bound to one event loop.
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _client_options(self):
+        import httpx
+
+        return {
+            'api_key': self.api_key,
+            'base_url': self.base_url,
+            # Retries are done here, so they share the slot, backoff and metrics.
+            'max_retries': 0,
+            'timeout': httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+        }
+
+    def _limits(self):
+        import httpx
+
+        return httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+
+    @property
+    def client(self):
+        """The Groq client of the process, created on first use."""
+        with self._client_lock:
+            if self._client is None:
+                from groq import DefaultHttpxClient, Groq
+
+                self._client = Groq(**self._client_options(), http_client=DefaultHttpxClient(limits=self._limits()))
+            return self._client
+
+    def async_client(self):
+        """The AsyncGroq client of the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+            client = self._async_clients[loop] = AsyncGroq(
+                **self._client_options(), http_client=DefaultAsyncHttpxClient(limits=self._limits())
+            )
+        return client
+
+    def _backoff(self, attempt):
+        """Full jitter: a random delay up to the exponential backoff."""
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    # --- sync API ---
+
+    @contextmanager
+    def _slot(self):
+        self.metrics.enqueued()
+        admitted = self._slots.acquire(timeout=self.queue_timeout)
+        self.metrics.dequeued(admitted)
+        if not admitted:
+            raise LLMBusy(f"No LLM slot became free within {self.queue_timeout}s.")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _with_retries(self, create):
+        for attempt in itertools.count():
+            try:
+                return create()
+            except Exception as exc:
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    raise
+                self.metrics.retried()
+                time.sleep(self._backoff(attempt))
+
+    def complete(self, messages, model=MODEL, **options):
+        """Returns the text of a chat completion."""
+        with self._slot(), self.metrics.timed():
+            completion = self._with_retries(
+                lambda: self.client.chat.completions.create(messages=messages, model=model, **options)
+            )
+        return completion.choices[0].message.content
+
+    def stream(self, messages, model=MODEL, **options):
+        """
+        Yields the text chunks of a streamed chat completion. Only opening the
+        stream is retried; the slot is held until the stream is exhausted.
+        """
+        with self._slot(), self.metrics.timed():
+            stream = self._with_retries(
+                lambda: self.client.chat.completions.create(messages=messages, model=model, stream=True, **options)
+            )
+            # Closes the response if the consumer stops early, rather than
+            # leaving the connection to the garbage collector.
+            with stream:
+                for chunk in stream:
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    if content:
+                        yield content
+
+    # --- async API ---
+
+    @asynccontextmanager
+    async def _aslot(self):
+        self.metrics.enqueued()
+        try:
+            admitted = await self._slots.aacquire(self.queue_timeout)
+        except asyncio.CancelledError:
+            self.metrics.dequeued(True)
+            raise
+        self.metrics.dequeued(admitted)
+        if not admitted:
+            raise LLMBusy(f"No LLM slot became free within {self.queue_timeout}s.")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def _awith_retries(self, create):
+        for attempt in itertools.count():
+            try:
+                return await create()
+            except Exception as exc:
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    raise
+                self.metrics.retried()
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def acomplete(self, messages, model=MODEL, **options):
+        """Async version of complete()."""
+        async with self._aslot():
+            with self.metrics.timed():
+                completion = await self._awith_retries(
+                    lambda: self.async_client().chat.completions.create(messages=messages, model=model, **options)
+                )
+        return completion.choices[0].message.content
+
+    async def astream(self, messages, model=MODEL, **options):
+        """Async version of stream()."""
+        async with self._aslot():
+            with self.metrics.timed():
+                stream = await self._awith_retries(
+                    lambda: self.async_client().chat.completions.create(
+                        messages=messages, model=model, stream=True, **options
+                    )
+                )
+                async with stream:
+                    async for chunk in stream:
+                        content = chunk.choices[0].delta.content if chunk.choices else None
+                        if content:
+                            yield content
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    """Returns the process-wide gateway, configured from settings."""
+    return LLMGateway()
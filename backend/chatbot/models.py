@@ -10,5 +10,27 @@ class Conversation(models.Model):
     ai_response = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serves the keyset-paginated history, newest first; see pagination.py.
+            models.Index(fields=['user', 'timestamp', 'id'], name='chat_user_timestamp_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversation with {self.user.username} at {self.timestamp}"
+
+class ConversationSummary(models.Model):
+    """
+    A rolling summary of a user's older conversation turns, sent to the
+    model in place of the raw history. It covers every Conversation up to
+    and including (summarized_until, summarized_through_id) and is extended
+    in the background after each exchange; see context.py.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='conversation_summary')
+    summary = models.TextField(blank=True)
+    summarized_until = models.DateTimeField(null=True, blank=True)
+    summarized_through_id = models.PositiveBigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"Conversation with {self.user.username} at {self.timestamp}"
\ No newline at end of file
+        return f"Conversation summary of {self.user.username}"
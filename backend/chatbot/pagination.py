@@ -0,0 +1,70 @@
+#
+# File: chatbot/pagination.py
+#
+# Keyset pagination of a user's conversation history. Pages are read
+# backwards from the newest message, and the cursor holds the
+# (timestamp, id) of the oldest row of the previous page. Each page is one
+# range scan on the (user, timestamp, id) index, however deep the user
+# scrolls.
+#
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Conversation
+from .serializers import ConversationSerializer
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+def encode_cursor(conversation):
+    raw = f'{conversation.timestamp.isoformat()}|{conversation.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns the (timestamp, id) pair of a cursor. Raises InvalidPage."""
+    try:
+        timestamp, _, pk = base64.urlsafe_b64decode(cursor.encode()).decode().partition('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeError) as exc:
+        raise InvalidPage(cursor) from exc
+
+
+def page_queryset(user, params):
+    """
+    Returns (queryset, page_size) for the `before` and `limit` query
+    parameters. The queryset yields at most page_size + 1 rows, newest first;
+    the extra row only tells whether older history exists.
+    """
+    try:
+        page_size = min(max(int(params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError as exc:
+        raise InvalidPage(params.get('limit')) from exc
+
+    queryset = Conversation.objects.filter(user=user)
+    if params.get('before'):
+        timestamp, pk = decode_cursor(params['before'])
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+    return queryset.order_by('-timestamp', '-id')[:page_size + 1], page_size
+
+
+def build_page(rows, page_size):
+    """
+    The response payload: the page's messages in chronological order and
+    the cursor of the next, older page (None once the history is exhausted).
+    """
+    rows = list(rows)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        'results': ConversationSerializer(reversed(rows), many=True).data,
+        'next': encode_cursor(rows[-1]) if has_more else None,
+    }
@@ -0,0 +1,127 @@
+#
+# File: chatbot/testing.py
+#
+# A local fake of an OpenAI-compatible chat completions server, for tests
+# and benchmarks of the LLM gateway. It speaks HTTP/1.1 with keep-alive,
+# answers after a configurable delay, can fail the first requests or every
+# request with a given status, streams replies as server-sent events when
+# asked to, and counts requests, connections and peak concurrency.
+#
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    Use as a context manager, or call start() and shutdown(). Every
+    attribute may be changed between requests.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, reply='Drink some water.', latency=0.0, fail_first=0, status=200):
+        super().__init__(('127.0.0.1', 0), FakeLLMHandler)
+        self.reply = reply
+        self.latency = latency
+        # The first fail_first requests get a 500.
+        self.fail_first = fail_first
+        # Every other request gets this status; anything but 200 is an error.
+        self.status = status
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        # Set once a request is being answered, for tests to wait on.
+        self.request_started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = self.connections = self.peak_in_flight = 0
+            self.request_started.clear()
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with server.lock:
+            server.requests += 1
+            number = server.requests
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        server.request_started.set()
+        try:
+            time.sleep(server.latency)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+        status = 500 if number <= server.fail_first else server.status
+        if status != 200:
+            self.send_json(status, {'error': {'message': f'Fake failure {status}', 'type': 'fake_error'}})
+        elif request.get('stream'):
+            self.send_stream(request.get('model', 'fake'))
+        else:
+            self.send_json(200, {
+                'id': f'fake-{number}', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': server.reply}}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+            })
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, model):
+        # One chunk per word; without a Content-Length the connection ends the body.
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        words = self.server.reply.split(' ')
+        for index, word in enumerate(words):
+            chunk = {
+                'id': 'fake-stream', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': None,
+                             'delta': {'content': word if index == 0 else f' {word}'}}],
+            }
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+        self.wfile.write(b'data: [DONE]\n\n')
+
+    def log_message(self, format, *args):
+        pass
@@ -1,3 +1,527 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import models
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from groq import BadRequestError, InternalServerError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .views import SSE_OPEN, AsyncChatAPIView
+from .context import build_messages, estimate_tokens, schedule_summary_update, update_summary
+from .llm import ConcurrencyLimiter, LLMBusy, LLMGateway, get_gateway
+from .models import Conversation, ConversationSummary
+from .pagination import InvalidPage, decode_cursor, encode_cursor
+from .testing import FakeLLMServer
+
+MESSAGES = [{'role': 'user', 'content': 'How much water should I drink?'}]
+
+
+class LLMGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeLLMServer().start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def gateway(self, **options):
+        options = {'api_key': 'fake', 'base_url': self.server.base_url, 'retry_backoff': 0.01, **options}
+        return LLMGateway(**options)
+
+    def test_complete_reuses_connection(self):
+        gateway = self.gateway()
+        for _ in range(3):
+            self.assertEqual(gateway.complete(MESSAGES), 'Drink some water.')
+
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.server.connections, 1)
+        snapshot = gateway.metrics.snapshot()
+        self.assertEqual(snapshot['requests'], 3)
+        self.assertEqual(snapshot['errors'], 0)
+        self.assertIsNotNone(snapshot['latency_ms'])
+
+    def test_retries_server_errors(self):
+        self.server.fail_first = 2
+        gateway = self.gateway(max_retries=2)
+
+        self.assertEqual(gateway.complete(MESSAGES), 'Drink some water.')
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(gateway.metrics.snapshot()['retries'], 2)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.fail_first = 5
+        gateway = self.gateway(max_retries=1)
+
+        with self.assertRaises(InternalServerError):
+            gateway.complete(MESSAGES)
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(gateway.metrics.snapshot()['errors_by_type'], {'InternalServerError': 1})
+
+    def test_does_not_retry_client_errors(self):
+        self.server.status = 400
+        gateway = self.gateway(max_retries=3)
+
+        with self.assertRaises(BadRequestError):
+            gateway.complete(MESSAGES)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_limits_concurrency(self):
+        self.server.latency = 0.1
+        gateway = self.gateway(max_concurrency=2)
+        threads = [threading.Thread(target=gateway.complete, args=(MESSAGES,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.server.requests, 6)
+        self.assertEqual(self.server.peak_in_flight, 2)
+        self.assertGreaterEqual(gateway.metrics.snapshot()['max_queue_depth'], 4)
+
+    def test_rejects_when_queue_times_out(self):
+        self.server.latency = 0.3
+        gateway = self.gateway(max_concurrency=1, queue_timeout=0.05)
+        holder = threading.Thread(target=gateway.complete, args=(MESSAGES,))
+        holder.start()
+        self.assertTrue(self.server.request_started.wait(timeout=5))
+
+        with self.assertRaises(LLMBusy):
+            gateway.complete(MESSAGES)
+        holder.join()
+        self.assertEqual(gateway.metrics.snapshot()['rejected'], 1)
+
+    def test_sync_and_async_calls_share_the_limit(self):
+        self.server.latency = 0.3
+        gateway = self.gateway(max_concurrency=1, queue_timeout=0.05)
+
+        # A thread holding the only slot makes an async call wait, and the other way round.
+        holder = threading.Thread(target=gateway.complete, args=(MESSAGES,))
+        holder.start()
+        self.assertTrue(self.server.request_started.wait(timeout=5))
+        with self.assertRaises(LLMBusy):
+            async_to_sync(gateway.acomplete)(MESSAGES)
+        holder.join()
+
+        self.server.reset_counters()
+        holder = threading.Thread(target=async_to_sync(gateway.acomplete), args=(MESSAGES,))
+        holder.start()
+        self.assertTrue(self.server.request_started.wait(timeout=5))
+        with self.assertRaises(LLMBusy):
+            gateway.complete(MESSAGES)
+        holder.join()
+        self.assertEqual(gateway.metrics.snapshot()['rejected'], 2)
+
+    def test_limit_holds_across_threads_and_event_loops(self):
+        self.server.latency = 0.1
+        gateway = self.gateway(max_concurrency=2)
+
+        async def several():
+            await asyncio.gather(*(gateway.acomplete(MESSAGES) for _ in range(3)))
+
+        threads = [threading.Thread(target=gateway.complete, args=(MESSAGES,)) for _ in range(3)]
+        threads += [threading.Thread(target=asyncio.run, args=(several(),)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.server.requests, 9)
+        self.assertEqual(self.server.peak_in_flight, 2)
+        self.assertEqual(gateway.metrics.snapshot()['rejected'], 0)
+
+    def test_stream(self):
+        self.server.reply = 'Eat more greens.'
+        self.assertEqual(''.join(self.gateway().stream(MESSAGES)), 'Eat more greens.')
+
+    def test_async_complete_and_stream(self):
+        gateway = self.gateway()
+
+        async def run():
+            reply = await gateway.acomplete(MESSAGES)
+            chunks = [chunk async for chunk in gateway.astream(MESSAGES)]
+            return reply, ''.join(chunks)
+
+        self.assertEqual(async_to_sync(run)(), ('Drink some water.', 'Drink some water.'))
+        self.assertEqual(gateway.metrics.snapshot()['requests'], 2)
+
+    def test_streams_closed_early_release_the_response(self):
+        self.server.reply = 'Eat more greens. ' * 100
+        gateway = self.gateway(max_concurrency=1)
+        opened = []
+
+        def remember(stream):
+            opened.append(stream)
+            return stream
+
+        create = gateway.client.chat.completions.create
+        with mock.patch.object(gateway.client.chat.completions, 'create', lambda **kwargs: remember(create(**kwargs))):
+            chunks = gateway.stream(MESSAGES)
+            self.assertEqual(next(chunks), 'Eat')
+            chunks.close()
+
+        async def run():
+            completions = gateway.async_client().chat.completions
+            acreate = completions.create
+
+            async def create_and_remember(**kwargs):
+                return remember(await acreate(**kwargs))
+
+            with mock.patch.object(completions, 'create', create_and_remember):
+                chunks = gateway.astream(MESSAGES)
+                self.assertEqual(await anext(chunks), 'Eat')
+                await chunks.aclose()
+
+        async_to_sync(run)()
+        self.assertEqual(len(opened), 2)
+        self.assertTrue(all(stream.response.is_closed for stream in opened))
+        self.assertEqual(gateway._slots.free, 1)
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+    def test_released_slot_goes_to_the_oldest_waiter(self):
+        limiter = ConcurrencyLimiter(1)
+        self.assertTrue(limiter.acquire(timeout=0))
+        order = []
+
+        def wait(name):
+            if limiter.acquire(timeout=5):
+                order.append(name)
+                limiter.release()
+
+        first = threading.Thread(target=wait, args=('first',))
+        first.start()
+        while not limiter.waiters:
+            time.sleep(0.01)
+        second = threading.Thread(target=wait, args=('second',))
+        second.start()
+        while len(limiter.waiters) < 2:
+            time.sleep(0.01)
+
+        limiter.release()
+        first.join()
+        second.join()
+        self.assertEqual(order, ['first', 'second'])
+        self.assertEqual(limiter.free, 1)
+
+    def test_timed_out_and_cancelled_waiters_leave_no_trace(self):
+        limiter = ConcurrencyLimiter(1)
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=0.01))
+
+        async def cancelled():
+            task = asyncio.ensure_future(limiter.aacquire(timeout=5))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await limiter.aacquire(timeout=0.01)
+
+        self.assertFalse(asyncio.run(cancelled()))
+        self.assertEqual(len(limiter.waiters), 0)
+        limiter.release()
+        self.assertEqual(limiter.free, 1)
+
+
+class ChatAPIViewTests(TestCase):
+    def setUp(self):
+        self.server = FakeLLMServer(reply='Try oats for breakfast.').start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings_override = override_settings(
+            GROQ_BASE_URL=self.server.base_url, GROQ_API_KEY='fake', LLM_RETRY_BACKOFF=0.01
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_gateway.cache_clear()
+        self.addCleanup(get_gateway.cache_clear)
+        # Its thread cannot see the test transaction; see ConversationContextTests.
+        summarize = mock.patch('chatbot.views.schedule_summary_update')
+        self.summarize = summarize.start()
+        self.addCleanup(summarize.stop)
+
+        self.user = User.objects.create_user(username='chatter', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_chat_through_gateway(self):
+        response = self.client.post('/api/chatbot/chat/', {'message': 'Breakfast ideas?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], 'Try oats for breakfast.')
+        self.summarize.assert_called_once_with(self.user.id)
+
+    def test_metrics_require_staff(self):
+        self.assertEqual(self.client.get('/api/chatbot/llm-metrics/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.post('/api/chatbot/chat/', {'message': 'Breakfast ideas?'}, format='json')
+        response = self.client.get('/api/chatbot/llm-metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['requests'], 1)
+
+    def stream(self, message='Breakfast ideas?'):
+        response = self.client.post('/api/chatbot/chat/stream/', {'message': message}, format='json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertTrue(body.startswith(SSE_OPEN))
+        self.assertTrue(body.endswith('\n\n'))
+        events = []
+        for block in body[len(SSE_OPEN):].split('\n\n')[:-1]:
+            event, data = block.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+
+    def test_stream_sends_tokens_then_done(self):
+        events = self.stream()
+        self.assertEqual(events[:-1], [
+            ('token', {'content': 'Try'}), ('token', {'content': ' oats'}),
+            ('token', {'content': ' for'}), ('token', {'content': ' breakfast.'}),
+        ])
+
+        event, conversation = events[-1]
+        self.assertEqual(event, 'done')
+        saved = Conversation.objects.get(user=self.user)
+        self.assertEqual(conversation['id'], saved.id)
+        self.assertEqual(conversation['ai_response'], 'Try oats for breakfast.')
+        self.assertEqual(saved.user_message, 'Breakfast ideas?')
+        self.summarize.assert_called_once_with(self.user.id)
+
+    def test_stream_ends_with_error_event(self):
+        self.server.status = 400
+        events = self.stream()
+
+        self.assertEqual(len(events), 1)
+        event, data = events[0]
+        self.assertEqual(event, 'error')
+        self.assertIn('Fake failure 400', data['error'])
+        self.assertFalse(Conversation.objects.exists())
+        self.summarize.assert_not_called()
+
+    def test_stream_validates_before_streaming(self):
+        response = self.client.post('/api/chatbot/chat/stream/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.server.requests, 0)
+
+
+class AsyncChatAPIViewTests(TestCase):
+    def setUp(self):
+        self.gateway = mock.Mock()
+        self.gateway.acomplete = mock.AsyncMock(return_value='Try oats for breakfast.')
+        gateway = mock.patch('chatbot.views.get_gateway', return_value=self.gateway)
+        gateway.start()
+        self.addCleanup(gateway.stop)
+        # Its thread cannot see the test transaction; see ConversationContextTests.
+        summarize = mock.patch('chatbot.views.schedule_summary_update')
+        self.summarize = summarize.start()
+        self.addCleanup(summarize.stop)
+
+        self.user = User.objects.create_user(username='async-chatter')
+        self.factory = AsyncRequestFactory()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def post(self, body):
+        request = self.factory.post('/', body, content_type='application/json', headers=self.headers)
+        response = await AsyncChatAPIView.as_view()(request)
+        return response.status_code, json.loads(response.content)
+
+    async def test_chat(self):
+        status, data = await self.post({'message': 'Breakfast ideas?'})
+        self.assertEqual((status, data), (200, {'response': 'Try oats for breakfast.'}))
+        messages = self.gateway.acomplete.await_args.args[0]
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'Breakfast ideas?'})
+        saved = await Conversation.objects.aget(user=self.user)
+        self.assertEqual((saved.user_message, saved.ai_response), ('Breakfast ideas?', 'Try oats for breakfast.'))
+        self.summarize.assert_called_once_with(self.user.id)
+
+        # The exchange is part of the history page.
+        request = self.factory.get('/', headers=self.headers)
+        response = await AsyncChatAPIView.as_view()(request)
+        self.assertEqual([row['id'] for row in json.loads(response.content)['results']], [saved.id])
+
+    async def test_errors(self):
+        self.assertEqual((await self.post('{'))[0], 400)
+        self.assertEqual((await self.post({}))[0], 400)
+        self.gateway.acomplete.side_effect = LLMBusy('Too many requests.')
+        self.assertEqual(await self.post({'message': 'Hi'}), (503, {'error': 'Too many requests.'}))
+        self.gateway.acomplete.side_effect = RuntimeError('LLM down')
+        self.assertEqual(await self.post({'message': 'Hi'}), (500, {'error': 'LLM down'}))
+        self.assertFalse(await Conversation.objects.aexists())
+
+    async def test_requires_a_token(self):
+        response = await AsyncChatAPIView.as_view()(self.factory.post('/', {'message': 'Hi'}, content_type='application/json'))
+        self.assertEqual(response.status_code, 401)
+        self.gateway.acomplete.assert_not_awaited()
+
+
+class ChatHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='history')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def talk(self, count):
+        return [
+            Conversation.objects.create(user=self.user, user_message=f'Question {n}', ai_response=f'Answer {n}')
+            for n in range(count)
+        ]
+
+    def page(self, **params):
+        response = self.client.get('/api/chatbot/chat/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_round_trip(self):
+        conversation = Conversation(id=42, timestamp=datetime(2025, 3, 10, 8, 30, 15, 123456, tzinfo=timezone.utc))
+        self.assertEqual(decode_cursor(encode_cursor(conversation)), (conversation.timestamp, 42))
+
+    def test_pages_walk_back_through_tied_timestamps(self):
+        turns = self.talk(7)
+        # Rows saved in the same instant are told apart by their id.
+        tied = datetime(2025, 3, 10, 8, 30, tzinfo=timezone.utc)
+        Conversation.objects.filter(id__in=[turn.id for turn in turns[1:6]]).update(timestamp=tied)
+        Conversation.objects.filter(id=turns[0].id).update(timestamp=datetime(2025, 3, 9, tzinfo=timezone.utc))
+        Conversation.objects.create(user=User.objects.create_user(username='someone-else'), user_message='-', ai_response='-')
+
+        pages, params = [], {'limit': 2}
+        while True:
+            page = self.page(**params)
+            pages.append([row['id'] for row in page['results']])
+            if page['next'] is None:
+                break
+            params['before'] = page['next']
+
+        ids = [turn.id for turn in turns]
+        self.assertEqual(pages, [ids[5:7], ids[3:5], ids[1:3], ids[0:1]])
+
+    def test_limit_is_clamped(self):
+        self.talk(3)
+        self.assertEqual(len(self.page(limit=0)['results']), 1)
+        with mock.patch('chatbot.pagination.MAX_PAGE_SIZE', 2):
+            self.assertEqual(len(self.page(limit=500)['results']), 2)
+        self.assertIsNone(self.page()['next'])
+
+    def test_invalid_parameters(self):
+        garbage = base64.urlsafe_b64encode(b'yesterday|7').decode()
+        no_id = base64.urlsafe_b64encode(b'2025-03-10T08:30:00+00:00|').decode()
+        for params in ({'before': 'not a cursor'}, {'before': garbage}, {'before': no_id},
+                       {'before': base64.urlsafe_b64encode(b'\xff\xfe').decode()}, {'limit': 'ten'}):
+            response = self.client.get('/api/chatbot/chat/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json(), {'error': 'Invalid pagination parameters.'})
+        with self.assertRaises(InvalidPage):
+            decode_cursor('')
+
+
+@override_settings(CHAT_HISTORY_TURNS=2)
+class ConversationContextTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='context')
+        gateway = mock.patch('chatbot.context.get_gateway')
+        self.complete = gateway.start().return_value.complete
+        self.addCleanup(gateway.stop)
+
+    def talk(self, count, start=0):
+        return [
+            Conversation.objects.create(user=self.user, user_message=f'Question {n}', ai_response=f'Answer {n}')
+            for n in range(start, start + count)
+        ]
+
+    def prompt(self, call):
+        return call.args[0][1]['content']
+
+    def test_turns_leaving_the_recent_window_are_folded(self):
+        turns = self.talk(5)
+        self.complete.return_value = 'Asked 0 to 2.'
+
+        self.assertEqual(update_summary(self.user.pk), 3)
+        prompt = self.prompt(self.complete.call_args)
+        self.assertIn('Existing summary:\n(none)', prompt)
+        self.assertIn('User: Question 2\nAssistant: Answer 2', prompt)
+        self.assertNotIn('Question 3', prompt)
+
+        summary = ConversationSummary.objects.get(user=self.user)
+        self.assertEqual(summary.summary, 'Asked 0 to 2.')
+        self.assertEqual(summary.summarized_through_id, turns[2].id)
+
+        # Nothing new to fold until more turns push others out of the window.
+        self.assertEqual(update_summary(self.user.pk), 0)
+        self.talk(1, start=5)
+        self.complete.return_value = 'Asked 0 to 3.'
+        self.assertEqual(update_summary(self.user.pk), 1)
+        prompt = self.prompt(self.complete.call_args)
+        self.assertIn('Existing summary:\nAsked 0 to 2.', prompt)
+        self.assertIn('Question 3', prompt)
+        self.assertNotIn('Question 2', prompt)
+        self.assertEqual(self.complete.call_count, 2)
+
+    def test_long_backlogs_are_folded_in_batches(self):
+        self.talk(25)
+        self.complete.side_effect = ['First batch.', 'Second batch.']
+        with mock.patch('chatbot.context.SUMMARY_BATCH_TURNS', 20):
+            self.assertEqual(update_summary(self.user.pk), 23)
+        self.assertEqual(self.complete.call_count, 2)
+        self.assertIn('Existing summary:\nFirst batch.', self.prompt(self.complete.call_args))
+        self.assertEqual(ConversationSummary.objects.get(user=self.user).summary, 'Second batch.')
+
+    def test_ids_beyond_32_bits(self):
+        # Conversation ids are 64-bit, so the summary's id column must be too.
+        first = 2 ** 31
+        for n in range(3):
+            Conversation.objects.create(id=first + n, user=self.user, user_message=f'Question {n}', ai_response='Answer')
+        self.complete.return_value = 'Asked 0.'
+        self.assertEqual(update_summary(self.user.pk), 1)
+        self.assertEqual(ConversationSummary.objects.get(user=self.user).summarized_through_id, first)
+        self.assertIsInstance(
+            ConversationSummary._meta.get_field('summarized_through_id'), models.PositiveBigIntegerField
+        )
+
+    def test_failed_update_is_logged(self):
+        # The thread's own queries cannot see the test transaction, so the
+        # update itself is replaced.
+        with mock.patch('chatbot.context.update_summary', side_effect=RuntimeError('LLM down')), \
+                mock.patch('chatbot.context.connection') as connection, \
+                self.assertLogs('chatbot.context', 'ERROR') as logs:
+            schedule_summary_update(self.user.pk).join(timeout=5)
+        self.assertIn('LLM down', logs.output[0])
+        connection.close.assert_called_once_with()
+
+        # The lock was released for the next exchange to retry.
+        with mock.patch('chatbot.context.update_summary') as update, mock.patch('chatbot.context.connection'):
+            schedule_summary_update(self.user.pk).join(timeout=5)
+        update.assert_called_once_with(self.user.pk)
+
+
+class BuildMessagesTests(SimpleTestCase):
+    def history(self, *sizes):
+        """Unsaved turns, newest first, whose messages are `size` tokens each."""
+        return [Conversation(user_message='q' * (4 * size - 4), ai_response='a' * (4 * size - 4)) for size in sizes]
+
+    def test_oldest_turns_are_dropped_to_fit_the_budget(self):
+        head_and_tail = build_messages(None, 'The summary.', [], 'Hi!')
+        fixed = sum(estimate_tokens(m['content']) for m in head_and_tail)
+
+        messages = build_messages(None, 'The summary.', self.history(10, 20, 30), 'Hi!', token_budget=fixed + 60)
+        self.assertEqual([m['role'] for m in messages], ['system', 'system', 'user', 'assistant', 'user', 'assistant', 'user'])
+        # The two newest turns (20 + 40 tokens) in chronological order.
+        self.assertEqual(len(messages[2]['content']), 76)
+        self.assertEqual(len(messages[4]['content']), 36)
+        self.assertEqual(messages[-1]['content'], 'Hi!')
+        self.assertLessEqual(sum(estimate_tokens(m['content']) for m in messages), fixed + 60)
+
+    def test_trimming_stops_at_the_first_turn_that_does_not_fit(self):
+        # An older, smaller turn is not used to fill the gap: the history stays contiguous.
+        messages = build_messages(None, None, self.history(5, 100, 5), 'Hi!', token_budget=200)
+        self.assertEqual(len(messages), 4)
+
+    @override_settings(CHAT_CONTEXT_TOKEN_BUDGET=10)
+    def test_system_summary_and_new_message_are_always_kept(self):
+        messages = build_messages(None, 'A long summary. ' * 50, self.history(1), 'Hi!')
+        self.assertEqual([m['role'] for m in messages], ['system', 'system', 'user'])
@@ -1,11 +1,14 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChatAPIView,delete_message, clear_all_conversations
+from .views import ChatAPIView,AsyncChatAPIView,ChatStreamAPIView,AsyncChatStreamAPIView,LLMMetricsView,delete_message, clear_all_conversations
 
 
 urlpatterns = [
-      path('chat/', ChatAPIView.as_view(), name='chat_api'),
+      path('chat/', (AsyncChatAPIView if settings.ASYNC_LLM_VIEWS else ChatAPIView).as_view(), name='chat_api'),
+    path('chat/stream/', (AsyncChatStreamAPIView if settings.ASYNC_LLM_VIEWS else ChatStreamAPIView).as_view(), name='chat-stream'),
     path('chat/<int:message_id>/', delete_message, name='delete-message'),
     path('chat/clear/', clear_all_conversations, name='clear-all-conversations'),
+    path('llm-metrics/', LLMMetricsView.as_view(), name='llm-metrics'),
 
 ]
\ No newline at end of file
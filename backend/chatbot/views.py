@@ -1,19 +1,34 @@
 # chatbot/views.py
+import json
+
 from rest_framework.decorators import api_view, permission_classes
 from django.shortcuts import get_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated 
-from groq import Groq
-from django.conf import settings
-from .models import Conversation
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from api.async_views import AsyncAPIView
+from .context import aload_chat_messages, load_chat_messages, schedule_summary_update
+from .llm import LLMBusy, get_gateway
+from .models import Conversation, ConversationSummary
+from .pagination import InvalidPage, build_page, page_queryset
 from .serializers import ChatMessageSerializer,ConversationSerializer
-from users.models import Profile
 
-# Initialize the Groq client
-client = Groq(api_key=settings.GROQ_API_KEY)
+def sse_event(event, data):
+    """Formats one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Sent first so the response headers go out before the model is called.
+SSE_OPEN = ": stream open\n\n"
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 class ChatAPIView(APIView):
     """
@@ -23,11 +38,15 @@ class ChatAPIView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, *args, **kwargs):
         """
-        Retrieves the conversation history for the authenticated user.
+        Retrieves one page of the authenticated user's conversation history,
+        newest first. Pass the returned `next` cursor as `before` to load
+        older messages.
         """
-        conversations = Conversation.objects.filter(user=request.user).order_by('timestamp')
-        serializer = ConversationSerializer(conversations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            rows, page_size = page_queryset(request.user, request.query_params)
+        except InvalidPage:
+            return Response({'error': 'Invalid pagination parameters.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(build_page(rows, page_size), status=status.HTTP_200_OK)
 
 
     def post(self, request, *args, **kwargs):
@@ -37,48 +56,144 @@ class ChatAPIView(APIView):
             user_message = serializer.validated_data['message']
             user = request.user
 
-            try:
-                profile = Profile.objects.get(user=user)
-                system_message = (
-                    f"You are a helpful AI nutritionist for a user who wants to "
-                    f"achieve a fitness goal of: {profile.weight_goal}. "
-                    f"Their body stats are: Height - {profile.height} cm, "
-                    f"Weight - {profile.weight} kg. Based on this, provide helpful "
-                    f"and concise nutrition advice. Refer to their goals in your responses."
-                )
-            except Profile.DoesNotExist:
-                system_message = "You are a helpful AI nutritionist. Answer health and nutrition questions concisely and accurately."
-
-            conversation_history = Conversation.objects.filter(user=user).order_by('-timestamp')[:5]
-            messages = []
-            
-            messages.append({"role": "system", "content": system_message})
-
-            for convo in reversed(conversation_history):
-                messages.append({"role": "user", "content": convo.user_message})
-                messages.append({"role": "assistant", "content": convo.ai_response})
-
-            messages.append({"role": "user", "content": user_message})
+            messages = load_chat_messages(user, user_message)
 
             try:
-                chat_completion = client.chat.completions.create(
-                    messages=messages,
-                    model='llama-3.1-8b-instant',
-                )
-                ai_response = chat_completion.choices[0].message.content
+                ai_response = get_gateway().complete(messages)
 
                 Conversation.objects.create(
                     user=user,
                     user_message=user_message,
                     ai_response=ai_response
                 )
+                schedule_summary_update(user.id)
 
                 return Response({'response': ai_response}, status=status.HTTP_200_OK)
 
+            except LLMBusy as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             except Exception as e:
                 return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class AsyncChatAPIView(AsyncAPIView):
+    """
+    Async version of ChatAPIView for ASGI deployments. The completion is
+    awaited with the gateway's AsyncGroq client, so a worker is not blocked while the
+    model answers.
+    """
+    async def get(self, request, *args, **kwargs):
+        try:
+            rows, page_size = page_queryset(request.user, request.GET)
+        except InvalidPage:
+            return JsonResponse({'error': 'Invalid pagination parameters.'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse(build_page([row async for row in rows], page_size), status=status.HTTP_200_OK)
+
+    async def post(self, request, *args, **kwargs):
+        serializer = ChatMessageSerializer(data=self.get_json(request))
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_message = serializer.validated_data['message']
+        user = request.user
+
+        messages = await aload_chat_messages(user, user_message)
+
+        try:
+            ai_response = await get_gateway().acomplete(messages)
+
+            await Conversation.objects.acreate(
+                user=user,
+                user_message=user_message,
+                ai_response=ai_response
+            )
+            schedule_summary_update(user.id)
+            return JsonResponse({'response': ai_response}, status=status.HTTP_200_OK)
+
+        except LLMBusy as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class ChatStreamAPIView(APIView):
+    """
+    Streams the reply as server-sent events while the model generates it:
+    a `token` event per chunk of text, then a `done` event carrying the
+    saved Conversation, or an `error` event. The exchange is only saved once
+    the whole reply has arrived.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = ChatMessageSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_message = serializer.validated_data['message']
+        messages = load_chat_messages(request.user, user_message)
+        return sse_response(self.stream_reply(request.user, user_message, messages))
+
+    def stream_reply(self, user, user_message, messages):
+        yield SSE_OPEN
+        chunks = []
+        try:
+            for content in get_gateway().stream(messages):
+                chunks.append(content)
+                yield sse_event('token', {'content': content})
+
+            conversation = Conversation.objects.create(
+                user=user,
+                user_message=user_message,
+                ai_response=''.join(chunks)
+            )
+            schedule_summary_update(user.id)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        yield sse_event('done', ConversationSerializer(conversation).data)
+
+class AsyncChatStreamAPIView(AsyncAPIView):
+    """
+    Async version of ChatStreamAPIView for ASGI deployments.
+    """
+    async def post(self, request, *args, **kwargs):
+        serializer = ChatMessageSerializer(data=self.get_json(request))
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_message = serializer.validated_data['message']
+        messages = await aload_chat_messages(request.user, user_message)
+        return sse_response(self.stream_reply(request.user, user_message, messages))
+
+    async def stream_reply(self, user, user_message, messages):
+        yield SSE_OPEN
+        chunks = []
+        try:
+            async for content in get_gateway().astream(messages):
+                chunks.append(content)
+                yield sse_event('token', {'content': content})
+
+            conversation = await Conversation.objects.acreate(
+                user=user,
+                user_message=user_message,
+                ai_response=''.join(chunks)
+            )
+            schedule_summary_update(user.id)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        yield sse_event('done', ConversationSerializer(conversation).data)
+
+class LLMMetricsView(APIView):
+    """
+    Latency, queue depth and error counters of this process's LLM gateway,
+    for staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_gateway().metrics.snapshot())
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_message(request, message_id):
@@ -104,6 +219,8 @@ def clear_all_conversations(request):
         conversations = Conversation.objects.filter(user=request.user)
         # Delete all objects in the queryset
         conversations.delete()
+        # The summary would otherwise keep remembering the deleted history.
+        ConversationSummary.objects.filter(user=request.user).delete()
         # Return a 204 No Content status on successful deletion
         return Response(status=status.HTTP_204_NO_CONTENT)
     except Exception as e:
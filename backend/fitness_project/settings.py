@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os   
 import dj_database_url
 
@@ -21,7 +21,51 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 NUTRITIONIX_APP_ID = config('NUTRITIONIX_APP_ID')
 NUTRITIONIX_API_KEY = config('NUTRITIONIX_API_KEY')
+NUTRITIONIX_BASE_URL = config('NUTRITIONIX_BASE_URL', default='https://trackapi.nutritionix.com/v2/natural/nutrients')
+NUTRITIONIX_EXERCISE_URL = config('NUTRITIONIX_EXERCISE_URL', default='https://trackapi.nutritionix.com/v2/natural/exercise')
+OPEN_FOOD_FACTS_BASE_URL = config('OPEN_FOOD_FACTS_BASE_URL', default='https://world.openfoodfacts.org/cgi/search.pl')
+# External food providers in priority order (see meals/providers.py). The
+# next provider is asked FOOD_PROVIDER_HEDGE_DELAY seconds after the
+# previous one unless that one has already answered; 0 asks all at once.
+FOOD_PROVIDERS = config('FOOD_PROVIDERS', default='nutritionix,open_food_facts', cast=Csv())
+FOOD_PROVIDER_HEDGE_DELAY = config('FOOD_PROVIDER_HEDGE_DELAY', default=0.5, cast=float)
+FOOD_PROVIDER_TIMEOUT = config('FOOD_PROVIDER_TIMEOUT', default=5, cast=float)
+# The shared outbound HTTP client of api/outbound.py: connections kept per
+# host, default timeouts, retries of connection errors and 502/503/504, and
+# the circuit breaker, which fails calls to a host fast for
+# OUTBOUND_BREAKER_RESET seconds after OUTBOUND_BREAKER_THRESHOLD failures.
+OUTBOUND_POOL_SIZE = config('OUTBOUND_POOL_SIZE', default=16, cast=int)
+OUTBOUND_CONNECT_TIMEOUT = config('OUTBOUND_CONNECT_TIMEOUT', default=3.05, cast=float)
+OUTBOUND_READ_TIMEOUT = config('OUTBOUND_READ_TIMEOUT', default=10, cast=float)
+OUTBOUND_MAX_RETRIES = config('OUTBOUND_MAX_RETRIES', default=2, cast=int)
+OUTBOUND_RETRY_BACKOFF = config('OUTBOUND_RETRY_BACKOFF', default=0.2, cast=float)
+OUTBOUND_BREAKER_THRESHOLD = config('OUTBOUND_BREAKER_THRESHOLD', default=5, cast=int)
+OUTBOUND_BREAKER_RESET = config('OUTBOUND_BREAKER_RESET', default=30, cast=float)
+# Food searches whose best local match (see meals/search.py) scores below
+# this trigram similarity go on to the external nutrition APIs.
+FOOD_SEARCH_MATCH_THRESHOLD = config('FOOD_SEARCH_MATCH_THRESHOLD', default=0.5, cast=float)
+# How long answers of the external nutrition APIs are reused (meals/lookups.py),
+# in seconds: foods they found, and queries they had no match for.
+FOOD_LOOKUP_TTL = config('FOOD_LOOKUP_TTL', default=60 * 60 * 24 * 30, cast=int)
+FOOD_LOOKUP_NEGATIVE_TTL = config('FOOD_LOOKUP_NEGATIVE_TTL', default=60 * 60 * 24, cast=int)
 GROQ_API_KEY = config('GROQ_API_KEY')
+# Override to point the Groq clients at another OpenAI-compatible server.
+GROQ_BASE_URL = config('GROQ_BASE_URL', default=None)
+# Per-process limits of the LLM gateway in chatbot/llm.py. Callers beyond
+# LLM_MAX_CONCURRENCY wait up to LLM_QUEUE_TIMEOUT seconds for a slot.
+LLM_MAX_CONCURRENCY = config('LLM_MAX_CONCURRENCY', default=8, cast=int)
+LLM_QUEUE_TIMEOUT = config('LLM_QUEUE_TIMEOUT', default=10, cast=float)
+LLM_CONNECT_TIMEOUT = config('LLM_CONNECT_TIMEOUT', default=5, cast=float)
+LLM_READ_TIMEOUT = config('LLM_READ_TIMEOUT', default=30, cast=float)
+LLM_MAX_RETRIES = config('LLM_MAX_RETRIES', default=2, cast=int)
+LLM_RETRY_BACKOFF = config('LLM_RETRY_BACKOFF', default=0.5, cast=float)
+# Route the chat and daily tip endpoints to their async views; enable when
+# serving through fitness_project.asgi (see README).
+ASYNC_LLM_VIEWS = config('ASYNC_LLM_VIEWS', default=False, cast=bool)
+# Chat prompts hold the system message, the rolling conversation summary and
+# up to CHAT_HISTORY_TURNS recent exchanges, trimmed to this many tokens.
+CHAT_HISTORY_TURNS = config('CHAT_HISTORY_TURNS', default=5, cast=int)
+CHAT_CONTEXT_TOKEN_BUDGET = config('CHAT_CONTEXT_TOKEN_BUDGET', default=3000, cast=int)
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -184,3 +228,24 @@ REST_FRAMEWORK = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')    
 
+
+# Cache
+# The analysis endpoints cache responses per user (see analysis/cache.py).
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared backend such as Redis or
+# Memcached when running more than one worker process.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='fitkeep'),
+    }
+}
+# Concurrent identical food searches and workout lookups share one upstream
+# call (api/singleflight.py). Name a cache shared by all processes to extend
+# that across processes; waiters give up after SINGLE_FLIGHT_TIMEOUT seconds,
+# and have SINGLE_FLIGHT_RESULT_TTL seconds to pick up a finished result.
+SINGLE_FLIGHT_CACHE = config('SINGLE_FLIGHT_CACHE', default='')
+SINGLE_FLIGHT_TIMEOUT = config('SINGLE_FLIGHT_TIMEOUT', default=15, cast=float)
+SINGLE_FLIGHT_RESULT_TTL = config('SINGLE_FLIGHT_RESULT_TTL', default=5, cast=int)
+ANALYSIS_CACHE_TIMEOUT = config('ANALYSIS_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+# Serve the previous daily tip while a new one is generated in the background.
+DAILY_TIP_STALE_WHILE_REVALIDATE = config('DAILY_TIP_STALE_WHILE_REVALIDATE', default=True, cast=bool)
@@ -1,7 +1,33 @@
 from django.contrib import admin
-from .models import FoodItem, Meal, MealItem
+from .models import FoodItem, FoodLookup, Meal, MealItem
+from .lookups import lookup_stats
 
 # Register your models here.
 admin.site.register(FoodItem)
 admin.site.register(Meal)
 admin.site.register(MealItem)
+
+
+@admin.register(FoodLookup)
+class FoodLookupAdmin(admin.ModelAdmin):
+    list_display = ('query', 'provider', 'found', 'hits', 'fetches', 'hit_rate', 'expires_at')
+    list_filter = ('provider', 'found')
+    search_fields = ('query',)
+    readonly_fields = ('fetched_at', 'hits', 'fetches')
+
+    @admin.display(description='Hit rate')
+    def hit_rate(self, obj):
+        total = obj.hits + obj.fetches
+        return f"{obj.hits / total:.0%}" if total else '-'
+
+    def changelist_view(self, request, extra_context=None):
+        # The overall hit rate of the lookups matching the current filters.
+        response = super().changelist_view(request, extra_context=extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            stats = lookup_stats(changelist.queryset)
+            rate = f"{stats['hit_rate']:.0%}" if stats['hit_rate'] is not None else 'n/a'
+            response.context_data['title'] = (
+                f"Food lookups: hit rate {rate} ({stats['hits']} cached answers, {stats['fetches']} API calls)"
+            )
+        return response
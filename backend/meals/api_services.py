@@ -1,107 +1,121 @@
-import requests
+import re
 from django.conf import settings
-from .models import FoodItem
+from django.db import IntegrityError, transaction
+from api.singleflight import single_flight
+from .models import FoodItem, FoodLookup, normalize_food_name
+from .providers import NutritionixProvider, search_providers
+from .search import best_local_match, best_local_matches
+
+# The most foods one batch search may ask for.
+MAX_BATCH_QUERIES = 20
+# The longest food query; answers are cached under it in FoodLookup.
+MAX_QUERY_LENGTH = FoodLookup._meta.get_field('query').max_length
+
+# Splits a meal description such as "2 eggs, toast and a glass of milk".
+DESCRIPTION_SEPARATORS = re.compile(r'\s*(?:[,;\n+&]|\band\b|\bwith\b)\s*', re.IGNORECASE)
+# An explicit weight at the start of an item: "150g chicken", "150 grams of chicken".
+GRAMS_PREFIX = re.compile(r'^(\d+(?:\.\d+)?)\s*(?:g|gr|grams?)\b\s*(?:of\s+)?', re.IGNORECASE)
+# Any other leading amount: "2 eggs", "a slice of toast", "1/2 cup of rice".
+AMOUNT_PREFIX = re.compile(
+    r'^(?:\d+(?:[./]\d+)?|an?|one|two|three|four|half|some)\s+'
+    r'(?:(?:cups?|slices?|pieces?|bowls?|glass(?:es)?|tbsp|tsp|tablespoons?|teaspoons?|handfuls?|servings?)\s+)?'
+    r'(?:of\s+)?',
+    re.IGNORECASE,
+)
+
+def save_food(food_data):
+    """
+    Returns (food item, created) for food data from a provider, reusing the
+    food item with the same normalized name. Concurrent saves of one name
+    are serialized within a process; across processes the unique constraint
+    on normalized_name makes all but the first one reuse its row.
+    """
+    key = normalize_food_name(food_data['name'])
+
+    def existing():
+        return FoodItem.objects.filter(normalized_name=key).order_by('pk').first()
+
+    def get_or_create():
+        food_item = existing()
+        if food_item is not None:
+            return food_item, False
+        try:
+            with transaction.atomic():
+                return FoodItem.objects.create(**food_data), True
+        except IntegrityError:
+            # Another process saved the same name since the lookup above.
+            food_item = existing()
+            if food_item is None:
+                raise
+            return food_item, False
+
+    (food_item, created), shared = single_flight.do(f'food-item:{key}', get_or_create)
+    return food_item, created and not shared
 
-# Base URLs for the APIs
-NUTRITIONIX_BASE_URL = "https://trackapi.nutritionix.com/v2/natural/nutrients"
-OPEN_FOOD_FACTS_BASE_URL = "https://world.openfoodfacts.org/cgi/search.pl"
 def search_and_save_food(query):
     """
-    Searches for a food item, checking our own database first before
-    calling external APIs.
+    Searches for a food item, checking our own search index first before
+    calling external APIs. Concurrent searches for the same normalized
+    query share one search.
     """
-    try:
-        # We use 'iexact' for a case-insensitive search
-        food_item = FoodItem.objects.get(name__iexact=query)
-        # If found, return it immediately. 'created' is False.
-        return food_item, False
-    except FoodItem.DoesNotExist:
-        pass
+    def search():
+        # A close enough local match (typos and partial names included) saves
+        # the round trip to the external APIs. 'created' is False.
+        food_item = best_local_match(query, settings.FOOD_SEARCH_MATCH_THRESHOLD)
+        if food_item:
+            return food_item, False
+
+        # Ask the external providers (Nutritionix, then Open Food Facts by
+        # default) concurrently; see meals/providers.py.
+        _, food_data = search_providers(query)
+        if food_data:
+            return save_food(food_data)
 
-    # 1. Try to get data from Nutritionix
-    nutritionix_data = _search_nutritionix(query)
-    if nutritionix_data:
-        food_item, created = FoodItem.objects.get_or_create(
-            name=nutritionix_data['name'],
-            defaults=nutritionix_data
-        )
-        return food_item, created
+        return None, False
 
-    # 2. If Nutritionix fails, try Open Food Facts
-    open_food_facts_data = _search_open_food_facts(query)
-    if open_food_facts_data:
-        food_item, created = FoodItem.objects.get_or_create(
-            name=open_food_facts_data['name'],
-            defaults=open_food_facts_data
-        )
-        return food_item, created
+    (food_item, created), shared = single_flight.do(f'food-search:{normalize_food_name(query)}', search)
+    return food_item, created and not shared
 
-    return None, False
+def split_meal_description(description):
+    """Splits a natural-language meal description into one query per food."""
+    return [part for part in DESCRIPTION_SEPARATORS.split(description) if part.strip()]
 
-def _search_nutritionix(query):
+def parse_quantity(query):
     """
-    Searches Nutritionix API for a food item's nutritional data and normalizes to 100g.
+    Returns (grams, food name) for a query like "150g rice" or "2 eggs";
+    grams is None unless the query states a weight.
     """
-    headers = {
-        "x-app-id": settings.NUTRITIONIX_APP_ID,
-        "x-app-key": settings.NUTRITIONIX_API_KEY,
-        "Content-Type": "application/json"
-    }
-    data = {"query": query}
-    try:
-        response = requests.post(NUTRITIONIX_BASE_URL, headers=headers, json=data, timeout=5)
-        response.raise_for_status()
-        result = response.json()
-        
-        if result.get("foods"):
-            food = result["foods"][0]
-            serving_grams = food.get("serving_weight_grams")
-            
-            if not serving_grams:
-                print(f"Warning: Nutritionix API did not provide a serving weight for '{query}'. Cannot normalize to 100g.")
-                return None
-            
-            # Normalize all values to a per-100g basis
-            normalization_factor = 100 / serving_grams
-            
-            return {
-                "name": food.get("food_name"),
-                "calories": food.get("nf_calories") * normalization_factor if food.get("nf_calories") is not None else 0,
-                "protein": food.get("nf_protein") * normalization_factor if food.get("nf_protein") is not None else 0,
-                "carbs": food.get("nf_total_carbohydrate") * normalization_factor if food.get("nf_total_carbohydrate") is not None else 0,
-                "fats": food.get("nf_total_fat") * normalization_factor if food.get("nf_total_fat") is not None else 0,
-            }
-        return None
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Nutritionix API: {e}")
-        return None
+    query = query.strip()
+    match = GRAMS_PREFIX.match(query)
+    if match:
+        return float(match.group(1)), query[match.end():]
+    return None, AMOUNT_PREFIX.sub('', query)
 
-def _search_open_food_facts(query):
+def search_and_save_foods(queries):
     """
-    Searches Open Food Facts API for a food item and uses its per-100g data.
+    Batch version of search_and_save_food(). Local matches of all queries
+    are fetched together, and the rest are sent to Nutritionix in a single
+    natural-language request. Returns one (food_item, source, quantity_g)
+    triple per query, in input order. food_item and source are None when
+    nothing was found. quantity_g is the stated weight, or the serving
+    weight Nutritionix read from the query.
     """
-    params = {
-        "search_terms": query,
-        "json": 1,
-        "page_size": 1,
-    }
-    try:
-        response = requests.get(OPEN_FOOD_FACTS_BASE_URL, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data.get("products"):
-            product = data["products"][0]
-            nutriments = product.get("nutriments", {})
-            return {
-                "name": product.get("product_name"),
-                "calories": nutriments.get("energy-kcal_100g"),
-                "protein": nutriments.get("proteins_100g"),
-                "carbs": nutriments.get("carbohydrates_100g"),
-                "fats": nutriments.get("fat_100g"),
-            }
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Open Food Facts API: {e}")
-        return None
+    parsed = [parse_quantity(query) for query in queries]
+    local = best_local_matches([name for _, name in parsed], settings.FOOD_SEARCH_MATCH_THRESHOLD)
+
+    misses = [query for query, food_item in zip(queries, local) if food_item is None]
+    remote = dict(zip(misses, NutritionixProvider().search_many(misses))) if misses else {}
+
+    results = []
+    for query, (grams, _), food_item in zip(queries, parsed, local):
+        if food_item is not None:
+            results.append((food_item, 'local', grams))
+            continue
+        match = remote[query]
+        if match is None:
+            results.append((None, None, grams))
+            continue
+        food_data, serving_grams = match
+        food_item, _ = save_food(food_data)
+        results.append((food_item, 'nutritionix', grams if grams is not None else serving_grams))
+    return results
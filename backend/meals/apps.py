@@ -1,6 +1,26 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps as global_apps
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def reinstall_search_index(sender, using, apps=global_apps, **kwargs):
+    from .search import install_search_index
+
+    # Not when the migrations were unapplied to before the indexed column.
+    # flush sends the signal without `apps`; the models are current then.
+    try:
+        fields = {field.name for field in apps.get_model('meals', 'FoodItem')._meta.get_fields()}
+    except LookupError:
+        return
+    if 'normalized_name' in fields:
+        install_search_index(connections[using])
 
 
 class MealsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "meals"
+
+    def ready(self):
+        # SQLite drops the FTS triggers whenever a migration rebuilds the
+        # FoodItem table, so restore them after every migrate.
+        post_migrate.connect(reinstall_search_index, sender=self)
@@ -0,0 +1,126 @@
+#
+# File: meals/lookups.py
+#
+# Persistent cache of the external nutrition API lookups, keyed by provider
+# and normalized query. A provider's answer is kept in FoodLookup for
+# FOOD_LOOKUP_TTL seconds when it found the food, and for
+# FOOD_LOOKUP_NEGATIVE_TTL seconds when it had no match, so a popular
+# misspelling costs one round trip per provider per day instead of one per
+# search. Failed calls (timeouts, connection and server errors) are not
+# remembered.
+#
+# Each entry counts the searches it answered (hits) and the provider calls
+# made for it (fetches); the admin shows the resulting hit rate.
+#
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import FoodLookup, normalize_food_name
+
+
+class UpstreamError(Exception):
+    """The provider could not be asked; the lookup is not cached."""
+
+
+def get_cached(provider, query):
+    """
+    Returns the provider's unexpired FoodLookup for the query, counting it
+    as a hit, or None.
+    """
+    entry = FoodLookup.objects.filter(
+        provider=provider, query=normalize_food_name(query), expires_at__gt=timezone.now()
+    ).first()
+    if entry is not None:
+        FoodLookup.objects.filter(pk=entry.pk).update(hits=F('hits') + 1)
+    return entry
+
+
+def get_cached_many(provider, queries):
+    """
+    get_cached() for several queries in one query: a dict of the unexpired
+    lookups by normalized query.
+    """
+    entries = {
+        entry.query: entry
+        for entry in FoodLookup.objects.filter(
+            provider=provider, query__in={normalize_food_name(query) for query in queries},
+            expires_at__gt=timezone.now(),
+        )
+    }
+    if entries:
+        FoodLookup.objects.filter(pk__in=[entry.pk for entry in entries.values()]).update(hits=F('hits') + 1)
+    return entries
+
+
+def remember(provider, query, payload, result):
+    """
+    Stores the provider's answer for the query: the payload if it parsed to
+    a result, a negative result otherwise.
+    """
+    now = timezone.now()
+    ttl = settings.FOOD_LOOKUP_TTL if result is not None else settings.FOOD_LOOKUP_NEGATIVE_TTL
+    _store(provider, normalize_food_name(query), {
+        'found': result is not None,
+        # Negative results keep no payload.
+        'payload': payload if result is not None else None,
+        'fetched_at': now,
+        'expires_at': now + timedelta(seconds=ttl),
+    })
+
+
+def cached_lookup(provider, query, fetch, parse):
+    """
+    Returns parse(payload, query) for the provider's payload for the query,
+    or None when the provider has no usable match or could not be reached.
+    fetch(query) returns the raw payload, None when the provider reports no
+    match, and raises UpstreamError when the call fails.
+    """
+    entry = get_cached(provider, query)
+    if entry is not None:
+        return parse(entry.payload, query) if entry.found else None
+
+    try:
+        payload = fetch(query)
+    except UpstreamError:
+        return None
+
+    result = parse(payload, query) if payload is not None else None
+    remember(provider, query, payload, result)
+    return result
+
+
+def _store(provider, key, fields):
+    updated = FoodLookup.objects.filter(provider=provider, query=key).update(fetches=F('fetches') + 1, **fields)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            FoodLookup.objects.create(provider=provider, query=key, fetches=1, **fields)
+    except IntegrityError:
+        # Another search stored the same lookup in the meantime.
+        FoodLookup.objects.filter(provider=provider, query=key).update(fetches=F('fetches') + 1, **fields)
+
+
+def lookup_stats(queryset=None):
+    """Total hits and provider calls over the lookups, and the hit rate."""
+    if queryset is None:
+        queryset = FoodLookup.objects.all()
+    totals = queryset.aggregate(hits=Sum('hits'), fetches=Sum('fetches'))
+    hits, fetches = totals['hits'] or 0, totals['fetches'] or 0
+    total = hits + fetches
+    return {
+        'hits': hits,
+        'fetches': fetches,
+        'hit_rate': round(hits / total, 3) if total else None,
+    }
+
+
+def purge_expired_lookups():
+    """Deletes the expired lookups and returns how many there were."""
+    deleted, _ = FoodLookup.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,156 @@
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from meals.models import FoodItem
+from meals.openfoodfacts import (
+    batched, chunked, deduplicate, detect_format, normalize_product, open_dump, parse_lines, read_csv,
+)
+
+# JSONL lines handed to a worker process at a time.
+CHUNK_LINES = 2000
+
+UPSERT_FIELDS = ['name', 'normalized_name', 'calories', 'protein', 'carbs', 'fats']
+
+
+def _init_worker():
+    """Workers only decode JSON, but importing the models needs Django set up."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fitness_project.settings')
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams an Open Food Facts JSONL or CSV export, gzipped or not, into FoodItem, "
+        "skipping products whose barcode or normalized name is already known."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The .jsonl, .csv (tab-separated) or .gz export.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Default: taken from the file name.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes decoding JSONL lines (1 decodes in this process).")
+        parser.add_argument('--limit', type=int, help="Stop after reading this many products.")
+        parser.add_argument('--update', action='store_true',
+                            help="Update the values of products already imported, matched by barcode.")
+        parser.add_argument('--progress-every', type=float, default=5.0, help="Seconds between progress lines.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        try:
+            dump_format = options['format'] or detect_format(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stats = Counter()
+        self.total_bytes = os.path.getsize(path)
+        self.started = self.last_report = time.perf_counter()
+        seen_barcodes, seen_names = self.existing_keys(options['update'])
+
+        stream, self.counter = open_dump(path)
+        with stream:
+            if dump_format == 'csv':
+                rows = self.csv_rows(stream, options['limit'])
+            else:
+                rows = self.jsonl_rows(stream, options['limit'], options['workers'])
+            for batch in batched(deduplicate(rows, seen_barcodes, seen_names, self.stats), options['batch_size']):
+                self.write(batch, options['update'])
+                if time.perf_counter() - self.last_report >= options['progress_every']:
+                    self.report()
+
+        self.report()
+        updated = f", updated {self.stats['updated']:,}" if options['update'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['imported']:,}{updated} of {self.stats['read']:,} products "
+            f"in {time.perf_counter() - self.started:.1f}s."
+        ))
+
+    def existing_keys(self, update):
+        """
+        Hashes of the barcodes to skip, and of the normalized names taken
+        with the barcode of the product that has each. Foods that did not
+        come from a dump are never overwritten; with --update, products
+        imported before are upserted instead of skipped, and keep their
+        names from other products.
+        """
+        seen_barcodes, seen_names = set(), {}
+        rows = FoodItem.objects.values_list('barcode', 'normalized_name').iterator(chunk_size=10000)
+        for barcode, normalized_name in rows:
+            if barcode is None:
+                seen_names[hash(normalized_name)] = None
+            else:
+                if not update:
+                    seen_barcodes.add(hash(barcode))
+                seen_names[hash(normalized_name)] = hash(barcode)
+        return seen_barcodes, seen_names
+
+    def csv_rows(self, stream, limit):
+        for product in islice(read_csv(stream), limit):
+            self.stats['read'] += 1
+            row = normalize_product(product)
+            if row is None:
+                self.stats['invalid'] += 1
+            else:
+                yield row
+
+    def jsonl_rows(self, stream, limit, workers):
+        for size, rows in self.parse_chunks(chunked(islice(stream, limit), CHUNK_LINES), workers):
+            self.stats['read'] += size
+            self.stats['invalid'] += size - len(rows)
+            yield from rows
+
+    def parse_chunks(self, chunks, workers):
+        """(lines, rows) per chunk, in order, keeping a bounded number of chunks in flight."""
+        if workers <= 1:
+            for chunk in chunks:
+                yield len(chunk), parse_lines(chunk)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((len(chunk), pool.submit(parse_lines, chunk)))
+                if len(pending) >= workers * 4:
+                    size, future = pending.popleft()
+                    yield size, future.result()
+            while pending:
+                size, future = pending.popleft()
+                yield size, future.result()
+
+    def write(self, batch, update):
+        # Conflicting rows are skipped or updated, so the rows added are
+        # counted from the batch's keys before and after the insert.
+        existing = FoodItem.objects.filter(
+            Q(barcode__in=[food.barcode for food in batch if food.barcode])
+            | Q(normalized_name__in=[food.normalized_name for food in batch])
+        )
+        before = existing.count()
+        if update:
+            FoodItem.objects.bulk_create(
+                batch, update_conflicts=True, unique_fields=['barcode'], update_fields=UPSERT_FIELDS
+            )
+        else:
+            FoodItem.objects.bulk_create(batch, ignore_conflicts=True)
+        imported = existing.count() - before
+        self.stats['imported'] += imported
+        if update:
+            self.stats['updated'] += len(batch) - imported
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        elapsed = max(self.last_report - self.started, 1e-9)
+        progress = self.counter.bytes_read / self.total_bytes * 100 if self.total_bytes else 100
+        self.stdout.write(
+            f"{progress:5.1f}%  read {self.stats['read']:,}  imported {self.stats['imported']:,}  "
+            f"duplicates {self.stats['duplicates']:,}  invalid {self.stats['invalid']:,}  "
+            f"{self.stats['read'] / elapsed:,.0f} products/s"
+        )
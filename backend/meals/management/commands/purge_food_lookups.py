@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from meals.lookups import purge_expired_lookups
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired Nutritionix / Open Food Facts lookups from the lookup cache."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_lookups()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired food lookups."))
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:19
+
+import re
+import unicodedata
+
+from django.db import OperationalError, migrations, models
+
+# The trigram search index as of this migration. It is spelled out here
+# rather than imported from meals.search, so later changes to that module
+# cannot change what this migration does.
+SQLITE_INDEX_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS meals_fooditem_fts USING fts5("
+    "normalized_name, content='meals_fooditem', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS meals_fooditem_fts_ai AFTER INSERT ON meals_fooditem BEGIN "
+    "INSERT INTO meals_fooditem_fts(rowid, normalized_name) VALUES (new.id, new.normalized_name); END",
+    "CREATE TRIGGER IF NOT EXISTS meals_fooditem_fts_ad AFTER DELETE ON meals_fooditem BEGIN "
+    "INSERT INTO meals_fooditem_fts(meals_fooditem_fts, rowid, normalized_name) "
+    "VALUES ('delete', old.id, old.normalized_name); END",
+    "CREATE TRIGGER IF NOT EXISTS meals_fooditem_fts_au AFTER UPDATE OF normalized_name ON meals_fooditem BEGIN "
+    "INSERT INTO meals_fooditem_fts(meals_fooditem_fts, rowid, normalized_name) "
+    "VALUES ('delete', old.id, old.normalized_name); "
+    "INSERT INTO meals_fooditem_fts(rowid, normalized_name) VALUES (new.id, new.normalized_name); END",
+    "INSERT INTO meals_fooditem_fts(meals_fooditem_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS meals_fooditem_fts_ai",
+    "DROP TRIGGER IF EXISTS meals_fooditem_fts_ad",
+    "DROP TRIGGER IF EXISTS meals_fooditem_fts_au",
+    "DROP TABLE IF EXISTS meals_fooditem_fts",
+]
+
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS meals_fooditem_name_trgm ON meals_fooditem "
+    "USING gin (normalized_name gin_trgm_ops)",
+]
+
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS meals_fooditem_name_trgm",
+]
+
+
+def normalize_food_name(name):
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^\w]+", " ", name.lower()).split())
+
+
+def fill_normalized_names(apps, schema_editor):
+    FoodItem = apps.get_model("meals", "FoodItem")
+    items = list(FoodItem.objects.only("id", "name"))
+    for item in items:
+        item.normalized_name = normalize_food_name(item.name)
+    FoodItem.objects.bulk_update(items, ["normalized_name"], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            for statement in SQLITE_INDEX_SQL:
+                schema_editor.execute(statement)
+        except OperationalError:
+            # SQLite built without FTS5; search falls back to LIKE queries.
+            pass
+    elif vendor == "postgresql":
+        for statement in POSTGRES_INDEX_SQL:
+            schema_editor.execute(statement)
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_DROP_SQL, "postgresql": POSTGRES_DROP_SQL}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0002_meal_total_calories_alter_fooditem_calories_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fooditem",
+            name="normalized_name",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(fill_normalized_names, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0003_fooditem_normalized_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FoodLookup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "provider",
+                    models.CharField(
+                        choices=[
+                            ("nutritionix", "Nutritionix"),
+                            ("open_food_facts", "Open Food Facts"),
+                        ],
+                        max_length=32,
+                    ),
+                ),
+                ("query", models.CharField(max_length=255)),
+                ("found", models.BooleanField()),
+                ("payload", models.JSONField(blank=True, null=True)),
+                ("fetched_at", models.DateTimeField()),
+                ("expires_at", models.DateTimeField(db_index=True)),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("fetches", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("provider", "query"), name="unique_food_lookup"
+                    )
+                ],
+            },
+        ),
+    ]
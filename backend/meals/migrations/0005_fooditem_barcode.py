@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0004_foodlookup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fooditem",
+            name="barcode",
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:10
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+TOTAL_FIELDS = {
+    "total_calories": "calories",
+}
+
+
+def merge_duplicate_foods(apps, schema_editor):
+    """
+    Keeps the oldest food of every normalized name, the one save_food()
+    reused, and points the meal items of the others at it. The totals of
+    the meals that changed are recomputed.
+    """
+    FoodItem = apps.get_model("meals", "FoodItem")
+    Meal = apps.get_model("meals", "Meal")
+    MealItem = apps.get_model("meals", "MealItem")
+
+    names = (
+        FoodItem.objects.exclude(normalized_name="")
+        .values("normalized_name")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("normalized_name", flat=True)
+    )
+    meal_ids = set()
+    for name in list(names):
+        kept, *duplicates = FoodItem.objects.filter(normalized_name=name).order_by("pk")
+        duplicate_ids = [food.pk for food in duplicates]
+        meal_ids.update(MealItem.objects.filter(food_item_id__in=duplicate_ids).values_list("meal_id", flat=True))
+        MealItem.objects.filter(food_item_id__in=duplicate_ids).update(food_item_id=kept.pk)
+        # Keep a barcode, so later dump imports still recognize the product.
+        barcode = kept.barcode or next((food.barcode for food in duplicates if food.barcode), None)
+        FoodItem.objects.filter(pk__in=duplicate_ids).delete()
+        if barcode != kept.barcode:
+            FoodItem.objects.filter(pk=kept.pk).update(barcode=barcode)
+
+    meals = list(Meal.objects.filter(pk__in=meal_ids).prefetch_related("meal_items__food_item"))
+    for meal in meals:
+        items = list(meal.meal_items.all())
+        for total, field in TOTAL_FIELDS.items():
+            value = sum((getattr(item.food_item, field) * item.quantity_g / Decimal("100.0") for item in items), Decimal("0.0"))
+            setattr(meal, total, value.quantize(Decimal("0.01")))
+    Meal.objects.bulk_update(meals, list(TOTAL_FIELDS), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0005_fooditem_barcode"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_foods, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="fooditem",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("normalized_name", ""), _negated=True),
+                fields=("normalized_name",),
+                name="meals_fooditem_unique_normalized_name",
+            ),
+        ),
+    ]
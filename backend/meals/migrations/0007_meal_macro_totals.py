@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:43
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+TOTAL_FIELDS = {
+    "total_calories": "calories",
+    "total_protein": "protein",
+    "total_carbs": "carbs",
+    "total_fats": "fats",
+}
+
+
+def fill_meal_totals(apps, schema_editor):
+    Meal = apps.get_model("meals", "Meal")
+    meals = list(Meal.objects.prefetch_related("meal_items__food_item"))
+    for meal in meals:
+        items = list(meal.meal_items.all())
+        for total, field in TOTAL_FIELDS.items():
+            value = sum((getattr(item.food_item, field) * item.quantity_g / Decimal("100.0") for item in items), Decimal("0.0"))
+            setattr(meal, total, value.quantize(Decimal("0.01")))
+    Meal.objects.bulk_update(meals, list(TOTAL_FIELDS), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meals", "0006_fooditem_unique_normalized_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="meal",
+            name="total_carbs",
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name="meal",
+            name="total_fats",
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=8),
+        ),
+        migrations.AddField(
+            model_name="meal",
+            name="total_protein",
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=8),
+        ),
+        migrations.RunPython(fill_meal_totals, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,87 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.db.models import Sum, F, DecimalField
+from django.dispatch import Signal, receiver
+from api.transactions import on_commit_once
 from decimal import Decimal
+import re
+import unicodedata
+
+
+def normalize_food_name(name):
+    """
+    Lowercases a food name, strips accents and punctuation and collapses
+    whitespace, so that 'Crème  Brûlée!' and 'creme brulee' compare equal.
+    """
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r'[^\w]+', ' ', name.lower()).split())
+
 
 class FoodItem(models.Model):
     """
     Stores nutritional data for a food item per 100g.
     """
     name = models.CharField(max_length=255)
+    # The search key of meals/search.py, kept in sync with name on save().
+    normalized_name = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    # Set for products imported from an Open Food Facts dump.
+    barcode = models.CharField(max_length=32, unique=True, null=True, blank=True)
     calories = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     protein = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     carbs = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     fats = models.DecimalField(max_digits=5, decimal_places=2, default=0)
 
+    class Meta:
+        constraints = [
+            # One food per name, so concurrent saves from several processes
+            # cannot create duplicates. Names without letters or digits
+            # normalize to '' and are left out.
+            models.UniqueConstraint(
+                fields=['normalized_name'], condition=~models.Q(normalized_name=''),
+                name='meals_fooditem_unique_normalized_name',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_food_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_name'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
+class FoodLookup(models.Model):
+    """
+    A remembered answer of an external nutrition API for a normalized
+    query: the raw payload when it found the food, or a negative result.
+    See meals/lookups.py.
+    """
+    PROVIDER_CHOICES = [
+        ('nutritionix', 'Nutritionix'),
+        ('open_food_facts', 'Open Food Facts'),
+    ]
+
+    provider = models.CharField(max_length=32, choices=PROVIDER_CHOICES)
+    query = models.CharField(max_length=255)
+    found = models.BooleanField()
+    payload = models.JSONField(null=True, blank=True)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    # Searches answered from this entry, and calls made to the provider for it.
+    hits = models.PositiveIntegerField(default=0)
+    fetches = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'query'], name='unique_food_lookup'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_provider_display()}: {self.query} ({'found' if self.found else 'not found'})"
+
 class Meal(models.Model):
     """
     Represents a single meal log for a user on a specific date.
@@ -30,7 +94,11 @@ class Meal(models.Model):
         ('snack', 'Snack'),
     ])
     date = models.DateField()
+    # Sums over the meal's items, kept current by the receivers below.
     total_calories = models.DecimalField(max_digits=8, decimal_places=2, default=0.0)
+    total_protein = models.DecimalField(max_digits=8, decimal_places=2, default=0.0)
+    total_carbs = models.DecimalField(max_digits=8, decimal_places=2, default=0.0)
+    total_fats = models.DecimalField(max_digits=8, decimal_places=2, default=0.0)
 
     def __str__(self):
         return f"{self.user.username}'s {self.get_meal_type_display()} on {self.date}"
@@ -48,24 +116,69 @@ class MealItem(models.Model):
     def __str__(self):
         return f"{self.quantity_g}g of {self.food_item.name}"
 
-# Signal handlers to update Meal total_calories automatically.
-@receiver(post_save, sender=MealItem)
-@receiver(post_delete, sender=MealItem)
-def update_meal_calories(sender, instance, **kwargs):
+# Sent with the meal after add_meal_items() or set_meal_items() wrote its
+# items in bulk, which sends no post_save or post_delete per item.
+meal_items_changed = Signal()
+
+# Meal total field -> FoodItem per-100g field.
+MEAL_TOTAL_FIELDS = {
+    'total_calories': 'calories',
+    'total_protein': 'protein',
+    'total_carbs': 'carbs',
+    'total_fats': 'fats',
+}
+
+def meal_totals(items):
+    """The Meal total fields for the given items, whose food_item is loaded."""
+    return {
+        total: sum(
+            (getattr(item.food_item, field) * item.quantity_g / Decimal('100.0') for item in items),
+            Decimal('0.0'),
+        ).quantize(Decimal('0.01'))
+        for total, field in MEAL_TOTAL_FIELDS.items()
+    }
+
+def add_meal_items(meal, items_data):
+    """
+    Adds items to the meal with a single INSERT and returns them. The meal's
+    totals are updated in memory now, and in the database when the
+    transaction commits.
     """
-    Recalculates and updates the total_calories field of the associated Meal.
+    items = MealItem.objects.bulk_create([MealItem(meal=meal, **data) for data in items_data])
+    for total, value in meal_totals(items).items():
+        setattr(meal, total, (getattr(meal, total) or Decimal('0.0')) + value)
+    meal_items_changed.send(sender=Meal, meal=meal)
+    return items
+
+def set_meal_items(meal, items_data):
+    """Replaces all items of the meal, like add_meal_items()."""
+    # A single DELETE without a post_delete per item: the meal_items_changed
+    # sent by add_meal_items() refreshes the totals and rollup once.
+    MealItem.objects.filter(meal=meal)._raw_delete(MealItem.objects.db)
+    for total in MEAL_TOTAL_FIELDS:
+        setattr(meal, total, Decimal('0.0'))
+    return add_meal_items(meal, items_data)
+
+def recalculate_meal_totals(meal_id):
     """
-    meal = instance.meal
-    
-    aggregation_result = MealItem.objects.filter(meal=meal).aggregate(
-        total=Sum(
-            (F('food_item__calories') * F('quantity_g')) / Decimal('100.0'), 
-            output_field=DecimalField()
-        )
+    Stores the totals of the meal's items on the meal. Summed here rather
+    than in SQL, where SQLite would divide integers.
+    """
+    items = MealItem.objects.filter(meal_id=meal_id).select_related('food_item').only(
+        'quantity_g', *(f'food_item__{field}' for field in MEAL_TOTAL_FIELDS.values())
     )
+    Meal.objects.filter(pk=meal_id).update(**meal_totals(items))
+
+def schedule_meal_totals(meal_id):
+    """Recalculates the meal's totals once, when the current transaction commits."""
+    on_commit_once(('meal_totals', meal_id), lambda: recalculate_meal_totals(meal_id))
 
-    total_calories = aggregation_result['total'] or Decimal('0.0')
+# Signal handlers to keep the Meal totals up to date.
+@receiver(post_save, sender=MealItem)
+@receiver(post_delete, sender=MealItem)
+def update_meal_calories(sender, instance, **kwargs):
+    schedule_meal_totals(instance.meal_id)
 
-    meal.total_calories = total_calories
-    print(f"Updated total calories for {meal}: {meal.total_calories}")
-    meal.save(update_fields=['total_calories'])
+@receiver(meal_items_changed)
+def meal_items_written(sender, meal, **kwargs):
+    schedule_meal_totals(meal.pk)
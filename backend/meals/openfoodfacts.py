@@ -0,0 +1,190 @@
+#
+# File: meals/openfoodfacts.py
+#
+# Streaming import of an offline Open Food Facts export into FoodItem, used
+# by the import_open_food_facts command. The dump is never loaded whole:
+#
+#   open_dump()        the file, gunzipped on the fly if it ends in .gz
+#   read_products()    one dict per product, from JSONL or the tab-separated CSV
+#   normalize_product() per-100g values like OpenFoodFactsProvider, or None
+#   deduplicate()      drops repeated barcodes and normalized names
+#   batched()          lists of FoodItem for bulk_create
+#
+# JSON decoding dominates on the JSONL export, so it can be spread over
+# worker processes (parse_lines()); everything else runs in the main process.
+#
+
+import csv
+import gzip
+import io
+import json
+import sys
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from .models import FoodItem, normalize_food_name
+
+# FoodItem stores per-100g values with max_digits=5: anything above these is bad data.
+MAX_CALORIES = Decimal('900')
+MAX_GRAMS = Decimal('100')
+KJ_PER_KCAL = Decimal('4.184')
+
+NAME_FIELDS = ('product_name', 'product_name_en', 'generic_name')
+NUTRIENT_FIELDS = {
+    'protein': 'proteins_100g',
+    'carbs': 'carbohydrates_100g',
+    'fats': 'fat_100g',
+}
+
+# What deduplicate() finds in seen_names for a name no product has yet.
+_FREE = object()
+
+
+class CountingReader(io.RawIOBase):
+    """Wraps a binary file and counts the bytes read from it, for progress reports."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def open_dump(path):
+    """
+    Returns (text stream, counting reader) for the dump. The reader counts
+    compressed bytes, so bytes_read / file size is the progress.
+    """
+    counter = CountingReader(open(path, 'rb'))
+    binary = io.BufferedReader(counter, buffer_size=1 << 20)
+    if str(path).endswith('.gz'):
+        binary = gzip.GzipFile(fileobj=binary)
+    return io.TextIOWrapper(binary, encoding='utf-8', errors='replace', newline=''), counter
+
+
+def detect_format(path):
+    name = str(path).lower().removesuffix('.gz')
+    if name.endswith(('.jsonl', '.json', '.ndjson')):
+        return 'jsonl'
+    if name.endswith(('.csv', '.tsv')):
+        return 'csv'
+    raise ValueError(f"Cannot tell the format of {path}; pass --format.")
+
+
+def _flatten(product):
+    """The fields normalize_product() reads, from a nested JSONL product."""
+    nutriments = product.get('nutriments') or {}
+    return {
+        'code': product.get('code') or product.get('_id'),
+        **{field: product.get(field) for field in NAME_FIELDS},
+        'energy-kcal_100g': nutriments.get('energy-kcal_100g'),
+        'energy_100g': nutriments.get('energy_100g'),
+        **{field: nutriments.get(field) for field in NUTRIENT_FIELDS.values()},
+    }
+
+
+def read_csv(stream):
+    """Products of the CSV export, which is tab-separated despite its name."""
+    csv.field_size_limit(sys.maxsize)
+    header = stream.readline()
+    delimiter = '\t' if '\t' in header else ','
+    fields = next(csv.reader([header], delimiter=delimiter))
+    yield from csv.DictReader(stream, fieldnames=fields, delimiter=delimiter, quoting=csv.QUOTE_NONE)
+
+
+def _decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return number if number.is_finite() else None
+
+
+def normalize_product(product):
+    """
+    Returns the FoodItem fields of a flat product dict, or None when it has
+    no name or no plausible calorie value. Missing macros count as 0.
+    """
+    name = next((product[field].strip() for field in NAME_FIELDS if (product.get(field) or '').strip()), None)
+    if not name:
+        return None
+
+    calories = _decimal(product.get('energy-kcal_100g'))
+    if calories is None:
+        kilojoules = _decimal(product.get('energy_100g'))
+        calories = kilojoules / KJ_PER_KCAL if kilojoules is not None else None
+    if calories is None or not 0 <= calories <= MAX_CALORIES:
+        return None
+
+    row = {
+        'barcode': (product.get('code') or '').strip()[:32] or None,
+        'name': name[:255],
+        'calories': calories.quantize(Decimal('0.01')),
+    }
+    for field, source in NUTRIENT_FIELDS.items():
+        value = _decimal(product.get(source)) or Decimal('0')
+        if not 0 <= value <= MAX_GRAMS:
+            return None
+        row[field] = value.quantize(Decimal('0.01'))
+    row['normalized_name'] = normalize_food_name(row['name'])
+    return row if row['normalized_name'] else None
+
+
+def parse_lines(lines):
+    """Decodes and normalizes a chunk of JSONL lines. Runs in worker processes."""
+    rows = []
+    for line in lines:
+        try:
+            product = json.loads(line)
+        except ValueError:
+            continue
+        row = normalize_product(_flatten(product)) if isinstance(product, dict) else None
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def deduplicate(rows, seen_barcodes, seen_names, stats):
+    """
+    Drops rows whose barcode or normalized name was seen before, in the
+    dump or in the database. seen_names maps each name to the barcode of
+    the product that has it (None for foods not from a dump): a product
+    being updated may keep its own name. Both hold hashes to keep memory
+    flat.
+    """
+    for row in rows:
+        barcode_key = hash(row['barcode']) if row['barcode'] else None
+        name_key = hash(row['normalized_name'])
+        name_owner = seen_names.get(name_key, _FREE)
+        name_taken = name_owner is not _FREE and (name_owner is None or name_owner != barcode_key)
+        if name_taken or (barcode_key is not None and barcode_key in seen_barcodes):
+            stats['duplicates'] += 1
+            continue
+        seen_names[name_key] = barcode_key
+        if barcode_key is not None:
+            seen_barcodes.add(barcode_key)
+        yield row
+
+
+def batched(rows, size):
+    """FoodItem instances in lists of `size`."""
+    for chunk in chunked(rows, size):
+        yield [FoodItem(**row) for row in chunk]
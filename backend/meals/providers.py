@@ -0,0 +1,304 @@
+#
+# File: meals/providers.py
+#
+# The external food data providers behind search_and_save_food(), and the
+# hedged fan-out across them.
+#
+# A provider fetches a raw payload over HTTP and parses it into a food
+# normalized to 100g. search_providers() asks the providers of
+# FOOD_PROVIDERS in that priority order: the first one at once, and each
+# next one FOOD_PROVIDER_HEDGE_DELAY seconds later (or as soon as every
+# started one has answered without a food). It returns the food of the
+# highest-priority provider that has one, without waiting for the
+# lower-priority providers, so the worst case is the slowest provider
+# rather than the sum of all of them. A delay of 0 asks all at once.
+#
+# Answers are cached through meals/lookups.py, and every call is timed in
+# provider_stats. The HTTP calls go through the shared client of
+# api/outbound.py, so a provider that keeps failing is skipped at once
+# (CircuitOpen) while its circuit is open.
+#
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from api import outbound
+from api.outbound import LatencyStats
+
+from .lookups import UpstreamError, cached_lookup, get_cached, get_cached_many, remember
+from .models import normalize_food_name
+from .search import similarity
+
+# Threads shared by all fan-outs of the process.
+MAX_WORKERS = 16
+
+logger = logging.getLogger(__name__)
+
+# Latency and outcome of every provider call, per provider.
+provider_stats = LatencyStats()
+
+
+class FoodProvider:
+    """
+    An external source of nutrition data. Subclasses implement fetch() and
+    parse(); search() adds the lookup cache and the stats.
+    """
+    name = None
+
+    @property
+    def timeout(self):
+        return settings.OUTBOUND_CONNECT_TIMEOUT, settings.FOOD_PROVIDER_TIMEOUT
+
+    def fetch(self, query):
+        """Returns the raw payload, None if the provider has no match, or raises UpstreamError."""
+        raise NotImplementedError
+
+    def parse(self, payload, query):
+        """Returns the food in the payload as per-100g values, or None."""
+        raise NotImplementedError
+
+    def normalized(self, payload, query):
+        """parse() with missing values zeroed; None unless the food has a name."""
+        food = self.parse(payload, query)
+        if not food or not food.get('name'):
+            return None
+        return {key: (value if value is not None else 0) for key, value in food.items()}
+
+    def timed_fetch(self, query):
+        """fetch() recording the call's latency and outcome in provider_stats."""
+        started = time.perf_counter()
+        try:
+            payload = self.fetch(query)
+        except UpstreamError:
+            provider_stats.record(self.name, 'error', time.perf_counter() - started)
+            raise
+        provider_stats.record(self.name, 'answered' if payload is not None else 'no_match',
+                              time.perf_counter() - started)
+        return payload
+
+    def search(self, query):
+        """The provider's food for the query, from the lookup cache when possible."""
+        return cached_lookup(self.name, query, self.timed_fetch, self.normalized)
+
+
+class NutritionixProvider(FoodProvider):
+    name = 'nutritionix'
+
+    def fetch(self, query):
+        headers = {
+            "x-app-id": settings.NUTRITIONIX_APP_ID,
+            "x-app-key": settings.NUTRITIONIX_API_KEY,
+            "Content-Type": "application/json"
+        }
+        try:
+            response = outbound.post(settings.NUTRITIONIX_BASE_URL, headers=headers, json={"query": query},
+                                     timeout=self.timeout)
+            # Nutritionix answers 404 when it cannot match any food in the query.
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Error calling Nutritionix API: %s", e)
+            raise UpstreamError(str(e)) from e
+
+    def parse(self, result, query):
+        if not result.get("foods"):
+            return None
+        food = result["foods"][0]
+        serving_grams = food.get("serving_weight_grams")
+        if not serving_grams:
+            logger.warning("Nutritionix API did not provide a serving weight for %r. Cannot normalize to 100g.", query)
+            return None
+
+        # Normalize all values to a per-100g basis
+        normalization_factor = 100 / serving_grams
+
+        def per_100g(field):
+            return food[field] * normalization_factor if food.get(field) is not None else 0
+
+        return {
+            "name": food.get("food_name"),
+            "calories": per_100g("nf_calories"),
+            "protein": per_100g("nf_protein"),
+            "carbs": per_100g("nf_total_carbohydrate"),
+            "fats": per_100g("nf_total_fat"),
+        }
+
+
+    def search_many(self, queries):
+        """
+        Resolves several queries with a single natural-language request, one
+        query per line. Returns a (food, serving grams) pair or None per
+        query, in order. Each answer is cached as if it was asked alone.
+        """
+        cached = get_cached_many(self.name, queries)
+        answers = {}
+        misses = []
+        for query in queries:
+            entry = cached.get(normalize_food_name(query))
+            if entry is not None:
+                answers[query] = entry.payload if entry.found else None
+            elif query not in misses:
+                misses.append(query)
+
+        if misses:
+            try:
+                payload = self.timed_fetch('\n'.join(misses))
+            except UpstreamError:
+                payload = None
+                failed = True
+            else:
+                failed = False
+            foods = self.match_foods(misses, payload.get('foods', []) if payload else [])
+            for query, food in zip(misses, foods):
+                single = {'foods': [food]} if food else None
+                if not failed:
+                    remember(self.name, query, single, self.normalized(single, query) if single else None)
+                answers[query] = single
+
+        results = []
+        for query in queries:
+            single = answers[query]
+            food = self.normalized(single, query) if single else None
+            results.append((food, single['foods'][0].get('serving_weight_grams')) if food else None)
+        return results
+
+    def match_foods(self, queries, foods):
+        """
+        Pairs the foods of a multi-line answer with the lines they came from:
+        by position when Nutritionix returned one food per line, otherwise by
+        name similarity. Lines without a food get None.
+        """
+        if len(foods) == len(queries):
+            return list(foods)
+        remaining = list(foods)
+        matched = []
+        for query in queries:
+            key = normalize_food_name(query)
+            scored = [(similarity(key, normalize_food_name(food.get('food_name'))), food) for food in remaining]
+            score, food = max(scored, key=lambda pair: pair[0], default=(0, None))
+            if score > 0:
+                remaining.remove(food)
+                matched.append(food)
+            else:
+                matched.append(None)
+        return matched
+
+
+class OpenFoodFactsProvider(FoodProvider):
+    name = 'open_food_facts'
+
+    def fetch(self, query):
+        params = {
+            "search_terms": query,
+            "json": 1,
+            "page_size": 1,
+        }
+        try:
+            response = outbound.get(settings.OPEN_FOOD_FACTS_BASE_URL, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Error calling Open Food Facts API: %s", e)
+            raise UpstreamError(str(e)) from e
+
+    def parse(self, data, query):
+        if not data.get("products"):
+            return None
+        product = data["products"][0]
+        nutriments = product.get("nutriments", {})
+        return {
+            "name": product.get("product_name"),
+            "calories": nutriments.get("energy-kcal_100g"),
+            "protein": nutriments.get("proteins_100g"),
+            "carbs": nutriments.get("carbohydrates_100g"),
+            "fats": nutriments.get("fat_100g"),
+        }
+
+
+PROVIDERS = {provider.name: provider for provider in (NutritionixProvider, OpenFoodFactsProvider)}
+
+
+def get_providers():
+    """Instances of the providers named in FOOD_PROVIDERS, in priority order."""
+    try:
+        return [PROVIDERS[name]() for name in settings.FOOD_PROVIDERS]
+    except KeyError as e:
+        raise ImproperlyConfigured(f"Unknown food provider {e} in FOOD_PROVIDERS.") from None
+
+
+@lru_cache(maxsize=None)
+def _executor():
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='food-provider')
+
+
+def _fetch_and_parse(provider, query):
+    payload = provider.timed_fetch(query)
+    return payload, provider.normalized(payload, query) if payload is not None else None
+
+
+def search_providers(query, providers=None, hedge_delay=None):
+    """
+    Returns (provider name, food) from the highest-priority provider with a
+    food for the query, or (None, None). Cached answers are read first;
+    the remaining providers are fetched concurrently as described above.
+
+    Only HTTP calls run in the worker threads; the lookup cache is read and
+    written here. Providers not started yet when the answer is known are
+    cancelled, and calls still in flight are abandoned.
+    """
+    providers = get_providers() if providers is None else providers
+    if hedge_delay is None:
+        hedge_delay = settings.FOOD_PROVIDER_HEDGE_DELAY
+
+    # Provider name -> food, or None once it is known to have none.
+    answers = {}
+    for provider in providers:
+        entry = get_cached(provider.name, query)
+        if entry is not None:
+            answers[provider.name] = provider.normalized(entry.payload, query) if entry.found else None
+
+    waiting = [provider for provider in providers if provider.name not in answers]
+    running = {}
+    next_start = time.monotonic()
+    try:
+        while True:
+            for provider in providers:
+                if provider.name not in answers:
+                    break
+                if answers[provider.name] is not None:
+                    return provider.name, answers[provider.name]
+            else:
+                return None, None
+
+            now = time.monotonic()
+            while waiting and (now >= next_start or not running):
+                provider = waiting.pop(0)
+                running[_executor().submit(_fetch_and_parse, provider, query)] = provider
+                next_start = now + hedge_delay
+
+            timeout = max(next_start - now, 0) if waiting else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    payload, food = future.result()
+                except UpstreamError:
+                    # Not cached, so the next search asks again.
+                    answers[provider.name] = None
+                    continue
+                remember(provider.name, query, payload, food)
+                answers[provider.name] = food
+    finally:
+        for future, provider in running.items():
+            if future.cancel():
+                provider_stats.record(provider.name, 'cancelled')
+        for provider in waiting:
+            provider_stats.record(provider.name, 'cancelled')
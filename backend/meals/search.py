@@ -0,0 +1,213 @@
+#
+# File: meals/search.py
+#
+# Local fuzzy search over FoodItem.normalized_name, used by the
+# autocomplete endpoint and by search_and_save_food() before it calls the
+# external APIs.
+#
+# The database narrows the table down to a few dozen candidates through a
+# trigram index: an FTS5 table with the trigram tokenizer on SQLite, a
+# pg_trgm GIN index on PostgreSQL. The candidates are then ranked here by
+# trigram similarity (the measure pg_trgm uses), so both backends rank
+# alike and a typo such as 'chiken' still finds 'chicken'.
+#
+
+from django.db import OperationalError, connection
+from django.db.models import Q
+
+from .models import FoodItem, normalize_food_name
+
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 50
+
+# Rows fetched from the index before ranking.
+CANDIDATE_LIMIT = 50
+
+# Candidates sharing only a trigram or two with the query are left out.
+MIN_AUTOCOMPLETE_SCORE = 0.2
+
+SQLITE_FTS_TABLE = 'meals_fooditem_fts'
+
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+    f"normalized_name, content='meals_fooditem', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON meals_fooditem BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, normalized_name) VALUES (new.id, new.normalized_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON meals_fooditem BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, normalized_name) "
+    f"VALUES ('delete', old.id, old.normalized_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE OF normalized_name ON meals_fooditem BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, normalized_name) "
+    f"VALUES ('delete', old.id, old.normalized_name); "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, normalized_name) VALUES (new.id, new.normalized_name); END",
+]
+
+POSTGRES_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS meals_fooditem_name_trgm ON meals_fooditem "
+    "USING gin (normalized_name gin_trgm_ops)",
+]
+
+
+def install_search_index(conn):
+    """
+    Creates the trigram index of the connection's backend if it is missing
+    and returns whether it did. On SQLite the triggers that keep the FTS
+    table in sync are dropped whenever a migration rebuilds meals_fooditem,
+    so this also runs after every migrate (see MealsConfig.ready()).
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{SQLITE_FTS_TABLE}_a_'],
+            )
+            if cursor.fetchone()[0] == 3:
+                return False
+            try:
+                for statement in SQLITE_INDEX_SQL:
+                    cursor.execute(statement)
+            except OperationalError:
+                # SQLite built without FTS5; search falls back to LIKE queries.
+                return False
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+            return True
+        if conn.vendor == 'postgresql':
+            for statement in POSTGRES_INDEX_SQL:
+                cursor.execute(statement)
+            return True
+    return False
+
+
+def drop_search_index(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+        elif conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS meals_fooditem_name_trgm")
+
+
+def trigrams(text):
+    """The trigrams of each word padded like pg_trgm: two spaces before, one after."""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(query, name):
+    """Trigram similarity of two normalized names, from 0 to 1."""
+    a, b = trigrams(query), trigrams(name)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def autocomplete_score(query, name):
+    """
+    similarity(), raised for names that start with the query, or with a word
+    that does, in proportion to how much of the name the query covers.
+    """
+    score = similarity(query, name)
+    coverage = len(query) / len(name) if name else 0
+    if name.startswith(query):
+        score = max(score, 0.6 + 0.4 * coverage)
+    elif f' {query}' in f' {name}':
+        score = max(score, 0.5 + 0.4 * coverage)
+    return score
+
+
+def _fts_query(queries):
+    # Quoted, so that FTS5 operators in the input are taken literally.
+    grams = set()
+    for query in queries:
+        compact = query.replace('"', '')
+        grams.update(compact[i:i + 3] for i in range(len(compact) - 2))
+    return ' OR '.join(f'"{gram}"' for gram in sorted(grams))
+
+
+def _candidates(queries):
+    """
+    The food items that may match any of the normalized queries, fetched in
+    a single statement (two when short and long queries are mixed on SQLite).
+    """
+    limit = CANDIDATE_LIMIT * len(queries)
+    table = FoodItem._meta.db_table
+    candidates = []
+    if connection.vendor == 'sqlite':
+        long_queries = [query for query in queries if len(query) >= 3]
+        if long_queries:
+            try:
+                candidates = list(FoodItem.objects.raw(
+                    f"SELECT {table}.* FROM {SQLITE_FTS_TABLE} JOIN {table} ON {table}.id = {SQLITE_FTS_TABLE}.rowid "
+                    f"WHERE {SQLITE_FTS_TABLE} MATCH %s ORDER BY {SQLITE_FTS_TABLE}.rank LIMIT %s",
+                    [_fts_query(long_queries), limit],
+                ))
+                queries = [query for query in queries if len(query) < 3]
+            except OperationalError:
+                pass
+    elif connection.vendor == 'postgresql':
+        where = ' OR '.join(
+            "normalized_name %% %s OR %s <%% normalized_name OR normalized_name LIKE %s" for _ in queries
+        )
+        params = [param for query in queries for param in (query, query, f'{query}%')]
+        return list(FoodItem.objects.raw(
+            f"SELECT * FROM {table} WHERE {where} "
+            f"ORDER BY greatest({', '.join('word_similarity(%s, normalized_name)' for _ in queries)}) DESC LIMIT %s",
+            [*params, *queries, limit],
+        ))
+
+    if queries:
+        # Short queries, and backends without a trigram index: prefix matches only.
+        prefix = Q()
+        for query in queries:
+            prefix |= Q(normalized_name__startswith=query) | Q(normalized_name__contains=f' {query}')
+        candidates += FoodItem.objects.filter(prefix)[:limit]
+    return candidates
+
+
+def _ranked(query, candidates, score):
+    scored = [(item, score(query, item.normalized_name)) for item in candidates]
+    scored.sort(key=lambda pair: (-pair[1], len(pair[0].normalized_name), pair[0].normalized_name))
+    return scored
+
+
+def ranked_candidates(query, score=similarity):
+    """Returns [(food_item, score)] for the query, best first."""
+    query = normalize_food_name(query)
+    if not query:
+        return []
+    return _ranked(query, _candidates([query]), score)
+
+
+def autocomplete(query, limit=AUTOCOMPLETE_LIMIT):
+    """The best `limit` food items for a partial or misspelt name, with their scores."""
+    ranked = ranked_candidates(query, autocomplete_score)
+    return [(item, score) for item, score in ranked if score >= MIN_AUTOCOMPLETE_SCORE][:limit]
+
+
+def best_local_match(query, threshold):
+    """The closest food item if its similarity reaches the threshold, else None."""
+    candidates = ranked_candidates(query)
+    if candidates and candidates[0][1] >= threshold:
+        return candidates[0][0]
+    return None
+
+
+def best_local_matches(queries, threshold):
+    """
+    best_local_match() for several queries at once, with one candidate
+    fetch for all of them. Returns a food item or None per query, in order.
+    """
+    normalized = [normalize_food_name(query) for query in queries]
+    distinct = sorted({query for query in normalized if query})
+    candidates = list({item.id: item for item in _candidates(distinct)}.values()) if distinct else []
+
+    matches = []
+    for query in normalized:
+        ranked = _ranked(query, candidates, similarity) if query else []
+        matches.append(ranked[0][0] if ranked and ranked[0][1] >= threshold else None)
+    return matches
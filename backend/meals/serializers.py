@@ -1,16 +1,35 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Meal, FoodItem, MealItem
+from .models import Meal, FoodItem, MealItem, add_meal_items, set_meal_items
 
 class FoodItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = FoodItem
-        fields = '__all__'
+        exclude = ['normalized_name']
+
+class MealItemListSerializer(serializers.ListSerializer):
+    """
+    Looks up the food items of all meal items with one query, instead of one
+    query per item.
+    """
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        foods = FoodItem.objects.in_bulk({item['food_item'] for item in items})
+        message = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        errors = [
+            {} if item['food_item'] in foods else {'food_item_id': [message.format(pk_value=item['food_item'])]}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        for item in items:
+            item['food_item'] = foods[item['food_item']]
+        return items
 
 class MealItemSerializer(serializers.ModelSerializer):
     food_item = FoodItemSerializer(read_only=True)
-    food_item_id = serializers.PrimaryKeyRelatedField(
-        queryset=FoodItem.objects.all(), source='food_item', write_only=True
-    )
+    # Resolved to a FoodItem by MealItemListSerializer.
+    food_item_id = serializers.IntegerField(source='food_item', write_only=True)
     
     calories = serializers.SerializerMethodField()
     protein = serializers.SerializerMethodField()
@@ -20,6 +39,7 @@ class MealItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = MealItem
         fields = ['id', 'food_item', 'food_item_id', 'quantity_g', 'calories', 'protein', 'carbs', 'fats']
+        list_serializer_class = MealItemListSerializer
 
     def get_calories(self, obj):
         return round(obj.food_item.calories * (obj.quantity_g / 100), 2)
@@ -49,11 +69,9 @@ class MealSerializer(serializers.ModelSerializer):
    
     def create(self, validated_data):
         meal_items_data = validated_data.pop('meal_items')
-        meal = Meal.objects.create(**validated_data)
-        
-        for item_data in meal_items_data:
-            MealItem.objects.create(meal=meal, **item_data)
-        
+        with transaction.atomic():
+            meal = Meal.objects.create(**validated_data)
+            add_meal_items(meal, meal_items_data)
         return meal
 
     def update(self, instance, validated_data):
@@ -64,13 +82,9 @@ class MealSerializer(serializers.ModelSerializer):
         
         instance.meal_type = validated_data.get('meal_type', instance.meal_type)
         instance.date = validated_data.get('date', instance.date)
-        instance.save()
-
-        instance.meal_items.all().delete()
-
-        for item_data in meal_items_data:
-            MealItem.objects.create(meal=instance, **item_data)
-            
+        with transaction.atomic():
+            instance.save()
+            set_meal_items(instance, meal_items_data)
         return instance
 class DailyCalorieSerializer(serializers.Serializer):
     """
@@ -0,0 +1,71 @@
+#
+# File: meals/testing.py
+#
+# A stub HTTP server standing in for one external food provider in tests.
+# It answers every GET or POST with a fixed status and JSON payload after
+# a configurable delay, and counts the requests and connections it received.
+#
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubFoodAPIServer(ThreadingHTTPServer):
+    """Use as a context manager; every attribute may be changed between requests."""
+    daemon_threads = True
+
+    def __init__(self, payload=None, status=200, latency=0.0):
+        super().__init__(('127.0.0.1', 0), StubFoodAPIHandler)
+        self.payload = payload if payload is not None else {}
+        self.status = status
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class StubFoodAPIHandler(BaseHTTPRequestHandler):
+    # Keeps connections open, so that clients can reuse them.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+
+        body = json.dumps(self.server.payload).encode()
+        try:
+            self.send_response(self.server.status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client gave up on the request.
+            pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def log_message(self, format, *args):
+        pass
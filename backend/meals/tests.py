@@ -1,3 +1,614 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.query import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analysis.models import DailyRollup
+from analysis.rollups import refresh_rollup
+from users.models import Profile
+
+from .api_services import MAX_QUERY_LENGTH, parse_quantity, save_food, search_and_save_food, split_meal_description
+from .lookups import lookup_stats
+from .management.commands.import_open_food_facts import Command as ImportCommand
+from .models import (
+    FoodItem, FoodLookup, Meal, MealItem, normalize_food_name, recalculate_meal_totals, set_meal_items,
+)
+from .providers import NutritionixProvider, provider_stats, search_providers
+from .search import autocomplete, best_local_match, similarity
+from .testing import StubFoodAPIServer
+
+
+class FoodSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ['Chicken Breast', 'Chicken Thigh', 'Chickpeas', 'Crème Brûlée', 'Apple', 'Pineapple', 'Oats']:
+            FoodItem.objects.create(name=name)
+
+    def names(self, results):
+        return [item.name for item, _ in results]
+
+    def test_normalize_food_name(self):
+        self.assertEqual(normalize_food_name('  Crème  Brûlée!'), 'creme brulee')
+        self.assertEqual(FoodItem.objects.get(name='Crème Brûlée').normalized_name, 'creme brulee')
+
+    def test_index_follows_renames_and_deletes(self):
+        oats = FoodItem.objects.get(name='Oats')
+        oats.name = 'Rolled Oats'
+        oats.save()
+        self.assertEqual(self.names(autocomplete('rolled')), ['Rolled Oats'])
+
+        oats.delete()
+        self.assertEqual(autocomplete('rolled'), [])
+
+    def test_prefix_ranks_first(self):
+        self.assertEqual(self.names(autocomplete('chick'))[:3], ['Chickpeas', 'Chicken Thigh', 'Chicken Breast'])
+        self.assertEqual(self.names(autocomplete('ch', limit=1)), ['Chickpeas'])
+        self.assertEqual(self.names(autocomplete('breast')), ['Chicken Breast'])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.names(autocomplete('chiken breast'))[0], 'Chicken Breast')
+        self.assertEqual(best_local_match('creme brule', threshold=0.5).name, 'Crème Brûlée')
+
+    def test_best_local_match_threshold(self):
+        self.assertEqual(best_local_match('APPLE', threshold=0.5).name, 'Apple')
+        self.assertIsNone(best_local_match('banana', threshold=0.5))
+        self.assertGreater(similarity('apple', 'apple'), similarity('apple', 'pineapple'))
+
+    @override_settings(FOOD_SEARCH_MATCH_THRESHOLD=0.5)
+    def test_external_apis_only_below_threshold(self):
+        with mock.patch('meals.api_services.search_providers') as providers:
+            food_item, created = search_and_save_food('chicken brest')
+        self.assertEqual((food_item.name, created), ('Chicken Breast', False))
+        providers.assert_not_called()
+
+        banana = {'name': 'banana', 'calories': 89, 'protein': 1.1, 'carbs': 22.8, 'fats': 0.3}
+        with mock.patch('meals.api_services.search_providers', return_value=('nutritionix', banana)) as providers:
+            food_item, created = search_and_save_food('banana')
+        providers.assert_called_once_with('banana')
+        self.assertTrue(created)
+
+    def test_autocomplete_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='eater'))
+
+        response = client.get('/api/meals/food-autocomplete/', {'q': 'pine'})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results'][0]
+        self.assertEqual(result['name'], 'Pineapple')
+        self.assertNotIn('normalized_name', result)
+
+        self.assertEqual(client.get('/api/meals/food-autocomplete/').status_code, 400)
+        self.assertEqual(client.get('/api/meals/food-autocomplete/', {'q': 'x', 'limit': 'a'}).status_code, 400)
+
+    def test_search_endpoint_rejects_queries_too_long_to_cache(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='eater'))
+
+        with mock.patch('meals.api_services.search_providers', return_value=(None, None)) as providers:
+            response = client.post('/api/meals/food-search/', {'query': 'a' * (MAX_QUERY_LENGTH + 1)}, format='json')
+            self.assertEqual(response.status_code, 400)
+            providers.assert_not_called()
+
+            response = client.post('/api/meals/food-search/', {'query': 'b' * MAX_QUERY_LENGTH}, format='json')
+        self.assertEqual(response.status_code, 404)
+        providers.assert_called_once_with('b' * MAX_QUERY_LENGTH)
+
+
+def nutritionix_response(status_code=200, foods=()):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = {'foods': list(foods)}
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(f'{status_code} Error')
+    return response
+
+
+SALMON = {'food_name': 'salmon', 'serving_weight_grams': 50, 'nf_calories': 104,
+          'nf_protein': 10, 'nf_total_carbohydrate': 0, 'nf_total_fat': 7}
+
+
+@override_settings(FOOD_LOOKUP_TTL=3600, FOOD_LOOKUP_NEGATIVE_TTL=60)
+class FoodLookupCacheTests(TestCase):
+    def test_hits_are_cached_by_normalized_query(self):
+        with mock.patch('api.outbound.post', return_value=nutritionix_response(foods=[SALMON])) as post:
+            first = NutritionixProvider().search('Salmon')
+            second = NutritionixProvider().search(' salmon! ')
+        post.assert_called_once()
+        self.assertEqual(first, second)
+        self.assertEqual(first['calories'], 208)
+
+        lookup = FoodLookup.objects.get()
+        self.assertEqual((lookup.query, lookup.found, lookup.hits, lookup.fetches), ('salmon', True, 1, 1))
+        self.assertEqual(lookup.payload['foods'][0]['food_name'], 'salmon')
+        self.assertAlmostEqual((lookup.expires_at - lookup.fetched_at).total_seconds(), 3600)
+
+    def test_misses_are_cached_with_their_own_ttl(self):
+        with mock.patch('api.outbound.post', return_value=nutritionix_response(status_code=404)) as post:
+            self.assertIsNone(NutritionixProvider().search('salmn'))
+            self.assertIsNone(NutritionixProvider().search('salmn'))
+        post.assert_called_once()
+
+        lookup = FoodLookup.objects.get()
+        self.assertFalse(lookup.found)
+        self.assertIsNone(lookup.payload)
+        self.assertAlmostEqual((lookup.expires_at - lookup.fetched_at).total_seconds(), 60)
+
+    def test_failures_are_not_cached(self):
+        with mock.patch('api.outbound.post', side_effect=requests.Timeout('timed out')), \
+                self.assertLogs('meals.providers', 'WARNING') as logs:
+            self.assertIsNone(NutritionixProvider().search('salmon'))
+        self.assertFalse(FoodLookup.objects.exists())
+        self.assertEqual(logs.output, ['WARNING:meals.providers:Error calling Nutritionix API: timed out'])
+
+        with mock.patch('api.outbound.post', return_value=nutritionix_response(status_code=503)), \
+                self.assertLogs('meals.providers', 'WARNING'):
+            self.assertIsNone(NutritionixProvider().search('salmon'))
+        self.assertFalse(FoodLookup.objects.exists())
+
+    def test_expired_entries_are_refetched(self):
+        with mock.patch('api.outbound.post', return_value=nutritionix_response(status_code=404)):
+            NutritionixProvider().search('salmon')
+        FoodLookup.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        with mock.patch('api.outbound.post', return_value=nutritionix_response(foods=[SALMON])) as post:
+            self.assertEqual(NutritionixProvider().search('salmon')['name'], 'salmon')
+        post.assert_called_once()
+        lookup = FoodLookup.objects.get()
+        self.assertEqual((lookup.found, lookup.fetches), (True, 2))
+
+    def test_hit_rate_in_admin(self):
+        with mock.patch('api.outbound.post', return_value=nutritionix_response(status_code=404)):
+            for _ in range(4):
+                NutritionixProvider().search('salmn')
+        self.assertEqual(lookup_stats(), {'hits': 3, 'fetches': 1, 'hit_rate': 0.75})
+
+        self.client.force_login(User.objects.create_superuser(username='admin', password='secret-pass-123'))
+        response = self.client.get('/admin/meals/foodlookup/')
+        self.assertContains(response, 'hit rate 75%')
+
+
+def nutritionix_payload(name):
+    return {'foods': [{**SALMON, 'food_name': name}]}
+
+
+def open_food_facts_payload(name):
+    return {'products': [{'product_name': name, 'nutriments': {'energy-kcal_100g': 100}}]}
+
+
+class ProviderFanOutTests(TestCase):
+    def setUp(self):
+        provider_stats.reset()
+        self.nutritionix = StubFoodAPIServer(nutritionix_payload('nutritionix salmon')).__enter__()
+        self.open_food_facts = StubFoodAPIServer(open_food_facts_payload('off salmon')).__enter__()
+        self.addCleanup(self.nutritionix.__exit__)
+        self.addCleanup(self.open_food_facts.__exit__)
+        settings_override = override_settings(
+            NUTRITIONIX_BASE_URL=self.nutritionix.url, OPEN_FOOD_FACTS_BASE_URL=self.open_food_facts.url,
+            FOOD_PROVIDERS=['nutritionix', 'open_food_facts'], FOOD_PROVIDER_TIMEOUT=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def search(self, hedge_delay):
+        started = time.perf_counter()
+        result = search_providers('salmon', hedge_delay=hedge_delay)
+        return result, time.perf_counter() - started
+
+    def test_concurrent_latency_is_the_slowest_provider(self):
+        self.nutritionix.status = 404
+        self.nutritionix.latency = self.open_food_facts.latency = 0.4
+
+        (provider, food), elapsed = self.search(hedge_delay=0)
+        self.assertEqual((provider, food['name']), ('open_food_facts', 'off salmon'))
+        self.assertLess(elapsed, 0.75)
+
+    def test_priority_order_wins_over_speed(self):
+        self.nutritionix.latency = 0.2
+
+        (provider, food), _ = self.search(hedge_delay=0)
+        self.assertEqual((provider, food['name']), ('nutritionix', 'nutritionix salmon'))
+
+    def test_hedge_is_cancelled_when_first_provider_answers(self):
+        (provider, _), _ = self.search(hedge_delay=0.5)
+        self.assertEqual(provider, 'nutritionix')
+        self.assertEqual(self.open_food_facts.requests, 0)
+        self.assertEqual(provider_stats.snapshot()['open_food_facts']['outcomes'], {'cancelled': 1})
+
+    def test_hedge_fires_after_delay(self):
+        self.nutritionix.latency = 1.0
+        (provider, _), elapsed = self.search(hedge_delay=0.2)
+        # Open Food Facts answers, but Nutritionix has priority and still has a food.
+        self.assertEqual(provider, 'nutritionix')
+        self.assertEqual(self.open_food_facts.requests, 1)
+
+        FoodLookup.objects.all().delete()
+        self.nutritionix.status = 500
+        (provider, _), elapsed = self.search(hedge_delay=0.2)
+        self.assertEqual(provider, 'open_food_facts')
+        self.assertLess(elapsed, 1.5)
+
+    def test_errors_fall_through_and_are_not_cached(self):
+        self.nutritionix.status = 503
+        with self.assertLogs('meals.providers', 'WARNING'):
+            (provider, _), _ = self.search(hedge_delay=0)
+        self.assertEqual(provider, 'open_food_facts')
+        self.assertEqual(list(FoodLookup.objects.values_list('provider', flat=True)), ['open_food_facts'])
+        self.assertEqual(provider_stats.snapshot()['nutritionix']['outcomes'], {'error': 1})
+
+    def test_cached_answers_skip_the_providers(self):
+        # Open Food Facts answers first, so neither call is still in flight
+        # once the search returns.
+        self.nutritionix.latency = 0.2
+        self.search(hedge_delay=0)
+        self.assertEqual(FoodLookup.objects.count(), 2)
+        self.nutritionix.requests = self.open_food_facts.requests = 0
+
+        (provider, food), _ = self.search(hedge_delay=0)
+        self.assertEqual((provider, food['name']), ('nutritionix', 'nutritionix salmon'))
+        self.assertEqual(self.nutritionix.requests + self.open_food_facts.requests, 0)
+
+    def test_nothing_found(self):
+        self.nutritionix.status = 404
+        self.open_food_facts.payload = {'products': []}
+        self.assertEqual(self.search(hedge_delay=0.1)[0], (None, None))
+        self.assertEqual(FoodLookup.objects.filter(found=False).count(), 2)
+
+    def test_stats_endpoint(self):
+        # Open Food Facts answers first, so both answers are stored.
+        self.nutritionix.latency = 0.2
+        self.search(hedge_delay=0)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='staff', is_staff=True))
+
+        data = client.get('/api/meals/food-provider-stats/').json()
+        self.assertEqual(data['providers']['nutritionix']['calls'], 1)
+        self.assertIsNotNone(data['providers']['nutritionix']['latency_ms'])
+        self.assertEqual(data['lookup_cache']['fetches'], 2)
+
+
+@override_settings(FOOD_PROVIDERS=['nutritionix'], SINGLE_FLIGHT_CACHE='')
+class ConcurrentFoodSearchTests(TransactionTestCase):
+    def setUp(self):
+        self.nutritionix = StubFoodAPIServer(nutritionix_payload('Grilled Salmon'), latency=0.3).__enter__()
+        self.addCleanup(self.nutritionix.__exit__)
+        settings_override = override_settings(NUTRITIONIX_BASE_URL=self.nutritionix.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def search(self, query):
+        try:
+            return search_and_save_food(query)
+        finally:
+            connection.close()
+
+    def test_identical_searches_share_one_upstream_call(self):
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(self.search, ['grilled salmon', 'Grilled  Salmon!'] * 3))
+
+        self.assertEqual(self.nutritionix.requests, 1)
+        self.assertEqual(FoodItem.objects.count(), 1)
+        self.assertEqual({food_item.pk for food_item, _ in results}, {FoodItem.objects.get().pk})
+        self.assertEqual(sum(created for _, created in results), 1)
+
+    def test_saving_reuses_the_food_with_the_same_normalized_name(self):
+        existing = FoodItem.objects.create(name='Grilled salmon', calories=200)
+        food_item, created = save_food({'name': 'Grilled Salmon', 'calories': 208, 'protein': 20, 'carbs': 0, 'fats': 14})
+        self.assertEqual((food_item.pk, created), (existing.pk, False))
+
+    def test_saving_reuses_the_food_another_process_just_saved(self):
+        other = FoodItem.objects.create(name='grilled SALMON', calories=210)
+        real_first = QuerySet.first
+        lookups = []
+
+        def first(queryset):
+            lookups.append(queryset)
+            # The lookup ran before the other process saved its row.
+            return None if len(lookups) == 1 else real_first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=first):
+            food_item, created = save_food({'name': 'Grilled Salmon', 'calories': 208})
+        self.assertEqual((food_item.pk, created), (other.pk, False))
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(FoodItem.objects.count(), 1)
+
+    def test_names_are_unique(self):
+        FoodItem.objects.create(name='Grilled salmon')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FoodItem.objects.create(name='grilled  SALMON!')
+        # Names without letters or digits are not compared.
+        FoodItem.objects.create(name='???')
+        FoodItem.objects.create(name='!!!')
+
+
+class BatchFoodSearchTests(TestCase):
+    def setUp(self):
+        FoodItem.objects.create(name='Chicken Breast', calories=165)
+        egg = {**SALMON, 'food_name': 'egg', 'serving_weight_grams': 100, 'nf_calories': 143}
+        toast = {**SALMON, 'food_name': 'toast', 'serving_weight_grams': 30, 'nf_calories': 80}
+        self.nutritionix = StubFoodAPIServer({'foods': [egg, toast]}).__enter__()
+        self.addCleanup(self.nutritionix.__exit__)
+        settings_override = override_settings(NUTRITIONIX_BASE_URL=self.nutritionix.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='batch'))
+
+    def post(self, data):
+        return self.client.post('/api/meals/food-search/batch/', data, format='json')
+
+    def test_description_is_resolved_in_one_upstream_call(self):
+        response = self.post({'description': '150g chiken breast, 2 eggs and a slice of toast'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+
+        self.assertEqual(self.nutritionix.requests, 1)
+        self.assertEqual([r['query'] for r in results], ['150g chiken breast', '2 eggs', 'a slice of toast'])
+        self.assertEqual([r['food_item']['name'] for r in results], ['Chicken Breast', 'egg', 'toast'])
+        self.assertEqual([r['source'] for r in results], ['local', 'nutritionix', 'nutritionix'])
+        self.assertEqual([r['quantity_g'] for r in results], [150, 100, 30])
+
+        # The answers are cached per query, so repeating the search stays local.
+        self.post({'queries': ['2 eggs', 'a slice of toast']})
+        self.assertEqual(self.nutritionix.requests, 1)
+
+    def test_unmatched_queries_keep_their_place(self):
+        self.nutritionix.payload = {'foods': [{**SALMON, 'food_name': 'toast'}]}
+        results = self.post({'queries': ['xyzzy', 'toast']}).json()['results']
+        self.assertIsNone(results[0]['food_item'])
+        self.assertEqual(results[1]['food_item']['name'], 'toast')
+
+    def test_validation(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post({'queries': ['rice', '']}).status_code, 400)
+        self.assertEqual(self.post({'queries': ['rice'] * 21}).status_code, 400)
+        self.assertEqual(self.post({'queries': ['rice', 'r' * (MAX_QUERY_LENGTH + 1)]}).status_code, 400)
+        self.assertEqual(self.post({'description': f"rice and {'r' * (MAX_QUERY_LENGTH + 1)}"}).status_code, 400)
+        self.assertEqual(self.nutritionix.requests, 0)
+
+    def test_parsing(self):
+        self.assertEqual(split_meal_description('Eggs with toast; coffee\nand jam'), ['Eggs', 'toast', 'coffee', 'jam'])
+        self.assertEqual(parse_quantity('150 grams of rice'), (150.0, 'rice'))
+        self.assertEqual(parse_quantity('1/2 cup of oats'), (None, 'oats'))
+
+
+class OpenFoodFactsImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def product(self, code, name, kcal=100, **nutriments):
+        return {'code': code, 'product_name': name, 'nutriments': {'energy-kcal_100g': kcal, **nutriments}}
+
+    def write_jsonl(self, products):
+        path = os.path.join(self.directory, 'products.jsonl.gz')
+        with gzip.open(path, 'wt') as dump:
+            for product in products:
+                dump.write((product if isinstance(product, str) else json.dumps(product)) + '\n')
+        return path
+
+    def run_import(self, path, *args):
+        output = StringIO()
+        call_command('import_open_food_facts', path, '--workers', '1', *args, stdout=output)
+        return output.getvalue()
+
+    def test_jsonl_import_normalizes_and_deduplicates(self):
+        FoodItem.objects.create(name='Greek Yogurt')
+        path = self.write_jsonl([
+            self.product('1', 'Rolled Oats', 380, proteins_100g=13, carbohydrates_100g=67, fat_100g=7),
+            self.product('1', 'Rolled Oats (again)'),
+            self.product('2', 'ROLLED OATS!'),
+            self.product('3', 'Greek yogurt'),
+            self.product('4', 'Kilojoules only', None, energy_100g=418.4),
+            self.product('5', 'Too energetic', 5000),
+            self.product('6', ''),
+            'not json',
+        ])
+
+        output = self.run_import(path)
+        self.assertIn('Imported 2 of 8 products', output)
+        self.assertIn('duplicates 3', output)
+        self.assertIn('invalid 3', output)
+
+        oats = FoodItem.objects.get(barcode='1')
+        self.assertEqual((oats.name, oats.normalized_name), ('Rolled Oats', 'rolled oats'))
+        self.assertEqual((oats.calories, oats.protein, oats.carbs, oats.fats),
+                         (Decimal('380'), Decimal('13'), Decimal('67'), Decimal('7')))
+        self.assertEqual(FoodItem.objects.get(barcode='4').calories, Decimal('100'))
+        # Imported rows are searchable straight away.
+        self.assertEqual(autocomplete('rolled')[0][0], oats)
+
+    def test_csv_import_and_update(self):
+        path = os.path.join(self.directory, 'products.csv')
+        with open(path, 'w') as dump:
+            dump.write('code\tproduct_name\tenergy-kcal_100g\tproteins_100g\tcarbohydrates_100g\tfat_100g\n')
+            dump.write('10\tBrown Rice\t111\t2.6\t23\t0.9\n')
+            dump.write('11\tLentils\t116\t9\t20\t0.4\n')
+        self.run_import(path)
+        self.assertEqual(FoodItem.objects.get(barcode='10').calories, Decimal('111'))
+
+        # Re-importing skips known products unless asked to update them.
+        with open(path, 'a') as dump:
+            dump.write('12\tQuinoa\t120\t4.4\t21\t1.9\n')
+        updated = path.replace('.csv', '.tsv')
+        with open(path) as source, open(updated, 'w') as dump:
+            dump.write(source.read().replace('\t111\t', '\t112\t'))
+
+        self.assertIn('Imported 1 of 3', self.run_import(updated))
+        self.assertEqual(FoodItem.objects.get(barcode='10').calories, Decimal('111'))
+        self.assertIn('Imported 0, updated 3 of 3', self.run_import(updated, '--update'))
+        self.assertEqual(FoodItem.objects.get(barcode='10').calories, Decimal('112'))
+        self.assertEqual(FoodItem.objects.count(), 3)
+
+    def test_update_keeps_names_unique(self):
+        self.run_import(self.write_jsonl([self.product('1', 'Rolled Oats'), self.product('2', 'Lentils')]))
+        path = self.write_jsonl([
+            self.product('1', 'Rolled oats', 390),
+            self.product('3', 'LENTILS'),
+            self.product('2', 'Red lentils', 120),
+        ])
+
+        output = self.run_import(path, '--update')
+        self.assertIn('Imported 0, updated 2 of 3', output)
+        self.assertIn('duplicates 1', output)
+        self.assertEqual(sorted(FoodItem.objects.values_list('barcode', 'normalized_name', 'calories')),
+                         [('1', 'rolled oats', Decimal('390')), ('2', 'red lentils', Decimal('120'))])
+
+    def test_rows_skipped_by_the_database_are_not_counted(self):
+        FoodItem.objects.create(name='Rolled Oats', barcode='1')
+        path = self.write_jsonl([self.product('1', 'Rolled Oats'), self.product('2', 'Lentils')])
+        # As if another import inserted the first product after the known keys were read.
+        with mock.patch.object(ImportCommand, 'existing_keys', return_value=(set(), {})):
+            self.assertIn('Imported 1 of 2', self.run_import(path))
+        self.assertEqual(FoodItem.objects.count(), 2)
+
+
+class MealItemWriteTests(TestCase):
+    # The food item lookup, the existing meal check, the meal and item
+    # INSERTs, two savepoints, and the items and food items of the response.
+    QUERY_BUDGET = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='eater')
+        self.foods = [
+            FoodItem.objects.create(name=f'Food {i}', calories=100 + i, protein=10, carbs=Decimal('20.5'), fats=i)
+            for i in range(20)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def items(self, foods, grams=50):
+        return [{'food_item_id': food.pk, 'quantity_g': grams} for food in foods]
+
+    def post(self, items, meal_type='lunch'):
+        return self.client.post(
+            '/api/meals/meals/', {'meal_type': meal_type, 'date': '2025-03-10', 'meal_items': items}, format='json'
+        )
+
+    def commit_jobs(self):
+        """Patches that count the meal total recalculations and rollup refreshes."""
+        return (
+            mock.patch('meals.models.recalculate_meal_totals', wraps=recalculate_meal_totals),
+            mock.patch('analysis.signals.refresh_rollup', wraps=refresh_rollup),
+        )
+
+    def test_twenty_item_meal_query_budget(self):
+        recalculate, refresh = self.commit_jobs()
+        with recalculate as recalculated, refresh as refreshed, self.captureOnCommitCallbacks(execute=True), \
+                self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.post(self.items(self.foods))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['meal_items']), 20)
+
+        # One rollup refresh and one meal total recalculation, both at commit.
+        self.assertEqual((recalculated.call_count, refreshed.call_count), (1, 1))
+        expected = sum(Decimal(100 + i) / 2 for i in range(20))
+        self.assertEqual(Decimal(response.json()['total_calories']), expected)
+        meal = Meal.objects.get()
+        totals = {'total_calories': expected, 'total_protein': Decimal('100.00'),
+                  'total_carbs': Decimal('205.00'), 'total_fats': Decimal('95.00')}
+        self.assertEqual({field: getattr(meal, field) for field in totals}, totals)
+        self.assertEqual({field: Decimal(response.json()[field]) for field in totals}, totals)
+
+        rollup = DailyRollup.objects.get(user=self.user, date='2025-03-10')
+        self.assertEqual((rollup.calories_consumed, rollup.protein_g, rollup.carbs_g, rollup.fats_g),
+                         tuple(totals.values()))
+
+    def test_appending_recalculates_once(self):
+        # The same, without the meal INSERT and the serializer's savepoint.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(self.items(self.foods[:2]))
+        recalculate, refresh = self.commit_jobs()
+        with recalculate as recalculated, refresh as refreshed, self.captureOnCommitCallbacks(execute=True), \
+                self.assertNumQueries(self.QUERY_BUDGET - 3):
+            response = self.post(self.items(self.foods[2:12]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((recalculated.call_count, refreshed.call_count), (1, 1))
+        self.assertEqual(MealItem.objects.count(), 12)
+
+        expected = sum(Decimal(100 + i) / 2 for i in range(12))
+        self.assertEqual(Decimal(response.json()['total_calories']), expected)
+        self.assertEqual(Meal.objects.get().total_calories, expected)
+
+    def test_replacing_and_deleting_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            meal_id = self.post(self.items(self.foods[:5])).json()['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/meals/meals/{meal_id}/', {
+                'meal_type': 'dinner', 'date': '2025-03-10', 'meal_items': self.items(self.foods[:1], grams=200),
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Meal.objects.get().total_calories, Decimal('200.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MealItem.objects.get().delete()
+        self.assertEqual(Meal.objects.get().total_calories, Decimal('0.00'))
+
+    def test_replacing_items_does_not_load_them(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(self.items(self.foods))
+        meal = Meal.objects.get()
+        recalculate, refresh = self.commit_jobs()
+        with recalculate as recalculated, refresh as refreshed, self.captureOnCommitCallbacks(execute=True):
+            # One DELETE and one INSERT, however many items there were.
+            with self.assertNumQueries(2):
+                set_meal_items(meal, [{'food_item': self.foods[0], 'quantity_g': Decimal('200')}])
+        self.assertEqual((recalculated.call_count, refreshed.call_count), (1, 1))
+
+        self.assertEqual(MealItem.objects.count(), 1)
+        self.assertEqual(Meal.objects.get().total_calories, Decimal('200.00'))
+        self.assertEqual(DailyRollup.objects.get(user=self.user).calories_consumed, Decimal('200.00'))
+
+    def test_daily_totals_are_read_from_the_rollup(self):
+        Profile.objects.create(user=self.user, daily_calorie_intake=Decimal('2000'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(self.items(self.foods[:2]), meal_type='breakfast')
+            self.post(self.items(self.foods[2:4], grams=100), meal_type='dinner')
+
+        # The rollup row; the profile is already loaded on the authenticated user.
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/meals/daily-calories/', {'date': '2025-03-10'})
+        data = response.json()
+        self.assertEqual(Decimal(data['total_calories']), Decimal('305.50'))
+        self.assertEqual(Decimal(data['total_fats']), Decimal('5.50'))
+        self.assertEqual(Decimal(data['remaining_calories']), Decimal('1694.50'))
+
+        data = self.client.get('/api/meals/daily-calories/', {'date': '2025-03-11'}).json()
+        self.assertEqual(Decimal(data['total_calories']), 0)
+
+    def test_daily_totals_without_a_rollup_row(self):
+        Profile.objects.create(user=self.user, daily_calorie_intake=Decimal('2000'))
+        # Meals written outside the app, before any rollup refresh.
+        for meal_type, calories in [('breakfast', '250.25'), ('dinner', '400.50')]:
+            Meal.objects.create(user=self.user, meal_type=meal_type, date='2025-03-10',
+                                total_calories=Decimal(calories), total_fats=Decimal('10'))
+        self.assertFalse(DailyRollup.objects.exists())
+
+        # The rollup row, then the meals.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/meals/daily-calories/', {'date': '2025-03-10'})
+        data = response.json()
+        self.assertEqual(Decimal(data['total_calories']), Decimal('650.75'))
+        self.assertEqual(Decimal(data['total_fats']), Decimal('20.00'))
+        self.assertEqual(Decimal(data['remaining_calories']), Decimal('1349.25'))
+
+    def test_unknown_food_items_are_reported_per_item(self):
+        response = self.post([*self.items(self.foods[:1]), {'food_item_id': 999999, 'quantity_g': 10}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['meal_items'], [{}, {'food_item_id': ['Invalid pk "999999" - object does not exist.']}])
+        self.assertFalse(Meal.objects.exists())
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import MealViewSet,FoodSearchAPIView,DailyCalorieTrackerViewSet
+from .views import MealViewSet,FoodSearchAPIView,FoodBatchSearchAPIView,FoodAutocompleteAPIView,FoodProviderStatsView,DailyCalorieTrackerViewSet
 
 router = DefaultRouter()
 router.register(r'meals', MealViewSet, basename='meal')
@@ -9,5 +9,8 @@ router.register(r'daily-calories', DailyCalorieTrackerViewSet, basename='daily-c
 urlpatterns = [
     path('', include(router.urls)),
     path('food-search/', FoodSearchAPIView.as_view(), name='food-search'),
+    path('food-search/batch/', FoodBatchSearchAPIView.as_view(), name='food-search-batch'),
+    path('food-autocomplete/', FoodAutocompleteAPIView.as_view(), name='food-autocomplete'),
+    path('food-provider-stats/', FoodProviderStatsView.as_view(), name='food-provider-stats'),
 
 ]
\ No newline at end of file
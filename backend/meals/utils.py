@@ -0,0 +1,42 @@
+#
+# File: meals/utils.py
+#
+# Shared logic for the daily calorie tracker, used by the meals views and
+# the dashboard snapshot endpoint.
+#
+
+from decimal import Decimal
+
+
+def daily_calorie_summary(request_date, totals, daily_goal):
+    """
+    Builds the payload of the daily calorie tracker from the day's nutrition
+    totals and the user's calorie goal.
+    """
+    total_calories = totals.get('total_calories') or Decimal('0.0')
+    total_protein = totals.get('total_protein') or Decimal('0.0')
+    total_carbs = totals.get('total_carbs') or Decimal('0.0')
+    total_fats = totals.get('total_fats') or Decimal('0.0')
+
+    remaining_calories = daily_goal - total_calories
+
+    status_message = ""
+    if remaining_calories > 200:
+        status_message = f"You are significantly under your daily goal. Remaining: {remaining_calories:.2f} calories."
+    elif remaining_calories > 0 and remaining_calories <= 200:
+        status_message = f"You are under your daily goal. Remaining: {remaining_calories:.2f} calories."
+    elif remaining_calories < 0 and remaining_calories >= -200:
+        status_message = f"You have slightly exceeded your daily goal. Over by: {-remaining_calories:.2f} calories."
+    else:
+        status_message = f"You are significantly over your daily goal. Over by: {-remaining_calories:.2f} calories."
+
+    return {
+        'date': request_date,
+        'total_calories': total_calories,
+        'total_protein': total_protein,
+        'total_carbs': total_carbs,
+        'total_fats': total_fats,
+        'daily_goal': daily_goal,
+        'remaining_calories': remaining_calories,
+        'status_message': status_message
+    }
@@ -1,18 +1,23 @@
 
 from rest_framework import viewsets, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import Meal, FoodItem
 from .serializers import MealSerializer, FoodItemSerializer
-from .api_services import search_and_save_food
-from django.db.models import Sum, F, DecimalField
+from .api_services import MAX_BATCH_QUERIES, MAX_QUERY_LENGTH, search_and_save_food, search_and_save_foods, split_meal_description
+from .lookups import lookup_stats
+from .providers import provider_stats
+from .search import AUTOCOMPLETE_LIMIT, MAX_AUTOCOMPLETE_LIMIT, autocomplete
+from django.db import transaction
+from django.db.models import Sum, prefetch_related_objects
 from datetime import date
-from decimal import Decimal # Import the Decimal class
 # Import your existing models and the new serializer
-from .models import Meal,MealItem
+from .models import Meal,add_meal_items
 from users.models import Profile
+from analysis.models import DailyRollup
 from .serializers import DailyCalorieSerializer
+from .utils import daily_calorie_summary
 
 class MealViewSet(viewsets.ModelViewSet):
     """
@@ -26,7 +31,7 @@ class MealViewSet(viewsets.ModelViewSet):
         Ensures users can only see their own meals and filters by date.
         """
         user = self.request.user
-        queryset = Meal.objects.filter(user=user)
+        queryset = Meal.objects.filter(user=user).prefetch_related('meal_items__food_item')
         date_filter = self.request.query_params.get('date', None)
         
         if date_filter:
@@ -50,20 +55,25 @@ class MealViewSet(viewsets.ModelViewSet):
         meal_date = validated.get('date')
         incoming_items = validated.get('meal_items', [])
 
-        existing_meal = Meal.objects.filter(user=user, meal_type=meal_type, date=meal_date).first()
+        with transaction.atomic():
+            existing_meal = Meal.objects.filter(user=user, meal_type=meal_type, date=meal_date).first()
 
-        if existing_meal:
-            # Append new items to the existing meal
-            for item_data in incoming_items:
-                # item_data already has 'food_item' and 'quantity_g' from validation
-                MealItem.objects.create(meal=existing_meal, **item_data)
+            if existing_meal:
+                # Append new items to the existing meal; item_data already has
+                # 'food_item' and 'quantity_g' from validation. The meal's
+                # totals are recalculated once, on commit.
+                add_meal_items(existing_meal, incoming_items)
+            else:
+                # No existing meal: create a new one linked to current user
+                new_meal = serializer.save(user=user)
 
+        if existing_meal:
             # Serialize and return the updated meal
+            prefetch_related_objects([existing_meal], 'meal_items__food_item')
             output = self.get_serializer(existing_meal)
             return Response(output.data, status=status.HTTP_200_OK)
 
-        # No existing meal: create a new one linked to current user
-        new_meal = serializer.save(user=user)
+        prefetch_related_objects([new_meal], 'meal_items__food_item')
         output = self.get_serializer(new_meal)
         headers = self.get_success_headers(output.data)
         return Response(output.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -82,6 +92,11 @@ class FoodSearchAPIView(APIView):
                 {"error": "Please provide a 'query' for the food item."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if len(query) > MAX_QUERY_LENGTH:
+            return Response(
+                {"error": f"Please keep the food name to at most {MAX_QUERY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         if not query.replace(' ', '').isalpha():
             return Response(
@@ -104,6 +119,84 @@ class FoodSearchAPIView(APIView):
             {"error": f"Could not find nutritional data for '{query}'."},
             status=status.HTTP_404_NOT_FOUND
         )
+class FoodBatchSearchAPIView(APIView):
+    """
+    Looks up every food of a meal in one request. The body holds either a
+    list of 'queries' or a natural-language 'description' such as
+    "2 eggs, toast and a glass of milk". Results come back in input order.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        queries = request.data.get('queries')
+        description = request.data.get('description')
+        if queries is None and isinstance(description, str):
+            queries = split_meal_description(description)
+
+        if not isinstance(queries, list) or not queries:
+            return Response(
+                {"error": "Please provide a list of 'queries' or a meal 'description'."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(queries) > MAX_BATCH_QUERIES:
+            return Response(
+                {"error": f"Please search for at most {MAX_BATCH_QUERIES} foods at once."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not all(isinstance(query, str) and query.strip() for query in queries):
+            return Response(
+                {"error": "Every query must be a non-empty string."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if any(len(query) > MAX_QUERY_LENGTH for query in queries):
+            return Response(
+                {"error": f"Please keep every food name to at most {MAX_QUERY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = [
+            {
+                'query': query,
+                'food_item': FoodItemSerializer(food_item).data if food_item else None,
+                'source': source,
+                'quantity_g': round(quantity_g, 1) if quantity_g is not None else None,
+            }
+            for query, (food_item, source, quantity_g) in zip(queries, search_and_save_foods(queries))
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+class FoodAutocompleteAPIView(APIView):
+    """
+    Ranked food items for a partial or misspelt name, from the local search
+    index only: GET ?q=chick&limit=10.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Please provide a 'q' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT)), MAX_AUTOCOMPLETE_LIMIT)
+        except ValueError:
+            return Response({"error": "'limit' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [
+            {**FoodItemSerializer(item).data, 'score': round(score, 3)}
+            for item, score in autocomplete(query, max(limit, 1))
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+class FoodProviderStatsView(APIView):
+    """
+    Latency and outcome counters of the external food providers in this
+    process, and the hit rate of the lookup cache, for staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'providers': provider_stats.snapshot(), 'lookup_cache': lookup_stats()})
+
 class DailyCalorieTrackerViewSet(viewsets.ViewSet):
     """
     A view to get a user's daily calorie intake and compare it to their goal.
@@ -138,58 +231,27 @@ class DailyCalorieTrackerViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Calculate the total calories and other nutrients for the given date
-        daily_totals = MealItem.objects.filter(
-            meal__user=user, 
-            meal__date=request_date
-        ).aggregate(
-            total_calories=Sum(
-                F('food_item__calories') * F('quantity_g') / Decimal('100.0'),
-                output_field=DecimalField()
-            ),
-            total_protein=Sum(
-                F('food_item__protein') * F('quantity_g') / Decimal('100.0'),
-                output_field=DecimalField()
-            ),
-            total_carbs=Sum(
-                F('food_item__carbs') * F('quantity_g') / Decimal('100.0'),
-                output_field=DecimalField()
-            ),
-            total_fats=Sum(
-                F('food_item__fats') * F('quantity_g') / Decimal('100.0'),
-                output_field=DecimalField()
+        # The day's nutrition totals are kept on the user's DailyRollup row
+        # (see analysis/signals.py), so this is a single unique-key read.
+        rollup = DailyRollup.objects.filter(user=user, date=request_date).values(
+            'calories_consumed', 'protein_g', 'carbs_g', 'fats_g'
+        ).first()
+        if rollup is None:
+            # No row yet, e.g. for meals written outside the app; each meal
+            # carries its own totals.
+            rollup = Meal.objects.filter(user=user, date=request_date).aggregate(
+                calories_consumed=Sum('total_calories'), protein_g=Sum('total_protein'),
+                carbs_g=Sum('total_carbs'), fats_g=Sum('total_fats'),
             )
-        )
-        
-        total_calories = daily_totals.get('total_calories') or Decimal('0.0')
-        total_protein = daily_totals.get('total_protein') or Decimal('0.0')
-        total_carbs = daily_totals.get('total_carbs') or Decimal('0.0')
-        total_fats = daily_totals.get('total_fats') or Decimal('0.0')
-
-        remaining_calories = daily_goal - total_calories
-        
-        status_message = ""
-        if remaining_calories > 200:
-            status_message = f"You are significantly under your daily goal. Remaining: {remaining_calories:.2f} calories."
-        elif remaining_calories > 0 and remaining_calories <= 200:
-            status_message = f"You are under your daily goal. Remaining: {remaining_calories:.2f} calories."
-        elif remaining_calories < 0 and remaining_calories >= -200:
-            status_message = f"You have slightly exceeded your daily goal. Over by: {-remaining_calories:.2f} calories."
-        else:
-            status_message = f"You are significantly over your daily goal. Over by: {-remaining_calories:.2f} calories."
-
-        # Prepare the data for the response
-        response_data = {
-            'date': request_date,
-            'total_calories': total_calories,
-            'total_protein': total_protein,
-            'total_carbs': total_carbs,
-            'total_fats': total_fats,
-            'daily_goal': daily_goal,
-            'remaining_calories': remaining_calories,
-            'status_message': status_message
+        daily_totals = {
+            'total_calories': rollup.get('calories_consumed'),
+            'total_protein': rollup.get('protein_g'),
+            'total_carbs': rollup.get('carbs_g'),
+            'total_fats': rollup.get('fats_g'),
         }
         
-       
+        # Prepare the data for the response
+        response_data = daily_calorie_summary(request_date, daily_totals, daily_goal)
+
         serializer = DailyCalorieSerializer(response_data)
         return Response(serializer.data, status=status.HTTP_200_OK)
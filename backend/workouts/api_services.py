@@ -1,10 +1,14 @@
-
 from django.conf import settings
 import requests
 
+from api import outbound
+from api.singleflight import single_flight
+
 def get_workout_calories(description, weight, height, age, gender):
     """
     Calls the Nutritionix API to get calories burned from a workout description.
+    Concurrent calls with the same description and body measurements share
+    one API request.
     
     Args:
         description (str): A natural language description of the workout.
@@ -19,9 +23,16 @@ def get_workout_calories(description, weight, height, age, gender):
     Raises:
         Exception: If the API request fails or returns an error.
     """
+    key = f"workout-calories:{' '.join(description.lower().split())}:{weight}:{height}:{age}:{gender}"
+    calories, _ = single_flight.do(
+        key, lambda: _fetch_workout_calories(description, weight, height, age, gender)
+    )
+    return calories
+
+def _fetch_workout_calories(description, weight, height, age, gender):
     NUTRITIONIX_API_KEY = settings.NUTRITIONIX_API_KEY
     NUTRITIONIX_APP_ID = settings.NUTRITIONIX_APP_ID
-    NUTRITIONIX_ENDPOINT = "https://trackapi.nutritionix.com/v2/natural/exercise"
+    NUTRITIONIX_ENDPOINT = settings.NUTRITIONIX_EXERCISE_URL
     
     headers = {
         "x-app-id": NUTRITIONIX_APP_ID,
@@ -38,7 +49,8 @@ def get_workout_calories(description, weight, height, age, gender):
     }
 
     try:
-        response = requests.post(NUTRITIONIX_ENDPOINT, json=data, headers=headers)
+        # Pooled, with default timeouts, retries and the circuit breaker (api/outbound.py).
+        response = outbound.post(NUTRITIONIX_ENDPOINT, json=data, headers=headers)
         response.raise_for_status()  
         
         result = response.json()
@@ -49,6 +61,8 @@ def get_workout_calories(description, weight, height, age, gender):
         else:
             raise Exception("No exercise data could be found for the provided description.")
     
+    except outbound.CircuitOpen:
+        raise Exception("The Nutritionix API is unavailable right now. Please try again in a minute.")
     except requests.exceptions.RequestException as e:
         raise Exception(f"Error calling Nutritionix API: {e}")
     except Exception as e:
@@ -97,4 +97,46 @@ apiClient.interceptors.response.use(
   }
 );
 
+// Posts a chat message to the streaming endpoint and calls onToken with each
+// chunk of the reply as it arrives. Resolves with the saved conversation.
+// fetch is used because axios cannot read a response body incrementally.
+export const streamChat = async (message, onToken) => {
+  const { access } = getTokens();
+  const response = await fetch(`${API_BASE_URL}/chatbot/chat/stream/`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(access ? { Authorization: `Bearer ${access}` } : {}),
+    },
+    body: JSON.stringify({ message }),
+  });
+  if (!response.ok) {
+    throw new Error(`Chat stream failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line; keep any partial event buffered.
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+    for (const raw of events) {
+      const lines = raw.split('\n');
+      const event = lines.find(line => line.startsWith('event: '))?.slice(7);
+      const data = lines.find(line => line.startsWith('data: '))?.slice(6);
+      if (!event || !data) continue;
+      const payload = JSON.parse(data);
+      if (event === 'token') onToken(payload.content);
+      if (event === 'done') return payload;
+      if (event === 'error') throw new Error(payload.error);
+    }
+  }
+  throw new Error('Chat stream ended unexpectedly');
+};
+
 export default apiClient;
\ No newline at end of file
@@ -35,7 +35,7 @@ const ChartCard = ({ title, icon, children }) => (
 export default function Analysis() {
     const [report, setReport] = useState(null);
     const [loading, setLoading] = useState(true);
-    const [period, setPeriod] = useState('monthly'); // 'monthly' or 'weekly'
+    const [period, setPeriod] = useState('monthly'); // 'weekly', 'monthly', 'quarterly' or 'yearly'
 
     const fetchReport = async () => {
         setLoading(true);
@@ -105,6 +105,8 @@ export default function Analysis() {
                         <div className="flex items-center bg-gray-200 rounded-lg p-1">
                             <button onClick={() => setPeriod('weekly')} className={`px-4 py-1 text-sm font-semibold rounded-md ${period === 'weekly' ? 'bg-white shadow' : 'text-gray-600'}`}>Weekly</button>
                             <button onClick={() => setPeriod('monthly')} className={`px-4 py-1 text-sm font-semibold rounded-md ${period === 'monthly' ? 'bg-white shadow' : 'text-gray-600'}`}>Monthly</button>
+                            <button onClick={() => setPeriod('quarterly')} className={`px-4 py-1 text-sm font-semibold rounded-md ${period === 'quarterly' ? 'bg-white shadow' : 'text-gray-600'}`}>Quarterly</button>
+                            <button onClick={() => setPeriod('yearly')} className={`px-4 py-1 text-sm font-semibold rounded-md ${period === 'yearly' ? 'bg-white shadow' : 'text-gray-600'}`}>Yearly</button>
                         </div>
                         <button onClick={handleDownloadCsv} className="flex items-center gap-2 bg-green-500 text-white font-semibold py-2 px-4 rounded-lg hover:bg-green-600 transition-colors">
                             <Download size={16} />
@@ -152,6 +154,7 @@ export default function Analysis() {
                                         <Tooltip />
                                         <Legend />
                                         <Line type="monotone" dataKey="weight_kg" name="Weight (kg)" stroke="#10B981" strokeWidth={2} />
+                                        <Line type="monotone" dataKey="weight_kg_ma7" name="7-day average" stroke="#6366F1" strokeWidth={2} dot={false} />
                                     </LineChart>
                                 </ResponsiveContainer>
                             </ChartCard>
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import apiClient from '../api/client';
+import apiClient, { streamChat } from '../api/client';
 import { Toaster, toast } from 'sonner';
 import { Send, Bot, User, Loader2, Trash2 } from 'lucide-react';
 import ChatMessage from '../components/chatbot/ChatMessage'; 
@@ -9,14 +9,19 @@ export default function Chatbot() {
     const [history, setHistory] = useState([]);
     const [isLoading, setIsLoading] = useState(false);
     const [isFetchingHistory, setIsFetchingHistory] = useState(true);
+    // Cursor of the next, older page of history; null once it is all loaded.
+    const [nextCursor, setNextCursor] = useState(null);
+    const [isLoadingOlder, setIsLoadingOlder] = useState(false);
     const chatEndRef = useRef(null);
+    const scrollRef = useRef(null);
 
-    // Function to fetch past conversations
+    // Function to fetch the newest page of past conversations
     const fetchHistory = async () => {
         setIsFetchingHistory(true);
         try {
             const response = await apiClient.get('/chatbot/chat/');
-            setHistory(response.data);
+            setHistory(response.data.results);
+            setNextCursor(response.data.next);
         } catch (error) {
             toast.error('Failed to load conversation history.');
         } finally {
@@ -24,14 +29,40 @@ export default function Chatbot() {
         }
     };
 
+    // Prepends the next page of older messages, keeping the scroll position.
+    const fetchOlder = async () => {
+        if (!nextCursor || isLoadingOlder) return;
+        setIsLoadingOlder(true);
+        const container = scrollRef.current;
+        const previousHeight = container.scrollHeight;
+        try {
+            const response = await apiClient.get('/chatbot/chat/', { params: { before: nextCursor } });
+            setHistory(prev => [...response.data.results, ...prev]);
+            setNextCursor(response.data.next);
+            requestAnimationFrame(() => {
+                container.scrollTop = container.scrollHeight - previousHeight;
+            });
+        } catch (error) {
+            toast.error('Failed to load older messages.');
+        } finally {
+            setIsLoadingOlder(false);
+        }
+    };
+
+    const handleScroll = (e) => {
+        if (e.currentTarget.scrollTop === 0) fetchOlder();
+    };
+
     useEffect(() => {
         fetchHistory();
     }, []);
 
-    // Scroll to the bottom of the chat when new messages are added
+    // Scroll to the bottom of the chat when new messages are added (but not
+    // when older ones are prepended)
+    const newestMessage = history[history.length - 1];
     useEffect(() => {
         chatEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-    }, [history, isLoading]);
+    }, [newestMessage, isLoading]);
 
     const handleSubmit = async (message) => {
         if (!message.trim() || isLoading) return;
@@ -39,13 +70,17 @@ export default function Chatbot() {
         setIsLoading(true);
         
         // Temporarily add the user's message to the UI for a responsive feel
-        const tempUserMessage = { id: 'temp-user', user_message: message };
+        const tempUserMessage = { id: 'temp-user', user_message: message, ai_response: '' };
         setHistory(prev => [...prev, tempUserMessage]);
 
         try {
-            const response = await apiClient.post('/chatbot/chat/', { message });
-            
-            fetchHistory();
+            // The reply is rendered token by token, then swapped for the saved row.
+            const conversation = await streamChat(message, (token) => {
+                setHistory(prev => prev.map(m => (
+                    m.id === 'temp-user' ? { ...m, ai_response: m.ai_response + token } : m
+                )));
+            });
+            setHistory(prev => prev.map(m => (m.id === 'temp-user' ? conversation : m)));
         } catch (error) {
             toast.error('An error occurred. Please try again.');
             setHistory(prev => prev.filter(m => m.id !== 'temp-user'));
@@ -95,7 +130,10 @@ export default function Chatbot() {
                     </button>
                 </div>
 
-                <div className="flex-1 p-4 space-y-6 overflow-y-auto">
+                <div ref={scrollRef} onScroll={handleScroll} className="flex-1 p-4 space-y-6 overflow-y-auto">
+                    {isLoadingOlder && (
+                        <p className="text-center text-sm text-gray-400">Loading older messages...</p>
+                    )}
                     {isFetchingHistory ? (
                         <p className="text-center text-gray-500">Loading history...</p>
                     ) : (
@@ -104,7 +142,8 @@ export default function Chatbot() {
                         ))
                     )}
                     
-                    {isLoading && (
+                    {/* The spinner only shows until the first token of the reply arrives */}
+                    {isLoading && !history.some(m => m.id === 'temp-user' && m.ai_response) && (
                         <div className="flex items-start gap-3">
                             <Bot className="w-8 h-8 p-1.5 bg-green-100 text-green-600 rounded-full flex-shrink-0" />
                             <div className="bg-gray-100 p-3 rounded-lg">
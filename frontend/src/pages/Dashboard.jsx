@@ -25,37 +25,24 @@ export default function Dashboard() {
     const fetchData = async () => {
         setLoading(true);
         try {
-            const profileRes = await apiClient.get('/auth/profile/');
-            const profileData = profileRes.data;
+            const today = new Date().toISOString().split('T')[0];
+            // A single snapshot request replaces the separate profile, meals, workouts,
+            // goals, steps, water, sleep, weight and weekly-trends calls.
+            const { data: snapshot } = await apiClient.get(`/dashboard/?date=${today}`);
+            const profileData = snapshot.profile || {};
             if (profileData.height && profileData.weight && profileData.age && profileData.daily_calorie_intake) {
                 setProfileComplete(true);
-                const today = new Date().toISOString().split('T')[0];
-
-                const [meals, workouts, goals, steps, water, sleep, weight,trends] = await Promise.all([
-                    apiClient.get('/meals/daily-calories/'),
-                    apiClient.get('/workouts/summary/'),
-                    apiClient.get('/daily-data/goals/'),
-                    apiClient.get(`/daily-data/steps/?date=${today}`).catch(() => ({ data: [] })),
-                    apiClient.get(`/daily-data/water/?date=${today}`).catch(() => ({ data: [] })),
-                    apiClient.get(`/daily-data/sleep/?date=${today}`).catch(() => ({ data: [] })),
-                    apiClient.get('/daily-data/weight/').catch(() => ({ data: [] })),
-                    apiClient.get('/analysis/weekly-trends/') // Fetch trend data
-
-                ]);
-                console.log("Weekly trends data from API:", trends.data);
 
                 setStats({
-                    meals: meals.data,
-                    workouts: workouts.data,
-                    goals: goals.data,
-                    steps: steps.data[0] || { step_count: 0 },
-                    water: water.data[0] || { milliliters: 0 },
-                    sleep: sleep.data[0] || { duration_hours: 0 },
-                    weight: weight.data.sort((a, b) => new Date(b.date) - new Date(a.date))[0] || { weight_kg: profileData.weight },
+                    meals: snapshot.meals,
+                    workouts: snapshot.workouts,
+                    goals: snapshot.goals,
+                    steps: snapshot.steps,
+                    water: snapshot.water,
+                    sleep: snapshot.sleep,
+                    weight: snapshot.weight || { weight_kg: profileData.weight },
                 });
-                // --- THIS IS THE FIX ---
-            // Add this line to save the trend data to your state
-            setTrendData(trends.data);
+                setTrendData(snapshot.weekly_trends);
             } else {
                 setProfileComplete(false);
             }
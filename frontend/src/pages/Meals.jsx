@@ -10,6 +10,18 @@ const searchFoodAPI = async (query) => {
   return response.data; // The backend returns an object like { food_item: {...} }
 };
 
+const batchSearchFoodAPI = async (description) => {
+  // Resolves every food of a meal description in one request, in order.
+  const response = await apiClient.post('/meals/food-search/batch/', { description });
+  return response.data.results;
+};
+
+const autocompleteFoodAPI = async (query) => {
+  // Ranked matches from the local food index only; never calls the external APIs.
+  const response = await apiClient.get('/meals/food-autocomplete/', { params: { q: query, limit: 8 } });
+  return response.data.results;
+};
+
 // --- Main Meals Page Component ---
 export default function Meals() {
   const [meals, setMeals] = useState([]);
@@ -28,6 +40,9 @@ export default function Meals() {
   const [searchTerm, setSearchTerm] = useState('');
   const [searchResult, setSearchResult] = useState(null);
   const [isSearching, setIsSearching] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  const [mealDescription, setMealDescription] = useState('');
+  const [isDescribing, setIsDescribing] = useState(false);
 
   // Fetch meals when the selected date changes
   useEffect(() => {
@@ -48,6 +63,27 @@ export default function Meals() {
     }
   };
 
+  // Suggest local foods while the user types, once they pause for a moment.
+  useEffect(() => {
+    if (searchTerm.trim().length < 2) {
+      setSuggestions([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const results = await autocompleteFoodAPI(searchTerm.trim());
+        if (!cancelled) setSuggestions(results);
+      } catch (e) {
+        if (!cancelled) setSuggestions([]);
+      }
+    }, 200);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm]);
+
   // --- Event Handlers ---
 
   const openModal = (type) => {
@@ -75,6 +111,7 @@ export default function Meals() {
     }
     setIsSearching(true);
     setSearchResult(null);
+    setSuggestions([]);
     try {
       const res = await searchFoodAPI(searchTerm);
       if (res && res.food_item) {
@@ -100,6 +137,26 @@ export default function Meals() {
     setSearchTerm('');
   };
   
+  const handleDescribeMeal = async () => {
+    if (!mealDescription.trim()) return;
+    setIsDescribing(true);
+    try {
+      const results = await batchSearchFoodAPI(mealDescription);
+      const found = results.filter(r => r.food_item && !currentMealItems.find(item => item.food_item.id === r.food_item.id));
+      setCurrentMealItems([
+        ...currentMealItems,
+        ...found.map(r => ({ food_item: r.food_item, quantity_g: Math.round(r.quantity_g || 100) })),
+      ]);
+      const missing = results.filter(r => !r.food_item).map(r => r.query);
+      if (missing.length) toast.error(`No results found for: ${missing.join(', ')}`);
+      setMealDescription('');
+    } catch (err) {
+      toast.error('Search failed. Please try again.');
+    } finally {
+      setIsDescribing(false);
+    }
+  };
+
   const updateQuantity = (foodId, newQuantity) => {
     setCurrentMealItems(currentMealItems.map(item => 
       item.food_item.id === foodId ? { ...item, quantity_g: parseInt(newQuantity) || 0 } : item
@@ -243,6 +300,32 @@ export default function Meals() {
                     {isSearching ? '...' : <Search size={20}/>}
                   </button>
                 </div>
+                {suggestions.length > 0 && !searchResult && (
+                  <ul className="mt-1 border border-gray-200 rounded-lg divide-y max-h-48 overflow-y-auto">
+                    {suggestions.map(food => (
+                      <li key={food.id}>
+                        <button
+                          onClick={() => { setSearchResult(food); setSuggestions([]); }}
+                          className="w-full text-left px-3 py-2 text-sm hover:bg-green-50 flex justify-between"
+                        >
+                          <span>{food.name}</span>
+                          <span className="text-gray-500">{food.calories} kcal</span>
+                        </button>
+                      </li>
+                    ))}
+                  </ul>
+                )}
+              </div>
+
+              {/* Whole meal in one go */}
+              <div>
+                <label className="font-semibold text-sm">Or describe your meal</label>
+                <div className="flex gap-2 mt-1">
+                  <input type="text" value={mealDescription} onChange={e => setMealDescription(e.target.value)} placeholder="e.g., 2 eggs, toast and 150g yogurt" className="w-full border border-gray-300 rounded-lg px-3 py-2 focus:outline-none focus:ring-2 focus:ring-green-500"/>
+                  <button onClick={handleDescribeMeal} disabled={isDescribing} className="bg-green-500 text-white font-semibold px-4 rounded-lg hover:bg-green-600 disabled:bg-gray-400 whitespace-nowrap">
+                    {isDescribing ? '...' : 'Add all'}
+                  </button>
+                </div>
               </div>
 
               {/* Search Result */}